@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+# Simulates many players against the game server, with the fake LLM backend standing in for the
+# model. The server runs in the same process on a free port.
+#
+#   python -m benchmarks.load_test --players 1000 --latency 0.2
+
+class PlayerStats:
+    def __init__(self):
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+        self.turns = 0
+        # Seconds from sending a command to the next `ask` or `bye`
+        self.response_times: List[float] = []
+
+async def play(port: int, stats: PlayerStats, think_time: float, max_commands: int):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    sent = None
+    commands = 0
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                stats.sessions_failed += 1
+                return
+            tag = line.decode().split(" ", 1)[0].strip()
+            if tag in ("ask", "bye") and sent is not None:
+                stats.response_times.append(time.perf_counter() - sent)
+                sent = None
+            if tag == "bye":
+                reason = line.decode().strip().split(" ", 1)[1]
+                if reason in ("win", "loss"):
+                    stats.sessions_completed += 1
+                else:
+                    stats.sessions_failed += 1
+                return
+            if tag == "ask":
+                commands += 1
+                if commands > max_commands:
+                    writer.write(b"quit\n")
+                    await writer.drain()
+                    continue
+                if think_time:
+                    await asyncio.sleep(think_time)
+                stats.turns += 1
+                sent = time.perf_counter()
+                writer.write(b"attack\n")
+                await writer.drain()
+    finally:
+        writer.close()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def run(args) -> PlayerStats:
+    from src.server import SessionManager
+
+    manager = SessionManager(
+        max_sessions=args.players,
+        max_concurrent_turns=args.max_concurrent_turns,
+        commands_per_second=None,
+    )
+    server = await manager.serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    stats = PlayerStats()
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(play(port, stats, args.think_time, args.max_commands) for _ in range(args.players)))
+    elapsed = time.perf_counter() - started
+
+    print(f"players                {args.players}")
+    print(f"sessions completed     {stats.sessions_completed}")
+    print(f"sessions failed        {stats.sessions_failed}")
+    print(f"player turns           {stats.turns}")
+    print(f"elapsed s              {elapsed:.2f}")
+    print(f"player turns per sec   {stats.turns / elapsed:.1f}")
+    print(f"response p50 s         {percentile(stats.response_times, 0.5):.4f}")
+    print(f"response p95 s         {percentile(stats.response_times, 0.95):.4f}")
+    if stats.response_times:
+        print(f"response mean s        {statistics.fmean(stats.response_times):.4f}")
+    return stats
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the game server with simulated players")
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per LLM call")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds each player waits before answering")
+    parser.add_argument("--max-concurrent-turns", type=int, default=256)
+    parser.add_argument("--max-commands", type=int, default=200, help="Players quit after this many commands")
+    args = parser.parse_args(argv)
+
+    # Must be set before `src.async_game` builds its client
+    os.environ["ADVENTURE_LLM_BACKEND"] = "fake"
+    os.environ["ADVENTURE_FAKE_LATENCY"] = str(args.latency)
+
+    stats = asyncio.run(run(args))
+    return 1 if stats.sessions_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from src.entities import Action, ActionKind, ActionPhase, ActionType, GameEntity, ProposedAction, Scenario
+from src.encoding import ENCODINGS, encode_scenario
+from src.history import BYTES_PER_TOKEN
+from src.instrumentation import common_prefix_bytes
+from src.journal import Journal, list_games, load_game
+from src.llm import FakeBackend
+from src.prompt_layout import PromptLayout
+from src.settings import PREFIX_CACHED_PROMPTS, PROMPT_CACHE_MIN_TOKENS, PROMPT_REBASE_BYTES
+from src.turns import make_history
+
+# Offline benchmarks for the turn pipeline. Every LLM call goes to the fake backend, so the numbers
+# only cover the game's own overhead and the size of what would be sent to the model.
+#
+#   python -m benchmarks.run --output results.json
+#   python -m benchmarks.run --baseline results.json --threshold 0.2
+#
+# Metrics ending in `_per_sec` are better when higher, all others (seconds, bytes) when lower.
+
+Results = Dict[str, Dict[str, float]]
+
+def make_scenario(entities: int = 2, history: int = 0, seed: int = 0) -> Scenario:
+    players = max(1, entities // 2)
+    scenario = Scenario(
+        location_and_story_description="A damp cave lit by a single torch.",
+        player_characters=[GameEntity(entity_id=index, name=f"Hero {index}") for index in range(players)],
+        monsters=[GameEntity(entity_id=1000 + index, name=f"Orc {index}") for index in range(entities - players)],
+    )
+    scenario.initialize()
+    scenario.seed_dice(seed)
+    for index in range(history):
+        scenario.action_history.append(f"Hero 0 attacks Orc 0 for {index % 20} damage. New health: 100. Description: A wild swing.")
+    scenario.mark_dirty()
+    return scenario
+
+@contextlib.contextmanager
+def environment(name: str, value: str):
+    # Sets an environment variable for one benchmark and puts the previous value back
+    previous = os.environ.get(name)
+    os.environ[name] = value
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ[name]
+        else:
+            os.environ[name] = previous
+
+def best_of(repeat: int, function: Callable[[], None]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def bench_apply_action(results: Results, quick: bool):
+    count = 2_000 if quick else 20_000
+    rng = random.Random(0)
+    for entities in (2, 100):
+        scenario = make_scenario(entities)
+        actions = [
+            Action(
+                type=rng.choice([ActionType.ATTACK, ActionType.HEAL, ActionType.DEFEND]),
+                source_entity_id=rng.choice(scenario.turn_order),
+                target_entity_id=rng.choice(scenario.turn_order),
+                action_kind=rng.choice(list(ActionKind)),
+            )
+            for _ in range(count)
+        ]
+
+        def apply_all(scenario=scenario, actions=actions):
+            for action in actions:
+                scenario.apply_action(action)
+
+        results[f"apply_action[{entities} entities]"] = {"actions_per_sec": count / best_of(1, apply_all)}
+
+def bench_find_entity(results: Results, quick: bool):
+    lookups = 2_000 if quick else 20_000
+    for entities in (2, 10, 100, 1000):
+        scenario = make_scenario(entities)
+        last_id = scenario.turn_order[-1]
+
+        def find_all(scenario=scenario, last_id=last_id):
+            for _ in range(lookups):
+                scenario._find_entity_by_id(last_id)
+
+        results[f"find_entity_by_id[{entities} entities]"] = {"seconds_per_lookup": best_of(3, find_all) / lookups}
+
+def bench_to_xml(results: Results, quick: bool):
+    for history in (0, 10, 100, 1000):
+        scenario = make_scenario(2, history)
+
+        def full_render(scenario=scenario):
+            scenario.mark_dirty()
+            scenario.to_xml()
+
+        def cached_renders(scenario=scenario):
+            for _ in range(1_000):
+                scenario.to_xml()
+
+        def after_action(scenario=scenario):
+            scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=0, target_entity_id=1000))
+            scenario.to_xml()
+
+        results[f"to_xml[{history} history]"] = {
+            "seconds_full": best_of(5, full_render),
+            "seconds_cached": best_of(5, cached_renders) / 1_000,
+            "seconds_after_action": best_of(5, after_action),
+            "bytes": len(scenario.to_xml().encode()),
+        }
+
+def token_counter() -> Callable[[str], int]:
+    # Real token counts when tiktoken is installed, otherwise the usual bytes per token estimate
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: len(text.encode()) // BYTES_PER_TOKEN
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+    return lambda text: len(encoding.encode(text))
+
+def bench_encoding(results: Results, quick: bool):
+    count_tokens = token_counter()
+    for entities, history in ((2, 0), (10, 100), (10, 1000)):
+        scenario = make_scenario(entities, history)
+        rng = random.Random(0)
+        for _ in range(entities * 3):
+            source, target = rng.sample(scenario.turn_order, 2)
+            scenario.apply_action(Action(type=rng.choice([ActionType.ATTACK, ActionType.DEFEND]), source_entity_id=source, target_entity_id=target))
+
+        metrics = {}
+        for name in ENCODINGS:
+            def render(scenario=scenario, name=name):
+                # Uncached, the XML renders from scratch and the others from the entities
+                scenario.mark_dirty()
+                encode_scenario(scenario, name)
+
+            def after_action(scenario=scenario, name=name):
+                # What a turn pays: one action, then the prompt for the next call
+                source, target = scenario.turn_order[:2]
+                scenario.apply_action(Action(type=ActionType.DEFEND, source_entity_id=source, target_entity_id=target))
+                encode_scenario(scenario, name)
+
+            metrics[f"{name}_seconds"] = best_of(5, render)
+            metrics[f"{name}_seconds_after_action"] = best_of(5, after_action)
+            metrics[f"{name}_tokens"] = count_tokens(encode_scenario(scenario, name))
+        results[f"encoding[{entities} entities, {history} history]"] = metrics
+
+def bench_journal(results: Results, quick: bool):
+    actions = 200 if quick else 2_000
+    games = 20 if quick else 200
+    with tempfile.TemporaryDirectory() as directory:
+        for snapshot_every in (10**9, 10):
+            scenario = make_scenario(10)
+            journal = Journal.create(directory, scenario, snapshot_every=snapshot_every)
+            journal.attach(scenario)
+            rng = random.Random(0)
+            started = time.perf_counter()
+            for index in range(actions):
+                source, target = rng.sample(scenario.turn_order, 2)
+                scenario.apply_action(Action(type=rng.choice([ActionType.ATTACK, ActionType.HEAL]), source_entity_id=source, target_entity_id=target))
+                if index % 5 == 4:
+                    scenario.next_turn()
+            journal.close()
+            elapsed = time.perf_counter() - started
+
+            label = "no snapshots" if snapshot_every == 10**9 else f"snapshot every {snapshot_every} turns"
+            results[f"journal[{actions} actions, {label}]"] = {
+                "records_per_sec": journal.records / elapsed,
+                "fsyncs": journal.fsyncs,
+                "resume_seconds": best_of(3, lambda path=journal.path: load_game(path)),
+                "bytes": journal.path.stat().st_size,
+            }
+
+        for _ in range(games):
+            Journal.create(directory, make_scenario(2)).end("win")
+        results[f"journal[list {games + 2} saved games]"] = {"seconds": best_of(3, lambda: list_games(directory))}
+
+class PromptMeter:
+    # Passes every call to the wrapped client and remembers how many bytes of messages it got
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.bytes = 0
+        # Bytes a prompt cache could have reused, compared with the previous call for the same response
+        # model. Providers only cache prompts of PROMPT_CACHE_MIN_TOKENS and more, shorter prefixes count as sent.
+        self.prefix_bytes = 0
+        self.by_response_model: Dict[str, int] = {}
+        self.previous_messages: Dict[str, list] = {}
+
+    def _measure(self, response_model, messages):
+        size = sum(len(str(message["content"]).encode()) for message in messages)
+        name = getattr(response_model, "__name__", str(response_model))
+        self.calls += 1
+        self.bytes += size
+        shared = common_prefix_bytes(self.previous_messages.get(name), messages)
+        if shared >= PROMPT_CACHE_MIN_TOKENS * BYTES_PER_TOKEN:
+            self.prefix_bytes += shared
+        self.previous_messages[name] = messages
+        self.by_response_model[name] = self.by_response_model.get(name, 0) + 1
+        return size
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        self._measure(response_model, messages)
+        return self.inner.create(response_model, messages, model, **kwargs)
+
+    def create_partial(self, response_model, messages, model=None, **kwargs):
+        self._measure(response_model, messages)
+        return self.inner.create_partial(response_model, messages, model, **kwargs)
+
+def bench_prompt_bytes(results: Results, quick: bool):
+    import main
+
+    # Free-form input, plain commands are resolved without the model
+    action = ProposedAction(player_input="swing wildly at Orc 0", source_entity_id=0)
+    action_phase = ActionPhase(actions=[Action(type=ActionType.ATTACK, source_entity_id=0, target_entity_id=1000)])
+    for history in (0, 50, 500):
+        scenario = make_scenario(2, history)
+        # The same history window and prompt layout as `main.game_loop`
+        scenario.configure_history(make_history())
+        if PREFIX_CACHED_PROMPTS:
+            scenario.configure_prompt_layout(PromptLayout(PROMPT_REBASE_BYTES, PROMPT_CACHE_MIN_TOKENS))
+        calls = {
+            "game_roll": lambda scenario=scenario: main.game_roll(scenario, action),
+            "resolved_turn": lambda scenario=scenario: main.resolve_turn(scenario, action),
+            "describe_effectiveness_of_action": lambda scenario=scenario: main.describe_effectiveness_of_action(scenario, action_phase),
+            "describe_scenario": lambda scenario=scenario: main.describe_scenario(0, scenario),
+            "answer_question": lambda scenario=scenario: main.answer_question(scenario, "What's my health?"),
+        }
+
+        metrics = {}
+        for name, call in calls.items():
+            main.client = meter = PromptMeter(FakeBackend())
+            call()
+            metrics[f"{name}_bytes"] = meter.bytes
+        results[f"prompt_bytes[{history} history]"] = metrics
+
+    main.client = meter = PromptMeter(FakeBackend())
+    main.generate_scenario()
+    results["prompt_bytes[generate_scenario]"] = {"generate_scenario_bytes": meter.bytes}
+
+def bench_game_loop(results: Results, quick: bool):
+    import main
+
+    games = 5 if quick else 50
+    save_directory = tempfile.TemporaryDirectory()
+    main.SAVE_DIRECTORY = save_directory.name
+    turns = 0
+    prompt_bytes = 0
+    uncached_bytes = 0
+    started = time.perf_counter()
+    for seed in range(games):
+        main.client = meter = PromptMeter(FakeBackend(seed))
+        with environment("ADVENTURE_SEED", str(seed)), contextlib.redirect_stdout(io.StringIO()):
+            scenario = main.game_loop(read_input=lambda prompt: "attack")
+        # Every turn applies exactly one action here
+        turns += len(scenario.action_history)
+        prompt_bytes += meter.bytes
+        uncached_bytes += meter.bytes - meter.prefix_bytes
+    elapsed = time.perf_counter() - started
+    save_directory.cleanup()
+
+    results["game_loop"] = {
+        "turns_per_sec": turns / elapsed,
+        "prompt_bytes_per_turn": prompt_bytes / turns,
+        "uncached_prompt_bytes_per_turn": uncached_bytes / turns,
+    }
+
+def bench_player_turns(results: Results, quick: bool):
+    import main
+
+    # Free-form input, so every player turn goes to the model
+    games = 3 if quick else 20
+    save_directory = tempfile.TemporaryDirectory()
+    main.SAVE_DIRECTORY = save_directory.name
+    single_call_turns = main.SINGLE_CALL_TURNS
+    for single_call in (False, True):
+        main.SINGLE_CALL_TURNS = single_call
+        turns = 0
+        calls = 0
+        prompt_bytes = 0
+        for seed in range(games):
+            main.client = meter = PromptMeter(FakeBackend(seed))
+            with environment("ADVENTURE_SEED", str(seed)), contextlib.redirect_stdout(io.StringIO()):
+                scenario = main.game_loop(read_input=lambda prompt: "swing wildly")
+            turns += len(scenario.action_history)
+            calls += meter.calls
+            prompt_bytes += meter.bytes
+        results[f"player_turns[{'single call' if single_call else 'two calls'}]"] = {
+            "llm_calls_per_turn": calls / turns,
+            "prompt_bytes_per_turn": prompt_bytes / turns,
+        }
+    main.SINGLE_CALL_TURNS = single_call_turns
+    save_directory.cleanup()
+
+def bench_simulator(results: Results, quick: bool):
+    from src.simulator import simulate
+
+    encounters = 20_000 if quick else 200_000
+    for entities in (2, 10):
+        scenario = make_scenario(entities)
+        seconds = best_of(1 if quick else 3, lambda scenario=scenario: simulate(scenario, encounters, seed=0))
+        results[f"simulator[{entities} entities]"] = {"encounters_per_sec": encounters / seconds}
+
+# Imported on the first LLM call or the first print, never by `import main`
+STARTUP_DEFERRED_MODULES = ("openai", "instructor", "httpx", "rich", "dotenv", "xmltodict", "asyncio", "numpy")
+
+def bench_startup(results: Results, quick: bool):
+    # `python -X importtime -c "import main"` in a fresh interpreter, best of a few runs
+    repository = Path(__file__).resolve().parent.parent
+    import_seconds = []
+    for _ in range(1 if quick else 5):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=repository, capture_output=True, text=True, check=True,
+        )
+        # import time: self [us] | cumulative | imported package
+        imported = {}
+        for line in completed.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line.split("|")
+                if cumulative.strip().isdigit():
+                    imported[name.strip()] = int(cumulative) / 1e6
+        import_seconds.append(imported["main"])
+
+    results["startup"] = {
+        "import_main_seconds": min(import_seconds),
+        "deferred_modules_imported": sum(name in imported for name in STARTUP_DEFERRED_MODULES),
+    }
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "apply_action": bench_apply_action,
+    "find_entity": bench_find_entity,
+    "to_xml": bench_to_xml,
+    "encoding": bench_encoding,
+    "prompt_bytes": bench_prompt_bytes,
+    "journal": bench_journal,
+    "simulator": bench_simulator,
+    "game_loop": bench_game_loop,
+    "player_turns": bench_player_turns,
+}
+
+def compare(results: Results, baseline: Results, threshold: float) -> list[str]:
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if old is None:
+                continue
+            if not old:
+                # Counts that should stay at zero, such as `deferred_modules_imported`
+                if value > 0 and not metric.endswith("_per_sec"):
+                    regressions.append(f"{name} {metric}: 0 -> {value:.6g}")
+                continue
+
+            change = (old - value) / old if metric.endswith("_per_sec") else (value - old) / old
+            if change > threshold:
+                regressions.append(f"{name} {metric}: {old:.6g} -> {value:.6g} ({change:+.0%} worse)")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the adventure game")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression, 0.2 = 20%%")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations, for smoke testing")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    os.environ["ADVENTURE_LLM_BACKEND"] = "fake"
+    results: Results = {}
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](results, args.quick)
+
+    for name, metrics in results.items():
+        print(name, " ".join(f"{metric}={value:.6g}" for metric, value in metrics.items()))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,264 +1,307 @@
-from dotenv import load_dotenv
-import instructor
-from openai import OpenAI
-from rich import print
-
-from src.entities import Scenario, ActionPhase, ProposedAction, ScenarioDescription
-
-load_dotenv()
-
-# Patch the OpenAI client
-client = instructor.from_openai(OpenAI())
-MODEL = "gpt-4o"
-
+import argparse
+import os
+import sys
+
+from src.entities import Scenario, ActionPhase, ProposedAction, ResolvedTurn, ScenarioDescription, Narration, MonsterTurns
+from src.instrumentation import InstrumentedClient, traced, tracer
+from src.journal import list_games
+from src.llm import BACKEND_ENV, make_client, uses_cassette
+from src.prompts import (
+    generate_scenario_messages,
+    game_roll_messages,
+    resolved_turn_messages,
+    effectiveness_messages,
+    describe_scenario_messages,
+    answer_question_messages,
+    summarize_history_messages,
+    monster_turns_messages,
+)
+from src.repair import repair_stats, repairing
+from src.resolver import resolve_locally, resolver_stats
+from src.response_cache import MISS, ResponseCache
+from src.routing import route, router
+from src.scenario_pool import ScenarioPool
+from src.turns import GameCalls, TurnEngine, is_over, make_history, new_game, prepare_game, resume_game, run_sync
+from src.settings import (
+    SUMMARIZE_HISTORY_WITH_LLM,
+    STREAM_NARRATION,
+    DICE_SEED_ENV,
+    TRACE_ENV,
+    PRINT_CALL_REPORT,
+    LOCAL_RESOLVER,
+    SINGLE_CALL_TURNS,
+    BATCH_MONSTER_TURNS,
+    SAVE_GAMES,
+    SAVE_DIRECTORY,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_ENV,
+    SCENARIO_POOL,
+    SCENARIO_POOL_SIZE,
+    SCENARIO_POOL_WORKERS,
+    SCENARIO_POOL_PATH,
+    BALANCE_ATTEMPTS,
+    BALANCE_ENCOUNTERS,
+    BALANCE_WIN_RATE,
+)
+from src.streaming import EmptyStream, console, print, render_stream
+
+# Live OpenAI by default, see `src/llm.py` for the offline backends. Built on the first call, so
+# importing this module doesn't import the OpenAI SDK.
+client = InstrumentedClient(factory=make_client)
+
+# Answers that only depend on the scenario state, persisted between games if ADVENTURE_RESPONSE_CACHE is set
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, os.getenv(RESPONSE_CACHE_ENV))
+
+@traced("generate_scenario")
 def generate_scenario() -> Scenario:
-    character_generation_prompt = """
-    Generate 1 human player character and 1 monster character for a game scenario. 
-    Give them traits but not abilities, abilities will be derived from traits.
-    """
-
-    # Extract structured data from natural language
-    game_scenario = client.chat.completions.create(
-        model=MODEL,
-        response_model=Scenario,
-        messages=[
-            {
-                "role": "system",
-                "content": character_generation_prompt,
-            }
-        ],
-    )
+    # Extract structured data from natural language, out of range stats are clamped instead of retried
+    with repairing():
+        game_scenario = client.create(
+            model=route("generate_scenario"),
+            response_model=Scenario,
+            messages=generate_scenario_messages(),
+        )
     return game_scenario
 
-rules = """
-Do not let the player edit the monster's abilities or their own abilities directly.
-The player must perform action which will have an effect on the game scenario.
-"""
-
-action_rules = """
-During the action phase now the player attempts to make an action that will have an effect on the game scenario.
-If the target entity is not specified just assume it's one of the possible foes.
-"""
+def generate_balanced_scenario() -> Scenario:
+    # The first of up to BALANCE_ATTEMPTS scenarios that the simulator finds balanced, or the closest
+    if BALANCE_ATTEMPTS <= 1:
+        return generate_scenario()
+
+    # numpy is only imported once a scenario is checked, see the startup benchmark
+    from src.simulator import imbalance
+
+    best = None
+    for _ in range(BALANCE_ATTEMPTS):
+        scenario = generate_scenario()
+        distance = imbalance(scenario, BALANCE_WIN_RATE, BALANCE_ENCOUNTERS)
+        if best is None or distance < best[0]:
+            best = (distance, scenario)
+        if not distance:
+            break
+    return best[1]
 
+@traced("game_roll")
 def game_roll(scenario: Scenario, player_action: ProposedAction) -> ActionPhase:
-  current_state = f"The current state of the game scenario is: {scenario.to_xml()}"
-  action_explained = f"""
-  My Entity ID is {player_action.source_entity_id}
-  I have chosen to: {player_action.player_input}
-  """
-
-  is_player_character = any(player_action.source_entity_id == character.entity_id for character in scenario.player_characters)
-  game_entity = scenario._find_entity_by_id(player_action.source_entity_id)
-  possible_foes = scenario.monsters if is_player_character else scenario.player_characters
-  possible_friendlies = [character for character in (scenario.player_characters if is_player_character else scenario.monsters) if character.entity_id != player_action.source_entity_id]
-  
-  if is_player_character:
-    action_explained += "I am a player character.\n"
-  else:
-    action_explained += "I am a monster"
-
-  action_explained += f"My Possible foes are: {', '.join(foe.name for foe in possible_foes)}"
-  action_explained += f"My Possible abilities are: {', '.join(ability.value for ability in game_entity.abilities)}"
-  action_explained += f"My Possible friendlies are: {', '.join(friendly.name for friendly in possible_friendlies)}"
-  action_explained += f"I chose to: {player_action.player_input}"
-
-  action_phase_result = client.chat.completions.create(
-      model=MODEL,
-      response_model=ActionPhase,
-      messages=[
-          {
-              "role": "system",
-              "content": rules,
-          },
-          {
-              "role": "system",
-              "content": action_rules,
-          },
-          { 
-              "role": "system",
-              "content": current_state,
-          },
-          {
-              "role": "user",
-              "content": action_explained,
-          }
-      ],
-  )
-
-  return action_phase_result
+    # Plain commands like "attack goblin" don't need the model
+    if LOCAL_RESOLVER and (local_action_phase := resolve_locally(scenario, player_action)):
+        return local_action_phase
+
+    with repairing(scenario, player_action.source_entity_id):
+        action_phase_result = client.create(
+            model=route("game_roll"),
+            response_model=ActionPhase,
+            messages=game_roll_messages(scenario, player_action),
+        )
 
-def describe_effectiveness_of_action(scenario: Scenario, action: ActionPhase) -> str:
-    action_description = f"""
-    Describe the effectiveness of the last action taken by the player character.
-    The 'action' field should contain the action taken by the player character.
-    The 'scenario' field should contain the current state of the game scenario.
-    """
+    return action_phase_result
+
+@traced("resolved_turn")
+def resolve_turn(scenario: Scenario, player_action: ProposedAction) -> ResolvedTurn:
+    # `game_roll` and the narration in one call, the dice results are filled in by `ResolvedTurn.narrate`.
+    # A locally resolved action comes without narration and is described as before.
+    if LOCAL_RESOLVER and (local_action_phase := resolve_locally(scenario, player_action)):
+        return ResolvedTurn(action_phase=local_action_phase)
+
+    with repairing(scenario, player_action.source_entity_id):
+        resolved_turn = client.create(
+            model=route("resolved_turn"),
+            response_model=ResolvedTurn,
+            messages=resolved_turn_messages(scenario, player_action),
+        )
+    return resolved_turn
+
+def play_action(scenario: Scenario, player_action: ProposedAction) -> ResolvedTurn:
+    # With SINGLE_CALL_TURNS the narration comes with the action phase, otherwise only the action phase
+    if SINGLE_CALL_TURNS:
+        return resolve_turn(scenario, player_action)
+    return ResolvedTurn(action_phase=game_roll(scenario, player_action))
+
+@traced("monster_turns")
+def resolve_monster_turns(scenario: Scenario, monster_ids: list[int]) -> MonsterTurns:
+    # Actions for every monster in `monster_ids` and one narration, in a single call
+    with repairing(scenario):
+        monster_turns = client.create(
+            model=route("monster_turns"),
+            response_model=MonsterTurns,
+            messages=monster_turns_messages(scenario, monster_ids),
+        )
+    return monster_turns
 
+@traced("describe_effectiveness_of_action")
+def describe_effectiveness_of_action(scenario: Scenario, action: ActionPhase) -> str:
     # Extract structured data from natural language
-    action_effectiveness = client.chat.completions.create(
-        model=MODEL,
+    action_effectiveness = client.create(
+        model=route("describe_effectiveness_of_action"),
         response_model=str,
-        messages=[
-            {
-                "role": "system",
-                "content": action_description,
-            },
-            {
-                "role": "system",
-                "content": f"The current state of the scenario is:\n{scenario.to_xml()}",
-            },
-            {
-                "role": "system",
-                "content": f"The action taken by the player character is: {action.to_xml()}",
-            }
-        ],
+        messages=effectiveness_messages(scenario, action),
     )
     return action_effectiveness
 
+@traced("describe_scenario")
 def describe_scenario(current_entity_id: int, scenario: Scenario, be_brief=True) -> ScenarioDescription:
-    current_entity = scenario._find_entity_by_id(current_entity_id)
-    current_entity_name = current_entity.name if current_entity else "Unknown Entity"
-
-    is_monster_entity = any(current_entity_id == monster.entity_id for monster in scenario.monsters)
-
-    player_character_description = f"""
-    Describe the current state of the game scenario for {current_entity_name} in a story format.
-    Make sure to include history of the actions taken so far, especially describing the most previous actions.
-    The 'possible_actions' field should contain a list of possible actions that can be taken by 
-    the current entity only based on the current entities 'abilities'.
-    Make sure to describe the current foes and friendlies of the entity.
-    """
-
-    monster_description = f"""
-    Describe the current state of the game scenario in past tense explaining what {current_entity_name} just did.
-    Make sure to include history of the actions taken so far, especially describing the most previous actions.
-    Make sure to describe the current foes and friendlies of the entity.
-    """
-
-    messages=[
-        {
-            "role": "system",
-            "content": f"The current state of the scenario is:\n{scenario.to_xml()}",
-        },
-        {
-            "role": "system",
-            "content": player_character_description if not is_monster_entity else monster_description,
-        }
-    ]
-    if be_brief or is_monster_entity:
-        messages.append(
-            {
-                "role": "system",
-                "content": "Be as brief as possible. You do not need to describe the entire setting again as it has already been explained previously.",
-            }
-        )
+    cache_key = response_cache.key("describe_scenario", scenario, current_entity_id, be_brief)
+    if (cached := response_cache.get(cache_key, ScenarioDescription)) is not MISS:
+        return cached
 
-    if is_monster_entity:
-        last_action = scenario.action_history[-1] if scenario.action_history else "No actions taken yet."
-        messages.append(
-            {
-                "role": "system",
-                "content": f"Focus on describing last action taken by the monster and its effects on the game: `{last_action}`.\n",
-            }
-        )
-    
     # Extract structured data from natural language
-    scenario_description = client.chat.completions.create(
-        model=MODEL,
+    scenario_description = client.create(
+        model=route("describe_scenario"),
+        response_model=ScenarioDescription,
+        messages=describe_scenario_messages(current_entity_id, scenario, be_brief),
+    )
+    response_cache.put(cache_key, scenario_description)
+    return scenario_description
+
+@traced("describe_effectiveness_of_action")
+def stream_effectiveness_of_action(scenario: Scenario, action: ActionPhase, style: str | None = "green") -> str:
+    # Same as `describe_effectiveness_of_action` but prints the narration while it is generated
+    partials = client.create_partial(
+        model=route("describe_effectiveness_of_action"),
+        response_model=Narration,
+        messages=effectiveness_messages(scenario, action),
+    )
+    try:
+        narration = render_stream("describe_effectiveness_of_action", partials, "text", style)
+    except EmptyStream:
+        # Nothing arrived, ask again without streaming
+        action_effectiveness = describe_effectiveness_of_action(scenario, action)
+        console.print(f"{action_effectiveness}\n", style=style, markup=False)
+        return action_effectiveness
+    return narration.text or ""
+
+@traced("describe_scenario")
+def stream_scenario(current_entity_id: int, scenario: Scenario, be_brief=True, style: str | None = None) -> ScenarioDescription:
+    # Same as `describe_scenario` but prints the story while it is generated
+    cache_key = response_cache.key("describe_scenario", scenario, current_entity_id, be_brief)
+    if (cached := response_cache.get(cache_key, ScenarioDescription)) is not MISS:
+        console.print(f"{cached.story}\n", style=style, markup=False)
+        return cached
+
+    partials = client.create_partial(
+        model=route("describe_scenario"),
         response_model=ScenarioDescription,
-        messages=messages,
+        messages=describe_scenario_messages(current_entity_id, scenario, be_brief),
     )
+    try:
+        scenario_description = render_stream("describe_scenario", partials, "story", style)
+    except EmptyStream:
+        scenario_description = describe_scenario(current_entity_id, scenario, be_brief)
+        console.print(f"{scenario_description.story}\n", style=style, markup=False)
+        return scenario_description
+    response_cache.put(cache_key, scenario_description)
     return scenario_description
 
+@traced("answer_question")
 def answer_question(scenario: Scenario, question: str) -> str:
-    question_prompt = f"""
-    Answer the following question based on the current game scenario:
-    {question}
-    """
+    cache_key = response_cache.key("answer_question", scenario, question)
+    if (cached := response_cache.get(cache_key)) is not MISS:
+        return cached
 
     # Extract structured data from natural language
-    answer = client.chat.completions.create(
-        model="gpt-4o-mini",
+    answer = client.create(
+        model=route("answer_question"),
         response_model=str,
-        messages=[
-            {
-               "role": "system",
-                "content": f"The current state of the scenario is:\n{scenario.to_xml()}",
-            },
-            {
-                "role": "system",
-                "content": question_prompt,
-            }
-        ],
+        messages=answer_question_messages(scenario, question),
     )
+    response_cache.put(cache_key, answer)
     return answer
 
-# Step 5: Implement the Game Loop
-def game_loop():
-    print("[bold red]Game started![/bold red]")
-    scenario = generate_scenario()
-    scenario.initialize()
-
-    turn_number = 0    
-    while True:
-        current_entity_id = scenario.turn_order[scenario.current_turn]
-        current_entity = scenario._find_entity_by_id(current_entity_id)
-        
-        print(f"🎲 It's {current_entity.name}'s turn!")
-        
-        if current_entity in scenario.player_characters:
-            scenario_description = describe_scenario(current_entity_id, scenario, be_brief=turn_number == 0)
-            print(f"{scenario_description.story}\n")
-            while True:
-              action_input = input("What would you like to do? ")
-              if action_input == "quit":
-                  print("[bold red]Game over![/bold red]")
-                  break
-
-              player_action = ProposedAction(
-                  player_input=action_input,
-                  source_entity_id=current_entity_id,
-              )
-              # Figure out what the player wants to do
-              player_action_phase = game_roll(scenario, player_action)
-              #print(f"[blue]{player_action_phase.to_xml()}[/blue]\n\n")
-
-              if player_action_phase.is_question and player_action_phase.question_for_ai:
-                  question = player_action_phase.question_for_ai
-                  answer = answer_question(scenario, question)
-                  print(f"[green]{answer}[/green]\n\n")
-                  continue
-
-              for action in player_action_phase.actions:
-                scenario.apply_action(action)
-
-              action_effectiveness = describe_effectiveness_of_action(scenario, player_action_phase)
-              print(f"[green]{action_effectiveness}[/green]\n\n")
-              break
-
-        else:
-            # Simple AI or automated actions for monsters
-            # TODO: Implement a more sophisticated AI for monsters
-            monster_action = ProposedAction(
-                player_input="Attack",
-                source_entity_id=current_entity_id,
-            )
-            monster_action_phase = game_roll(scenario, monster_action)
-            for action in monster_action_phase.actions:
-              scenario.apply_action(action)
-
-            monsters_scenario_description = describe_scenario(current_entity_id, scenario)
-            print(f"[red]{monsters_scenario_description.story}[/red]\n\n")
-
-        # Check for win/loss conditions
-        if all(monster.health <= 0 for monster in scenario.monsters):
-            print("All monsters defeated! You win!")
-            break
-        elif all(character.health <= 0 for character in scenario.player_characters):
-            print("All player characters defeated! Game over!")
-            break
-        
-        turn_number += 1
-        scenario.next_turn()
+@traced("summarize_history")
+def summarize_history(previous_summary: str, actions: list[str]) -> str:
+    summary = client.create(
+        model=route("summarize_history"),
+        response_model=str,
+        messages=summarize_history_messages(previous_summary, actions),
+    )
+    return summary
+
+def game_calls() -> GameCalls:
+    return GameCalls(
+        play_action=play_action,
+        answer_question=answer_question,
+        describe_scenario=describe_scenario,
+        describe_effectiveness_of_action=describe_effectiveness_of_action,
+        game_roll=game_roll,
+        resolve_monster_turns=resolve_monster_turns,
+        stream_scenario=stream_scenario,
+        stream_effectiveness_of_action=stream_effectiveness_of_action,
+        stream_narration=STREAM_NARRATION,
+        batch_monster_turns=BATCH_MONSTER_TURNS,
+    )
 
-game_loop()
+# Step 5: Implement the Game Loop
+def game_loop(read_input=input, resume: str | None = None, pool: ScenarioPool | None = None) -> Scenario:
+    history = make_history(summarize_history if SUMMARIZE_HISTORY_WITH_LLM else None)
+    if resume:
+        print("[bold red]Game resumed![/bold red]")
+        scenario, journal = resume_game(resume, history, SAVE_DIRECTORY, SAVE_GAMES)
+        if is_over(scenario):
+            print("This game is already over.")
+            return scenario
+    else:
+        print("[bold red]Game started![/bold red]")
+        scenario = pool.take() if pool else generate_balanced_scenario()
+        journal = new_game(scenario, history, SAVE_DIRECTORY, SAVE_GAMES)
+    prepare_game(scenario, response_cache, journal)
+    tracer.trace_path = os.getenv(TRACE_ENV)
+
+    engine = TurnEngine(scenario, game_calls(), journal=journal)
+    try:
+        run_sync(engine.play(read_input))
+    finally:
+        engine.close()
+
+    tracer.finish()
+    response_cache.save()
+    if PRINT_CALL_REPORT:
+        tracer.report()
+        print(repair_stats.summary())
+        print(router.summary())
+        print(resolver_stats.summary())
+    return scenario
+
+def run(argv: list[str] | None = None) -> int:
+    # Entry point of `python -m main` and the `adventure` script
+    parser = argparse.ArgumentParser(description="A text adventure played against an LLM game master")
+    parser.add_argument("resume", nargs="?", help="Resume this saved game, a path, game id or the start of one")
+    parser.add_argument("--list", action="store_true", help="List the saved games and exit")
+    parser.add_argument("--backend", choices=("live", "record", "replay", "fake"), help="LLM backend, see src/llm.py")
+    parser.add_argument("--seed", type=int, help="Seed the dice")
+    parser.add_argument("--trace", metavar="PATH", help="Write every LLM call to this JSONL file")
+    parser.add_argument("--no-pool", action="store_true", help="Generate the scenario now instead of taking a pre-generated one")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Read by `make_client` and `game_loop`, neither has run yet
+    if args.backend:
+        os.environ[BACKEND_ENV] = args.backend
+    if args.seed is not None:
+        os.environ[DICE_SEED_ENV] = str(args.seed)
+    if args.trace:
+        os.environ[TRACE_ENV] = args.trace
+    response_cache.open(os.getenv(RESPONSE_CACHE_ENV))
+
+    if args.list:
+        for saved in list_games(SAVE_DIRECTORY):
+            print(f"{saved.game_id}  {saved.records:5d} records  {saved.result or 'in progress':11}  {saved.story[:60]}", markup=False, soft_wrap=True)
+        return 0
+
+    pool = None
+    # Pooled scenarios were generated outside the game's sequence of calls, a cassette can't hold them
+    if SCENARIO_POOL and not args.no_pool and not args.resume and not uses_cassette():
+        pool = ScenarioPool(generate_balanced_scenario, SCENARIO_POOL_SIZE, SCENARIO_POOL_WORKERS, SCENARIO_POOL_PATH).start()
+    try:
+        game_loop(resume=args.resume, pool=pool)
+    finally:
+        if pool:
+            pool.close()
+            if PRINT_CALL_REPORT:
+                print("Scenario pool:", " ".join(f"{name}={value:.3g}" for name, value in pool.stats().items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,290 @@
+import asyncio
+
+import os
+
+from src.entities import Scenario, ActionPhase, ProposedAction, ResolvedTurn, ScenarioDescription, Narration, MonsterTurns
+from src.instrumentation import InstrumentedClient, traced, tracer
+from src.llm import make_client, uses_cassette
+from src.prompts import (
+    generate_scenario_messages,
+    game_roll_messages,
+    resolved_turn_messages,
+    effectiveness_messages,
+    describe_scenario_messages,
+    answer_question_messages,
+    monster_turns_messages,
+)
+from src.repair import repair_stats, repairing
+from src.resolver import resolve_locally, resolver_stats
+from src.response_cache import MISS, ResponseCache
+from src.routing import route, router
+from src.scenario_pool import ScenarioPool
+from src.settings import (
+    STREAM_NARRATION,
+    TRACE_ENV,
+    PRINT_CALL_REPORT,
+    LOCAL_RESOLVER,
+    SINGLE_CALL_TURNS,
+    BATCH_MONSTER_TURNS,
+    SAVE_GAMES,
+    SAVE_DIRECTORY,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_ENV,
+    HTTP_MAX_CONNECTIONS,
+    BALANCE_ATTEMPTS,
+    BALANCE_ENCOUNTERS,
+    BALANCE_WIN_RATE,
+    SCENARIO_POOL,
+    SCENARIO_POOL_SIZE,
+    SCENARIO_POOL_WORKERS,
+    SCENARIO_POOL_PATH,
+)
+from src.streaming import EmptyStream, console, print, render_stream_async
+from src.turns import GameCalls, TurnEngine, is_over, make_history, new_game, prepare_game, resume_game
+
+# Same game as `main.py`, but every LLM call is a coroutine so independent calls can overlap.
+# Run it with `python -m src.async_game`.
+
+client = InstrumentedClient(factory=lambda: make_client(use_async=True, max_connections=HTTP_MAX_CONNECTIONS))
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, os.getenv(RESPONSE_CACHE_ENV))
+
+@traced("generate_scenario")
+async def generate_scenario() -> Scenario:
+    with repairing():
+        return await client.create(
+            model=route("generate_scenario"),
+            response_model=Scenario,
+            messages=generate_scenario_messages(),
+        )
+
+async def generate_balanced_scenario() -> Scenario:
+    # Same as in `main.py`, the simulation runs in a thread so other games keep going
+    if BALANCE_ATTEMPTS <= 1:
+        return await generate_scenario()
+
+    from src.simulator import imbalance
+
+    best = None
+    for _ in range(BALANCE_ATTEMPTS):
+        scenario = await generate_scenario()
+        distance = await asyncio.to_thread(imbalance, scenario, BALANCE_WIN_RATE, BALANCE_ENCOUNTERS)
+        if best is None or distance < best[0]:
+            best = (distance, scenario)
+        if not distance:
+            break
+    return best[1]
+
+@traced("game_roll")
+async def game_roll(scenario: Scenario, player_action: ProposedAction) -> ActionPhase:
+    # Plain commands like "attack goblin" don't need the model
+    if LOCAL_RESOLVER and (local_action_phase := resolve_locally(scenario, player_action)):
+        return local_action_phase
+
+    with repairing(scenario, player_action.source_entity_id):
+        return await client.create(
+            model=route("game_roll"),
+            response_model=ActionPhase,
+            messages=game_roll_messages(scenario, player_action),
+        )
+
+@traced("resolved_turn")
+async def resolve_turn(scenario: Scenario, player_action: ProposedAction) -> ResolvedTurn:
+    if LOCAL_RESOLVER and (local_action_phase := resolve_locally(scenario, player_action)):
+        return ResolvedTurn(action_phase=local_action_phase)
+
+    with repairing(scenario, player_action.source_entity_id):
+        return await client.create(
+            model=route("resolved_turn"),
+            response_model=ResolvedTurn,
+            messages=resolved_turn_messages(scenario, player_action),
+        )
+
+async def play_action(scenario: Scenario, player_action: ProposedAction) -> ResolvedTurn:
+    # With SINGLE_CALL_TURNS the narration comes with the action phase, otherwise only the action phase
+    if SINGLE_CALL_TURNS:
+        return await resolve_turn(scenario, player_action)
+    return ResolvedTurn(action_phase=await game_roll(scenario, player_action))
+
+@traced("monster_turns")
+async def resolve_monster_turns(scenario: Scenario, monster_ids: list[int]) -> MonsterTurns:
+    with repairing(scenario):
+        return await client.create(
+            model=route("monster_turns"),
+            response_model=MonsterTurns,
+            messages=monster_turns_messages(scenario, monster_ids),
+        )
+
+@traced("describe_effectiveness_of_action")
+async def describe_effectiveness_of_action(scenario: Scenario, action: ActionPhase) -> str:
+    return await client.create(
+        model=route("describe_effectiveness_of_action"),
+        response_model=str,
+        messages=effectiveness_messages(scenario, action),
+    )
+
+@traced("describe_scenario")
+async def describe_scenario(current_entity_id: int, scenario: Scenario, be_brief=True) -> ScenarioDescription:
+    cache_key = response_cache.key("describe_scenario", scenario, current_entity_id, be_brief)
+    if (cached := response_cache.get(cache_key, ScenarioDescription)) is not MISS:
+        return cached
+
+    scenario_description = await client.create(
+        model=route("describe_scenario"),
+        response_model=ScenarioDescription,
+        messages=describe_scenario_messages(current_entity_id, scenario, be_brief),
+    )
+    response_cache.put(cache_key, scenario_description)
+    return scenario_description
+
+@traced("describe_effectiveness_of_action")
+async def stream_effectiveness_of_action(scenario: Scenario, action: ActionPhase, style: str | None = "green") -> str:
+    partials = client.create_partial(
+        model=route("describe_effectiveness_of_action"),
+        response_model=Narration,
+        messages=effectiveness_messages(scenario, action),
+    )
+    try:
+        narration = await render_stream_async("describe_effectiveness_of_action", partials, "text", style)
+    except EmptyStream:
+        # Nothing arrived, ask again without streaming
+        action_effectiveness = await describe_effectiveness_of_action(scenario, action)
+        console.print(f"{action_effectiveness}\n", style=style, markup=False)
+        return action_effectiveness
+    return narration.text or ""
+
+@traced("describe_scenario")
+async def stream_scenario(current_entity_id: int, scenario: Scenario, be_brief=True, style: str | None = None) -> ScenarioDescription:
+    cache_key = response_cache.key("describe_scenario", scenario, current_entity_id, be_brief)
+    if (cached := response_cache.get(cache_key, ScenarioDescription)) is not MISS:
+        console.print(f"{cached.story}\n", style=style, markup=False)
+        return cached
+
+    partials = client.create_partial(
+        model=route("describe_scenario"),
+        response_model=ScenarioDescription,
+        messages=describe_scenario_messages(current_entity_id, scenario, be_brief),
+    )
+    try:
+        scenario_description = await render_stream_async("describe_scenario", partials, "story", style)
+    except EmptyStream:
+        scenario_description = await describe_scenario(current_entity_id, scenario, be_brief)
+        console.print(f"{scenario_description.story}\n", style=style, markup=False)
+        return scenario_description
+    response_cache.put(cache_key, scenario_description)
+    return scenario_description
+
+@traced("answer_question")
+async def answer_question(scenario: Scenario, question: str) -> str:
+    cache_key = response_cache.key("answer_question", scenario, question)
+    if (cached := response_cache.get(cache_key)) is not MISS:
+        return cached
+
+    answer = await client.create(
+        model=route("answer_question"),
+        response_model=str,
+        messages=answer_question_messages(scenario, question),
+    )
+    response_cache.put(cache_key, answer)
+    return answer
+
+class SpeculativeDescription:
+    # A `describe_scenario` call for the next entity, started before the current turn is over.
+    # It runs against a copy of the scenario advanced to the next turn and is only used if the
+    # real scenario ends up in exactly the same state.
+    def __init__(self, scenario: Scenario):
+        upcoming = scenario.model_copy(deep=True)
+        upcoming.next_turn()
+        self.entity_id = upcoming.turn_order[upcoming.current_turn]
+        self.state = upcoming.to_xml()
+        self.task = asyncio.create_task(describe_scenario(self.entity_id, upcoming))
+
+    @classmethod
+    def start(cls, scenario: Scenario) -> "SpeculativeDescription | None":
+        upcoming_id = scenario.turn_order[(scenario.current_turn + 1) % len(scenario.turn_order)]
+        if not scenario.is_player_character(upcoming_id):
+            return None
+        return cls(scenario)
+
+    async def take(self, entity_id: int, scenario: Scenario) -> ScenarioDescription | None:
+        if entity_id == self.entity_id and scenario.to_xml() == self.state:
+            return await self.task
+        self.discard()
+        return None
+
+    def discard(self):
+        self.task.cancel()
+
+def game_calls() -> GameCalls:
+    return GameCalls(
+        play_action=play_action,
+        answer_question=answer_question,
+        describe_scenario=describe_scenario,
+        describe_effectiveness_of_action=describe_effectiveness_of_action,
+        game_roll=game_roll,
+        resolve_monster_turns=resolve_monster_turns,
+        stream_scenario=stream_scenario,
+        stream_effectiveness_of_action=stream_effectiveness_of_action,
+        speculate=SpeculativeDescription.start,
+        stream_narration=STREAM_NARRATION,
+        batch_monster_turns=BATCH_MONSTER_TURNS,
+    )
+
+def scenario_pool(loop: asyncio.AbstractEventLoop) -> ScenarioPool:
+    # The pool's threads hand every generation to the game's loop, the async client belongs to it
+    def generate() -> Scenario:
+        return asyncio.run_coroutine_threadsafe(generate_balanced_scenario(), loop).result()
+
+    return ScenarioPool(generate, SCENARIO_POOL_SIZE, SCENARIO_POOL_WORKERS, SCENARIO_POOL_PATH)
+
+async def read_line(prompt: str) -> str:
+    return await asyncio.to_thread(input, prompt)
+
+async def async_game_loop(read_input=read_line, resume: str | None = None, pool: ScenarioPool | None = None) -> Scenario:
+    history = make_history()
+    if resume:
+        print("[bold red]Game resumed![/bold red]")
+        scenario, journal = resume_game(resume, history, SAVE_DIRECTORY, SAVE_GAMES)
+        if is_over(scenario):
+            print("This game is already over.")
+            return scenario
+    else:
+        print("[bold red]Game started![/bold red]")
+        scenario = await asyncio.to_thread(pool.take) if pool else await generate_balanced_scenario()
+        journal = new_game(scenario, history, SAVE_DIRECTORY, SAVE_GAMES)
+    prepare_game(scenario, response_cache, journal)
+    tracer.trace_path = os.getenv(TRACE_ENV)
+
+    engine = TurnEngine(scenario, game_calls(), journal=journal)
+    try:
+        await engine.play(read_input)
+    finally:
+        engine.close()
+
+    tracer.finish()
+    response_cache.save()
+    if PRINT_CALL_REPORT:
+        tracer.report()
+        print(repair_stats.summary())
+        print(router.summary())
+        print(resolver_stats.summary())
+    return scenario
+
+async def run(use_pool: bool = True):
+    pool = None
+    # Same as in `main.run`, a cassette can't hold the pooled scenarios
+    if SCENARIO_POOL and use_pool and not uses_cassette():
+        pool = scenario_pool(asyncio.get_running_loop()).start()
+    try:
+        await async_game_loop(pool=pool)
+    finally:
+        if pool:
+            pool.close()
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    response_cache.open(os.getenv(RESPONSE_CACHE_ENV))
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+from typing import Dict, List, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.entities import GameEntity
+
+class EntityIndex:
+    # O(1) lookups for a Scenario: entity id -> position in `player_characters + monsters`, which
+    # side an entity is on and how many entities on each side are still alive.
+    def __init__(self, player_characters: List["GameEntity"], monsters: List["GameEntity"]):
+        self.entities = player_characters + monsters
+        # The first entity with an ID wins, like the linear search this replaces
+        self.positions: Dict[int, int] = {}
+        for index, entity in enumerate(self.entities):
+            self.positions.setdefault(entity.entity_id, index)
+        self.player_ids: Set[int] = {character.entity_id for character in player_characters}
+        # Living entities on each side by id(entity), so updating one twice changes nothing
+        self._sides: Dict[int, Set[int]] = {}
+        self._living_players: Set[int] = set()
+        self._living_monsters: Set[int] = set()
+        for side, entities in ((self._living_players, player_characters), (self._living_monsters, monsters)):
+            for entity in entities:
+                self._sides[id(entity)] = side
+                self.update_living(entity)
+
+    def find(self, entity_id: int | None) -> "GameEntity | None":
+        index = self.positions.get(entity_id)
+        if index is None:
+            return None
+        return self.entities[index]
+
+    def is_monster(self, entity_id: int | None) -> bool:
+        return entity_id in self.positions and entity_id not in self.player_ids
+
+    @property
+    def living_players(self) -> int:
+        return len(self._living_players)
+
+    @property
+    def living_monsters(self) -> int:
+        return len(self._living_monsters)
+
+    def update_living(self, entity: "GameEntity"):
+        side = self._sides.get(id(entity))
+        if side is None:
+            return
+        if entity.health > 0:
+            side.add(id(entity))
+        else:
+            side.discard(id(entity))
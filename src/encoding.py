@@ -0,0 +1,132 @@
+import json
+from typing import Callable, Dict
+
+from src.entities import GameEntity, Scenario
+
+# Ways to write the scenario into a prompt, picked per call site with SCENARIO_ENCODINGS in
+# `src/settings.py`. "xml" is `Scenario.to_xml()`. The others write every entity on one line, use
+# enum values ("Cast Spell" instead of "Ability.CAST_SPELL") and leave out stats that still have
+# their default value, which the legend at the top spells out:
+#   compact_xml - one element per entity with the stats as attributes, no indentation
+#   json        - minified JSON
+#   table       - one `|` separated row per entity
+
+# Short names for the stats, in the order they are written
+STATS = {
+    "health": "hp",
+    "strength": "str",
+    "dexterity": "dex",
+    "intelligence": "int",
+    "defensive_bonus": "def",
+}
+STAT_DEFAULTS = {field: GameEntity.model_fields[field].default for field in STATS}
+
+LEGEND = "Stats left out have their default: " + ", ".join(
+    f"{short} {STAT_DEFAULTS[field]}" for field, short in STATS.items()
+) + "."
+
+def _stats(entity: GameEntity) -> Dict[str, int]:
+    return {short: getattr(entity, field) for field, short in STATS.items() if getattr(entity, field) != STAT_DEFAULTS[field]}
+
+def _names(values) -> str:
+    return ",".join(value.value for value in values)
+
+def _current_entity_id(scenario: Scenario) -> int | None:
+    return scenario.turn_order[scenario.current_turn] if scenario.turn_order else None
+
+def compact_xml(scenario: Scenario) -> str:
+    # Imported here for the same reason as xmltodict in `src/utils.py`
+    from xml.sax.saxutils import escape, quoteattr
+
+    def entity_xml(tag: str, entity: GameEntity) -> str:
+        attributes = f"id=\"{entity.entity_id}\" name={quoteattr(entity.name)}"
+        attributes += "".join(f" {short}=\"{value}\"" for short, value in _stats(entity).items())
+        if entity.traits:
+            attributes += f" traits={quoteattr(_names(entity.traits))}"
+        if entity.abilities:
+            attributes += f" abilities={quoteattr(_names(entity.abilities))}"
+        return f"<{tag} {attributes}/>"
+
+    summary, history = scenario.prompt_history()
+    lines = [
+        "<Scenario>",
+        f"<legend>{LEGEND}</legend>",
+        f"<story>{escape(scenario.location_and_story_description)}</story>",
+        *(entity_xml("player_character", entity) for entity in scenario.player_characters),
+        *(entity_xml("monster", entity) for entity in scenario.monsters),
+        f"<turn_order current=\"{_current_entity_id(scenario)}\">{','.join(map(str, scenario.turn_order))}</turn_order>",
+    ]
+    if summary:
+        lines.append(f"<history_summary>{escape(summary)}</history_summary>")
+    lines.extend(f"<action>{escape(entry)}</action>" for entry in history)
+    lines.append("</Scenario>")
+    return "\n".join(lines)
+
+def minified_json(scenario: Scenario) -> str:
+    def entity_json(entity: GameEntity) -> dict:
+        data = {"id": entity.entity_id, "name": entity.name, **_stats(entity)}
+        if entity.traits:
+            data["traits"] = [trait.value for trait in entity.traits]
+        if entity.abilities:
+            data["abilities"] = [ability.value for ability in entity.abilities]
+        return data
+
+    summary, history = scenario.prompt_history()
+    document = {
+        "legend": LEGEND,
+        "story": scenario.location_and_story_description,
+        "player_characters": [entity_json(entity) for entity in scenario.player_characters],
+        "monsters": [entity_json(entity) for entity in scenario.monsters],
+        "turn_order": scenario.turn_order,
+        "current": _current_entity_id(scenario),
+    }
+    if summary:
+        document["history_summary"] = summary
+    if history:
+        document["history"] = history
+    return json.dumps(document, separators=(",", ":"), ensure_ascii=False)
+
+def table(scenario: Scenario) -> str:
+    def entity_row(side: str, entity: GameEntity) -> str:
+        stats = _stats(entity)
+        cells = [side, str(entity.entity_id), entity.name]
+        cells += [str(stats.get(short, "")) for short in STATS.values()]
+        cells += [_names(entity.traits), _names(entity.abilities)]
+        return "|".join(cells)
+
+    summary, history = scenario.prompt_history()
+    lines = [
+        scenario.location_and_story_description,
+        LEGEND,
+        "side|id|name|" + "|".join(STATS.values()) + "|traits|abilities",
+        *(entity_row("player", entity) for entity in scenario.player_characters),
+        *(entity_row("monster", entity) for entity in scenario.monsters),
+        f"Turn order: {','.join(map(str, scenario.turn_order))}, current: {_current_entity_id(scenario)}",
+    ]
+    if summary:
+        lines.append(f"Earlier: {summary}")
+    if history:
+        lines.append("Actions:")
+        lines.extend(f"- {entry}" for entry in history)
+    return "\n".join(lines)
+
+ENCODINGS: Dict[str, Callable[[Scenario], str]] = {
+    "xml": Scenario.to_xml,
+    "compact_xml": compact_xml,
+    "json": minified_json,
+    "table": table,
+}
+
+def encode_scenario(scenario: Scenario, encoding: str = "xml") -> str:
+    if encoding == "xml":
+        return scenario.to_xml()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown scenario encoding {encoding!r}, expected one of {', '.join(ENCODINGS)}")
+
+    # Re-encoded only when the scenario changed, without rendering the XML document to find out
+    version = (scenario._version, len(scenario.action_history))
+    cached = scenario._encoded.get(encoding)
+    if cached is None or cached[0] != version:
+        cached = (version, ENCODINGS[encoding](scenario))
+        scenario._encoded[encoding] = cached
+    return cached[1]
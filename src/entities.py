@@ -1,9 +1,15 @@
+import hashlib
 import random
-from pydantic import Field
-from typing import List
+import re
+from pydantic import Field, PrivateAttr, model_validator
+from typing import Callable, Dict, List, NamedTuple, Set, Tuple
 from enum import Enum
 
-from src.utils import BaseModelWithXML
+from src.combat import EntityIndex
+from src.history import HistoryEvent, HistoryManager
+from src.prompt_layout import PromptLayout
+from src.repair import repair_action, repair_entity
+from src.utils import BaseModelWithXML, xml_fragment
 
 class Trait(Enum):
     AGGRESSIVE = "Aggressive"
@@ -49,6 +55,12 @@ class Action(BaseModelWithXML):
 
     description: str = Field("", description="Detailed description of the action taken in past tense for the game history.")
 
+    # Only changes anything inside `src.repair.repairing()`, i.e. for LLM responses
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data):
+        return repair_action(data)
+
 class ActionPhase(BaseModelWithXML):
     actions: List[Action] = Field(default_factory=list, description="The list of actions to perform in the game scenario")
     is_question: bool = Field(False, description="Indicates if the player asked a question and the AI should respond accordingly and not process an action.")
@@ -93,6 +105,12 @@ class GameEntity(BaseModelWithXML):
         0, ge=0, le=10, description="The bonus to defense when defending."
     )
 
+    # Only changes anything inside `src.repair.repairing()`, i.e. for LLM responses
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data):
+        return repair_entity(cls, data)
+
     def generate_abilities(self):
         # Add general abilities
         self.abilities.extend([Ability.ATTACK, Ability.DEFEND])
@@ -108,6 +126,70 @@ class ScenarioDescription(BaseModelWithXML):
         ..., description="The list of possible actions that can be taken in the current scenario. By the current entity."
     )
 
+class Narration(BaseModelWithXML):
+    text: str = Field(..., description="The narration of what just happened in the game scenario.")
+
+class ActionOutcome(NamedTuple):
+    # What `Scenario.apply_action` did, the input for `ResolvedTurn.narrate`
+    type: ActionType
+    source: str
+    target: str
+    roll: int
+    # Damage dealt, health healed or defensive bonus gained
+    effect: int
+    target_health: int
+    defeated: bool
+
+# Outcomes with an effect up to WEAK_EFFECT are narrated with `ResolvedTurn.weak`, up to SOLID_EFFECT with
+# `solid` and above that with `strong`
+WEAK_EFFECT = 6
+SOLID_EFFECT = 13
+
+class ResolvedTurn(BaseModelWithXML):
+    # A player's action phase and its narration from one LLM call. The dice are rolled after the
+    # response, so the model writes a line per outcome tier and `narrate` picks and fills them in.
+    action_phase: ActionPhase = Field(..., description="The action phase for the player's action.")
+    narration: str = Field("", description="One or two sentences in past tense of what was attempted, without saying how well it worked.")
+    weak: str = Field("", description="One sentence for when the action barely works.")
+    solid: str = Field("", description="One sentence for when the action works.")
+    strong: str = Field("", description="One sentence for when the action works very well.")
+    defeated: str = Field("", description="One sentence for when an attack brings the target down.")
+
+    @property
+    def has_narration(self) -> bool:
+        return bool(self.narration or self.solid)
+
+    def narrate(self, outcomes: List[ActionOutcome | None]) -> str:
+        lines = [self.narration]
+        for outcome in outcomes:
+            if outcome is None:
+                continue
+            if outcome.defeated and self.defeated:
+                template = self.defeated
+            elif outcome.effect <= WEAK_EFFECT:
+                template = self.weak
+            elif outcome.effect <= SOLID_EFFECT:
+                template = self.solid
+            else:
+                template = self.strong
+            lines.append(_fill(template or self.solid, outcome))
+        return " ".join(line for line in lines if line)
+
+_PLACEHOLDER = re.compile(r"\{(source|target|amount|health)\}")
+
+def _fill(template: str, outcome: ActionOutcome) -> str:
+    # Not `str.format`, the model's text may contain other braces
+    values = {"source": outcome.source, "target": outcome.target, "amount": outcome.effect, "health": outcome.target_health}
+    return _PLACEHOLDER.sub(lambda match: str(values[match.group(1)]), template)
+
+class MonsterTurns(BaseModelWithXML):
+    phases: List[ActionPhase] = Field(
+        ..., description="One action phase per monster, in the order the monsters were listed."
+    )
+    narration: str = Field(
+        ..., description="One short narration in past tense of what all the monsters attempted, without damage numbers."
+    )
+
 class Scenario(BaseModelWithXML):
     location_and_story_description: str = Field(
         ..., description="""
@@ -130,10 +212,229 @@ class Scenario(BaseModelWithXML):
         default_factory=list, description="The list of actions taken in the scenario. Do not set this field directly."
     )
 
+    # Cached XML rendering. `_xml` is the full document, `_entity_xml` holds one fragment per
+    # entity and `_history_xml` one fragment per history entry so a turn only re-renders what changed.
+    # Fragments are keyed by the entity object, not its ID: a player and a monster may share an ID.
+    # The entity is kept with its fragment so the key can't be reused by another object.
+    _xml: str | None = PrivateAttr(None)
+    _entity_xml: Dict[int, Tuple["GameEntity", str]] = PrivateAttr(default_factory=dict)
+    _dirty_entities: Set[int] = PrivateAttr(default_factory=set)
+    _history_xml: List[str] = PrivateAttr(default_factory=list)
+
+    # When set, prompts only carry a bounded window of `action_history`, see `configure_history`
+    _history: HistoryManager | None = PrivateAttr(None)
+
+    # When set, prompts put the stable content first and only append what changed, see `src/prompt_layout.py`
+    _prompt_layout: PromptLayout | None = PrivateAttr(None)
+
+    # Lookup tables built on first use and dropped whenever the entity lists are replaced
+    _index: EntityIndex | None = PrivateAttr(None)
+
+    # Dice used by `apply_action`, the module level `random` unless seeded
+    _rng: random.Random | None = PrivateAttr(None)
+
+    # Called with the action and the dice roll after every `apply_action`, and after every `next_turn`
+    _action_listeners: List[Callable[[Action, int], None]] = PrivateAttr(default_factory=list)
+    _turn_listeners: List[Callable[[], None]] = PrivateAttr(default_factory=list)
+
+    # (document, sha256 of the document) for `state_hash`
+    _state_hash: Tuple[str, str] | None = PrivateAttr(None)
+
+    # Bumped on every change that goes through the scenario's own methods. Together with the length
+    # of `action_history` it tells whether a cached rendering is still current without rendering again.
+    _version: int = PrivateAttr(0)
+
+    # Encoding name -> ((version, history length) it was rendered at, text), see `src/encoding.py`
+    _encoded: Dict[str, Tuple[Tuple[int, int], str]] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name not in type(self).model_fields:
+            return
+
+        self._xml = None
+        self._version += 1
+        if name in ("player_characters", "monsters"):
+            self._entity_xml.clear()
+            self._reset_index()
+        elif name == "action_history":
+            self._history_xml.clear()
+
+    def __deepcopy__(self, memo=None):
+        # Listeners belong to this scenario (journal, response cache), copies start without any.
+        # `model_copy(deep=True)` passes no memo, and without a shared one the copied lookup index
+        # would point at separate copies of the entities.
+        copy = super().__deepcopy__({} if memo is None else memo)
+        copy._action_listeners = []
+        copy._turn_listeners = []
+        return copy
+
+    def mark_dirty(self, *entities: "GameEntity"):
+        # Call this after mutating the scenario outside of its own methods. With no arguments
+        # everything is re-rendered and re-indexed, otherwise only the given entities are re-rendered
+        # and counted again as living or defeated.
+        self._xml = None
+        self._version += 1
+        if not entities:
+            self._entity_xml.clear()
+            self._history_xml.clear()
+            self._reset_index()
+            return
+
+        self._dirty_entities.update(id(entity) for entity in entities)
+        if self._index is not None:
+            for entity in entities:
+                self._index.update_living(entity)
+
+    def to_xml(self) -> str:
+        if self._xml is not None:
+            return self._xml
+
+        for key in self._dirty_entities:
+            self._entity_xml.pop(key, None)
+        self._dirty_entities.clear()
+
+        # The history is append only, anything else means it was edited and must be rebuilt
+        if len(self._history_xml) > len(self.action_history):
+            self._history_xml.clear()
+        for entry in self.action_history[len(self._history_xml):]:
+            self._history_xml.append(xml_fragment("action_histor", entry, depth=2))
+
+        history_start = 0
+        history_summary = []
+        if self._history:
+            history_start = self._history.window_start(self.action_history)
+            if history_start and (summary := self._history.summary()):
+                history_summary.append(xml_fragment("action_history_summary", summary, depth=1))
+
+        lines = [
+            "<Scenario>",
+            xml_fragment("location_and_story_description", self.location_and_story_description, depth=1),
+            *self._entities_xml("player_characters", self.player_characters),
+            *self._entities_xml("monsters", self.monsters),
+            xml_fragment("turn_order", {"turn_orde": self.turn_order}, depth=1),
+            xml_fragment("current_turn", self.current_turn, depth=1),
+            *history_summary,
+            *self._list_xml("action_history", self._history_xml[history_start:]),
+            "</Scenario>",
+        ]
+        self._xml = "\n".join(lines)
+        return self._xml
+
+    def _entities_xml(self, key: str, entities: List["GameEntity"]) -> List[str]:
+        fragments = []
+        for entity in entities:
+            cached = self._entity_xml.get(id(entity))
+            if cached is None or cached[0] is not entity:
+                cached = (entity, xml_fragment(key[:-1], entity.model_dump(), depth=2))
+                self._entity_xml[id(entity)] = cached
+            fragments.append(cached[1])
+        return self._list_xml(key, fragments)
+
+    def _list_xml(self, key: str, fragments: List[str]) -> List[str]:
+        if not fragments:
+            return [f"\t<{key}></{key}>"]
+        return [f"\t<{key}>", *fragments, f"\t</{key}>"]
+
+    def configure_history(self, history: HistoryManager | None):
+        self._history = history
+        if history:
+            history.fold(self.action_history)
+        self._xml = None
+        self._version += 1
+
+    @property
+    def history(self) -> HistoryManager | None:
+        return self._history
+
+    def prompt_history(self) -> Tuple[str, List[str]]:
+        # The summary of older actions and the actions sent verbatim, the same window as `to_xml`
+        if not self._history:
+            return "", self.action_history
+        start = self._history.window_start(self.action_history)
+        return (self._history.summary() if start else ""), self.action_history[start:]
+
+    def configure_prompt_layout(self, layout: PromptLayout | None):
+        # The snapshot is taken by the first prompt built with the layout
+        self._prompt_layout = layout
+
+    @property
+    def prompt_layout(self) -> PromptLayout | None:
+        return self._prompt_layout
+
+    def state_hash(self) -> str:
+        # Content hash of what the model sees, equal for equal states even across sessions
+        xml = self.to_xml()
+        cached = self._state_hash
+        if cached is None or cached[0] is not xml:
+            cached = (xml, hashlib.sha256(xml.encode()).hexdigest())
+            self._state_hash = cached
+        return cached[1]
+
+    def add_action_listener(self, listener: Callable[[Action, int], None]):
+        self._action_listeners.append(listener)
+
+    def add_turn_listener(self, listener: Callable[[], None]):
+        self._turn_listeners.append(listener)
+
+    def seed_dice(self, seed: int | None):
+        self._rng = random.Random(seed)
+
+    def roll_die(self) -> int:
+        return (self._rng or random).randint(1, 20)
+
+    def is_player_character(self, entity_id: int | None) -> bool:
+        return entity_id in self._entity_index().player_ids
+
+    def is_monster(self, entity_id: int | None) -> bool:
+        return self._entity_index().is_monster(entity_id)
+
+    def all_monsters_defeated(self) -> bool:
+        return self._entity_index().living_monsters == 0
+
+    def all_player_characters_defeated(self) -> bool:
+        return self._entity_index().living_players == 0
+
+    def upcoming_monster_ids(self) -> List[int]:
+        # The monsters in `turn_order` from the current turn up to the next player character
+        monster_ids = []
+        for offset in range(len(self.turn_order)):
+            entity_id = self.turn_order[(self.current_turn + offset) % len(self.turn_order)]
+            if not self.is_monster(entity_id):
+                break
+            monster_ids.append(entity_id)
+        return monster_ids
+
+    def apply_monster_turns(self, monster_ids: List[int], monster_turns: MonsterTurns) -> List[str]:
+        # Plays one phase per monster in order, leaving `current_turn` on the last monster that
+        # acted. Actions by anyone but the monster whose turn it is are ignored. Returns the new
+        # history entries.
+        history_length = len(self.action_history)
+        for offset, (monster_id, phase) in enumerate(zip(monster_ids, monster_turns.phases)):
+            if offset:
+                self.next_turn()
+            for action in phase.actions:
+                if action.source_entity_id == monster_id:
+                    self.apply_action(action)
+            if self.all_player_characters_defeated():
+                break
+        return self.action_history[history_length:]
+
+    def _entity_index(self) -> EntityIndex:
+        index = self._index
+        if index is None:
+            index = EntityIndex(self.player_characters, self.monsters)
+            self._index = index
+        return index
+
+    def _reset_index(self):
+        self._index = None
+
     def initialize(self):
         self.set_turn_order()
         self.generate_abilities()
         self.action_history = []
+        self.mark_dirty()
 
     def set_turn_order(self):
         self.turn_order = [entity.entity_id for entity in self.player_characters + self.monsters]
@@ -146,10 +447,11 @@ class Scenario(BaseModelWithXML):
         for monster in self.monsters:
             monster.generate_abilities()
 
-    def apply_action(self, action: Action):
+    def apply_action(self, action: Action, roll: int | None = None) -> ActionOutcome | None:
         # Find the target entity
-        source = self._find_entity_by_id(action.source_entity_id)
-        target = self._find_entity_by_id(action.target_entity_id)
+        index = self._entity_index()
+        source = index.find(action.source_entity_id)
+        target = index.find(action.target_entity_id)
         if not target:
             print(f"No entity found with ID {action.target_entity_id}")
             return
@@ -158,6 +460,9 @@ class Scenario(BaseModelWithXML):
             print(f"No entity found with ID {action.source_entity_id}")
             return
         
+        health_before = target.health
+        defensive_bonus_before = source.defensive_bonus
+
         attack_modifier = 10  # Default attack modifier
         if action.action_kind == ActionKind.STRENGTH:
             attack_modifier = source.strength
@@ -166,7 +471,9 @@ class Scenario(BaseModelWithXML):
         elif action.action_kind == ActionKind.INTELLIGENCE:
             attack_modifier = source.intelligence
 
-        amount = round((attack_modifier/10) * random.randint(1, 20))  # Roll a 6-sided die for damage calculation
+        if roll is None:
+            roll = self.roll_die()
+        amount = round((attack_modifier/10) * roll)  # Roll a 6-sided die for damage calculation
         amount = max(0, min(amount, 20))  # Ensure amount is within the range of 0 to 20
 
         # Perform the action based on the action type
@@ -181,18 +488,37 @@ class Scenario(BaseModelWithXML):
         else:
             print(f"Unknown action type: {action.type}")
         
-        if not message:
-            return
+        # Also counts the target again as living or defeated
+        self.mark_dirty(source, target)
 
-        self.action_history.append(message)
+        if action.type == ActionType.DEFEND:
+            effect = source.defensive_bonus - defensive_bonus_before
+        else:
+            effect = abs(target.health - health_before)
+
+        if message:
+            self.action_history.append(message)
+
+            if self._history:
+                self._history.record(
+                    self.action_history, HistoryEvent(source.name, target.name, action.type.value, effect)
+                )
+
+        for listener in self._action_listeners:
+            listener(action, roll)
+
+        return ActionOutcome(
+            action.type,
+            source.name,
+            target.name,
+            roll,
+            effect,
+            target.health,
+            action.type == ActionType.ATTACK and health_before > 0 >= target.health,
+        )
 
     def _find_entity_by_id(self, entity_id: int | None) -> GameEntity | None:
-        if entity_id is None:
-            return None
-        for entity in self.player_characters + self.monsters:
-            if entity.entity_id == entity_id:
-                return entity
-        return None
+        return self._entity_index().find(entity_id)
 
     def _apply_attack(self, source: GameEntity, target: GameEntity, amount: int, description: str):
         message = f"{source.name} attacks {target.name} for {amount} damage."
@@ -224,4 +550,11 @@ class Scenario(BaseModelWithXML):
         return f"{target.name} moves to a new position in the amount of {amount}. Description: {description}"
 
     def next_turn(self):
+        if self._history:
+            self._history.record_turn(self.action_history)
+
+        # Assigning the field invalidates the cached document, see `__setattr__`
         self.current_turn = (self.current_turn + 1) % len(self.turn_order)
+
+        for listener in self._turn_listeners:
+            listener()
@@ -0,0 +1,152 @@
+from typing import Callable, Dict, List, NamedTuple
+
+# Rough conversion used when the budget is given in tokens
+BYTES_PER_TOKEN = 4
+
+class HistoryEvent(NamedTuple):
+    source_name: str
+    target_name: str
+    action_type: str
+    amount: int
+
+class EntityTotals:
+    def __init__(self):
+        self.damage_dealt = 0
+        self.damage_taken = 0
+        self.healed = 0
+        self.defense_gained = 0
+
+    def describe(self, name: str) -> str:
+        parts = [
+            f"dealt {self.damage_dealt} damage" if self.damage_dealt else "",
+            f"took {self.damage_taken} damage" if self.damage_taken else "",
+            f"was healed for {self.healed}" if self.healed else "",
+            f"gained {self.defense_gained} defense" if self.defense_gained else "",
+        ]
+        parts = [part for part in parts if part]
+        return f"{name} " + ", ".join(parts) + "." if parts else ""
+
+# Keeps the prompt view of `Scenario.action_history` bounded. The last `keep_last` entries are
+# kept verbatim (fewer if they exceed the byte budget) and everything older is folded into a
+# deterministic per-entity rollup, optionally followed by an LLM written summary.
+class HistoryManager:
+    def __init__(
+        self,
+        keep_last: int = 8,
+        budget_bytes: int | None = 4000,
+        budget_tokens: int | None = None,
+        summarizer: Callable[[str, List[str]], str] | None = None,
+        summarize_every: int = 10,
+    ):
+        self.keep_last = max(1, keep_last)
+        self.budget_bytes = budget_tokens * BYTES_PER_TOKEN if budget_tokens else budget_bytes
+        self.summarizer = summarizer
+        self.summarize_every = summarize_every
+
+        self.bytes_saved_per_turn: List[int] = []
+        self._reset()
+
+    def _reset(self):
+        self._events: List[HistoryEvent | None] = []
+        self._totals: Dict[str, EntityTotals] = {}
+        self._folded = 0
+        self._folded_bytes = 0
+        self._llm_summary = ""
+        self._llm_summarized = 0
+
+    def record(self, history: List[str], event: HistoryEvent):
+        # `event` describes the entry that was just appended to `history`
+        self._sync(history)
+        self._events.extend([None] * (len(history) - 1 - len(self._events)))
+        self._events.append(event)
+        self.fold(history)
+
+    def fold(self, history: List[str]):
+        # Folds what fell out of the window into the rollup. Runs when entries are recorded, so
+        # reading the window and the summary for a prompt changes nothing.
+        self._sync(history)
+        start = len(history)
+        used = 0
+        while start > 0 and len(history) - start < self.keep_last:
+            size = len(history[start - 1].encode())
+            if self.budget_bytes is not None and used + size > self.budget_bytes and start < len(history):
+                break
+            used += size
+            start -= 1
+        self._fold(history, start)
+
+    def window_start(self, history: List[str]) -> int:
+        # Index of the first entry that is still sent verbatim. Entries appended without `record`
+        # stay verbatim until the next `fold`, a replaced history until it is folded again.
+        if self._replaced(history):
+            return 0
+        return self._folded
+
+    def summary(self) -> str:
+        if not self._folded:
+            return ""
+
+        lines = [f"{self._folded} earlier actions."]
+        lines.extend(filter(None, (totals.describe(name) for name, totals in self._totals.items())))
+        if self._llm_summary:
+            lines.append(self._llm_summary)
+        return " ".join(lines)
+
+    def record_turn(self, history: List[str]) -> int:
+        # End of a turn, the LLM summary is brought up to date here and never while a prompt is built
+        self.fold(history)
+        if self.summarizer and self._folded - self._llm_summarized >= self.summarize_every:
+            self._llm_summary = self.summarizer(self._llm_summary, history[self._llm_summarized:self._folded])
+            self._llm_summarized = self._folded
+
+        saved = max(0, self._folded_bytes - len(self.summary().encode()))
+        self.bytes_saved_per_turn.append(saved)
+        return saved
+
+    def state(self) -> dict:
+        # Everything needed to carry on with the same summary after a restart, see `src/journal.py`
+        return {
+            "events": [list(event) if event else None for event in self._events],
+            "totals": {name: vars(totals) for name, totals in self._totals.items()},
+            "folded": self._folded,
+            "folded_bytes": self._folded_bytes,
+            "llm_summary": self._llm_summary,
+            "llm_summarized": self._llm_summarized,
+        }
+
+    def restore(self, state: dict):
+        self._events = [HistoryEvent(*event) if event else None for event in state["events"]]
+        self._totals = {}
+        for name, values in state["totals"].items():
+            totals = self._totals[name] = EntityTotals()
+            vars(totals).update(values)
+        self._folded = state["folded"]
+        self._folded_bytes = state["folded_bytes"]
+        self._llm_summary = state["llm_summary"]
+        self._llm_summarized = state["llm_summarized"]
+
+    def _replaced(self, history: List[str]) -> bool:
+        # E.g. by `Scenario.initialize`
+        return len(self._events) > len(history) or self._folded > len(history)
+
+    def _sync(self, history: List[str]):
+        if self._replaced(history):
+            self._reset()
+
+    def _fold(self, history: List[str], start: int):
+        for index in range(self._folded, start):
+            self._folded_bytes += len(history[index].encode())
+            event = self._events[index] if index < len(self._events) else None
+            if event is None:
+                continue
+
+            source = self._totals.setdefault(event.source_name, EntityTotals())
+            target = self._totals.setdefault(event.target_name, EntityTotals())
+            if event.action_type == "attack":
+                source.damage_dealt += event.amount
+                target.damage_taken += event.amount
+            elif event.action_type == "heal":
+                target.healed += event.amount
+            elif event.action_type == "defend":
+                source.defense_gained += event.amount
+        self._folded = max(self._folded, start)
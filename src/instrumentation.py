@@ -0,0 +1,344 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Callable, Deque, Dict, List
+
+from src.repair import note_retry
+from src.settings import TRACE_MAX_RECORDS
+
+# Per-call tracing for the LLM client. Wrap the client with `InstrumentedClient`, tag the game
+# functions with `@traced("<call site>")` and call `tracer.start_turn(n)` from the game loop;
+# every request is then recorded with its call site, turn, model, latency and token usage.
+
+_call_site: contextvars.ContextVar[str] = contextvars.ContextVar("call_site", default="unknown")
+_turn: contextvars.ContextVar[int | None] = contextvars.ContextVar("turn", default=None)
+_active_call: contextvars.ContextVar["CallRecord | None"] = contextvars.ContextVar("active_call", default=None)
+
+@dataclass
+class CallRecord:
+    call_site: str
+    turn: int | None
+    model: str | None
+    response_model: str
+    streamed: bool
+    started: float
+    latency: float = 0.0
+    time_to_first_token: float | None = None
+    prompt_bytes: int = 0
+    # Bytes at the start of the prompt identical to the previous call from the same call site, what
+    # a provider side prompt cache could reuse
+    prefix_bytes: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    attempts: int = 0
+    validation_retries: int = 0
+    error: str | None = None
+
+def common_prefix_bytes(previous: List[Dict[str, str]] | None, messages: List[Dict[str, str]]) -> int:
+    if not previous:
+        return 0
+    shared = 0
+    for old, new in zip(previous, messages):
+        if old["role"] != new["role"]:
+            break
+        old_content, new_content = str(old["content"]), str(new["content"])
+        if old_content != new_content:
+            shared += len(os.path.commonprefix([old_content, new_content]).encode())
+            break
+        shared += len(new_content.encode())
+    return shared
+
+class Histogram:
+    # Fixed log-spaced buckets, cheap enough to update on every call
+    BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction: float) -> float:
+        # Upper bound of the bucket holding the requested rank
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.BOUNDS[index] if index < len(self.BOUNDS) else float("inf")
+        return 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class Tracer:
+    def __init__(self, trace_path: str | None = None, max_records: int | None = TRACE_MAX_RECORDS):
+        self.trace_path = trace_path
+        self.records: Deque[CallRecord] = deque(maxlen=max_records)
+        self._listeners: List[Callable[[CallRecord], None]] = []
+        self.latency: Dict[str, Histogram] = {}
+        self.prompt_bytes: Dict[str, Histogram] = {}
+        self.turn_started: Dict[int, float] = {}
+        self.turn_ended: Dict[int, float] = {}
+        self._trace_file = None
+
+    def retain(self, max_records: int | None):
+        # Keep at most `max_records` calls for the report, 0 keeps none
+        self.records = deque(self.records, maxlen=max_records)
+
+    def add_listener(self, listener: Callable[[CallRecord], None]):
+        # Called with every finished call, whether or not it is retained
+        self._listeners.append(listener)
+
+    def start_turn(self, turn: int):
+        now = time.perf_counter()
+        previous = _turn.get()
+        if previous is not None:
+            self.turn_ended[previous] = now
+        self.turn_started[turn] = now
+        _turn.set(turn)
+
+    def finish(self):
+        turn = _turn.get()
+        if turn is not None:
+            self.turn_ended[turn] = time.perf_counter()
+        if self._trace_file:
+            self._trace_file.close()
+            self._trace_file = None
+
+    def record(self, call: CallRecord):
+        self.records.append(call)
+        self.latency.setdefault(call.call_site, Histogram()).add(call.latency)
+        self.prompt_bytes.setdefault(call.call_site, Histogram()).add(call.prompt_bytes)
+        for listener in self._listeners:
+            listener(call)
+
+        if self.trace_path:
+            if self._trace_file is None:
+                self._trace_file = open(self.trace_path, "a")
+            self._trace_file.write(json.dumps(asdict(call), separators=(",", ":")) + "\n")
+            self._trace_file.flush()
+
+    def report(self, console=None):
+        from rich.console import Console
+        from rich.table import Table
+
+        console = console or Console()
+
+        calls = Table(title="LLM calls by call site")
+        columns = (
+            "call site", "calls", "p50 s", "p95 s", "mean s", "first token p50 s", "bytes sent", "mean prompt bytes",
+            "reusable prefix", "completion tokens", "cached tokens", "retries",
+        )
+        for column in columns:
+            calls.add_column(column)
+        for call_site, latency in self.latency.items():
+            records = [record for record in self.records if record.call_site == call_site]
+            prompt_bytes = sum(record.prompt_bytes for record in records)
+            prefix_bytes = sum(record.prefix_bytes for record in records)
+            prompt_tokens = sum(record.prompt_tokens for record in records)
+            cached_tokens = sum(record.cached_tokens for record in records)
+            # Streamed calls only, how long the player waited before text started to appear
+            first_tokens = sorted(record.time_to_first_token for record in records if record.time_to_first_token is not None)
+            calls.add_row(
+                call_site,
+                str(latency.count),
+                f"{latency.percentile(0.5):g}",
+                f"{latency.percentile(0.95):g}",
+                f"{latency.mean:.3f}",
+                f"{first_tokens[len(first_tokens) // 2]:.3f}" if first_tokens else "-",
+                str(prompt_bytes),
+                f"{self.prompt_bytes[call_site].mean:.0f}",
+                f"{prefix_bytes / prompt_bytes:.0%}" if prompt_bytes else "-",
+                str(sum(record.completion_tokens for record in records)),
+                f"{cached_tokens} ({cached_tokens / prompt_tokens:.0%})" if prompt_tokens else str(cached_tokens),
+                str(sum(record.validation_retries for record in records)),
+            )
+        console.print(calls)
+
+        turns = Table(title="Wall time per turn")
+        for column in ("turn", "wall s", "LLM s", "other s", "LLM time by call site"):
+            turns.add_column(column)
+        for turn, started in self.turn_started.items():
+            wall = self.turn_ended.get(turn, time.perf_counter()) - started
+            by_site: Dict[str, float] = {}
+            for record in self.records:
+                if record.turn == turn:
+                    by_site[record.call_site] = by_site.get(record.call_site, 0.0) + record.latency
+            llm = sum(by_site.values())
+            turns.add_row(
+                str(turn),
+                f"{wall:.2f}",
+                f"{llm:.2f}",
+                f"{max(0.0, wall - llm):.2f}",
+                ", ".join(f"{site} {seconds:.2f}" for site, seconds in by_site.items()),
+            )
+        console.print(turns)
+
+tracer = Tracer()
+
+def traced(call_site: str):
+    # Tags every LLM request made while the decorated function runs with `call_site`
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                token = _call_site.set(call_site)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    _call_site.reset(token)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            token = _call_site.set(call_site)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _call_site.reset(token)
+        return wrapper
+    return decorator
+
+def _on_completion(response):
+    call = _active_call.get()
+    if call is None:
+        return
+
+    call.attempts += 1
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    call.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+    call.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    call.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+def _on_parse_error(error):
+    note_retry()
+    call = _active_call.get()
+    if call is not None:
+        call.validation_retries += 1
+
+class InstrumentedClient:
+    # Wraps any client with the instructor `create` / `create_partial` interface, sync or async.
+    # Pass `factory` instead of `inner` to build the client (and import its SDK) on the first call.
+    def __init__(self, inner=None, tracer: Tracer = tracer, factory=None):
+        self.tracer = tracer
+        self._factory = factory
+        self._inner = None
+        self._lock = threading.Lock()
+        self._previous_messages: Dict[str, List[Dict[str, str]]] = {}
+        if inner is not None:
+            self._wrap(inner)
+
+    def _wrap(self, inner):
+        self.is_async = inspect.iscoroutinefunction(inner.create)
+        # Instructor clients report every raw completion (retries included) through hooks
+        if hasattr(inner, "on"):
+            inner.on("completion:response", _on_completion)
+            inner.on("parse:error", _on_parse_error)
+        self._inner = inner
+
+    @property
+    def inner(self):
+        if self._inner is None:
+            with self._lock:
+                if self._inner is None:
+                    self._wrap(self._factory())
+        return self._inner
+
+    def _start(self, response_model, messages, model, streamed: bool) -> CallRecord:
+        call_site = _call_site.get()
+        prefix_bytes = common_prefix_bytes(self._previous_messages.get(call_site), messages)
+        self._previous_messages[call_site] = messages
+        call = CallRecord(
+            call_site=call_site,
+            turn=_turn.get(),
+            model=model,
+            response_model=getattr(response_model, "__name__", str(response_model)),
+            streamed=streamed,
+            started=time.time(),
+            prompt_bytes=sum(len(str(message["content"]).encode()) for message in messages),
+            prefix_bytes=prefix_bytes,
+        )
+        _active_call.set(call)
+        return call
+
+    def _finish(self, call: CallRecord, started: float, error: Exception | None = None):
+        call.latency = time.perf_counter() - started
+        if error is not None:
+            call.error = repr(error)
+        _active_call.set(None)
+        self.tracer.record(call)
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        inner = self.inner
+        if self.is_async:
+            return self._create_async(response_model, messages, model, **kwargs)
+
+        call = self._start(response_model, messages, model, streamed=False)
+        started = time.perf_counter()
+        try:
+            response = inner.create(response_model=response_model, messages=messages, model=model, **kwargs)
+        except Exception as error:
+            self._finish(call, started, error)
+            raise
+        self._finish(call, started)
+        return response
+
+    async def _create_async(self, response_model, messages, model=None, **kwargs):
+        call = self._start(response_model, messages, model, streamed=False)
+        started = time.perf_counter()
+        try:
+            response = await self.inner.create(response_model=response_model, messages=messages, model=model, **kwargs)
+        except Exception as error:
+            self._finish(call, started, error)
+            raise
+        self._finish(call, started)
+        return response
+
+    def create_partial(self, response_model, messages, model=None, **kwargs):
+        self.inner
+        if self.is_async:
+            return self._create_partial_async(response_model, messages, model, **kwargs)
+        return self._create_partial(response_model, messages, model, **kwargs)
+
+    def _create_partial(self, response_model, messages, model=None, **kwargs):
+        call = self._start(response_model, messages, model, streamed=True)
+        started = time.perf_counter()
+        try:
+            for partial in self.inner.create_partial(response_model=response_model, messages=messages, model=model, **kwargs):
+                if call.time_to_first_token is None:
+                    call.time_to_first_token = time.perf_counter() - started
+                yield partial
+        except Exception as error:
+            self._finish(call, started, error)
+            raise
+        self._finish(call, started)
+
+    async def _create_partial_async(self, response_model, messages, model=None, **kwargs):
+        call = self._start(response_model, messages, model, streamed=True)
+        started = time.perf_counter()
+        try:
+            async for partial in self.inner.create_partial(response_model=response_model, messages=messages, model=model, **kwargs):
+                if call.time_to_first_token is None:
+                    call.time_to_first_token = time.perf_counter() - started
+                yield partial
+        except Exception as error:
+            self._finish(call, started, error)
+            raise
+        self._finish(call, started)
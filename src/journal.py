@@ -0,0 +1,220 @@
+import json
+import mmap
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Iterator, List, NamedTuple
+
+from src.entities import Action, Scenario
+from src.history import HistoryManager
+
+# Saves a game as an append-only log, one JSON record per line, so it can be resumed after a crash
+# or `quit` without calling the LLM again:
+#   {"t":"init","n":0,"scenario":{...}}           the initialized scenario, written once
+#   {"t":"act","n":1,"a":{...},"r":14}            an applied action and its dice roll
+#   {"t":"turn","n":2}                            `Scenario.next_turn`
+#   {"t":"snap","n":50,"scenario":{...},"history":{...}}   full state, so resuming replays little
+#   {"t":"end","n":51,"result":"win"}
+# Records are written and fsynced in groups: every `flush_every` records, at every turn (before the
+# game waits for a player) and on close. A crash loses at most the records of the current turn.
+
+JOURNAL_SUFFIX = ".jsonl"
+
+class SavedGame(NamedTuple):
+    path: Path
+    game_id: str
+    story: str
+    records: int
+    result: str | None
+    modified: float
+
+class Journal:
+    def __init__(self, path: str | Path, flush_every: int = 32, snapshot_every: int = 50):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.snapshot_every = snapshot_every
+        self.records = 0
+        self.fsyncs = 0
+        self._since_snapshot = 0
+        self._pending: List[bytes] = []
+        self._file = None
+
+        if self.path.exists():
+            self.records, complete_bytes = _scan_tail(self.path)
+            # Drop a record that was only partly written when the game stopped
+            if complete_bytes != self.path.stat().st_size:
+                os.truncate(self.path, complete_bytes)
+
+    @classmethod
+    def create(cls, directory: str | Path, scenario: Scenario, **kwargs) -> "Journal":
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        game_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        journal = cls(directory / f"{game_id}{JOURNAL_SUFFIX}", **kwargs)
+        journal._append({"t": "init", "scenario": scenario.model_dump(mode="json")})
+        journal.flush()
+        return journal
+
+    def attach(self, scenario: Scenario):
+        # Closures rather than bound methods so copies of the scenario don't deep copy the journal
+        def on_action(action: Action, roll: int):
+            self._append({"t": "act", "a": action.model_dump(mode="json", exclude_defaults=True), "r": roll})
+
+        def on_turn():
+            self._append({"t": "turn"})
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every:
+                self.snapshot(scenario)
+            self.flush()
+
+        scenario.add_action_listener(on_action)
+        scenario.add_turn_listener(on_turn)
+
+    def snapshot(self, scenario: Scenario):
+        record = {"t": "snap", "scenario": scenario.model_dump(mode="json")}
+        if scenario.history:
+            record["history"] = scenario.history.state()
+        self._append(record)
+        self._since_snapshot = 0
+
+    def end(self, result: str):
+        self._append({"t": "end", "result": result})
+        self.close()
+
+    def _append(self, record: dict):
+        # "t" first, so records of one type can be found in the raw bytes
+        line = json.dumps({"t": record.pop("t"), "n": self.records, **record}, separators=(",", ":"))
+        self._pending.append(line.encode() + b"\n")
+        self.records += 1
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(b"".join(self._pending))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending.clear()
+        self.fsyncs += 1
+
+    def close(self):
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+def _scan_tail(path: Path) -> tuple[int, int]:
+    # (records, bytes up to the end of the last complete record)
+    with _mapped(path) as data:
+        if data is None:
+            return 0, 0
+        last, end = _last_record(data)
+        return (last["n"] + 1 if last else 0), end
+
+def _last_record(data: mmap.mmap) -> tuple[dict | None, int]:
+    # The last complete record and the offset just past it
+    end = data.rfind(b"\n") + 1
+    if not end:
+        return None, 0
+    start = data.rfind(b"\n", 0, end - 1) + 1
+    return json.loads(data[start:end]), end
+
+class _mapped:
+    # Read-only memory map of a file, None for an empty file which can't be mapped
+    def __init__(self, path: Path):
+        self.file = open(path, "rb")
+        self.data = None
+
+    def __enter__(self) -> mmap.mmap | None:
+        if os.fstat(self.file.fileno()).st_size:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.data
+
+    def __exit__(self, *exc_info):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+def _records(data: mmap.mmap, start: int) -> Iterator[dict]:
+    # Complete records from `start` on, a trailing partial record is ignored
+    while True:
+        end = data.find(b"\n", start)
+        if end < 0:
+            return
+        yield json.loads(data[start:end])
+        start = end + 1
+
+def _restore_scenario(data: dict) -> Scenario:
+    # Play can take health below 0 and the defensive bonus above the limits of the fields, which are
+    # meant for generated scenarios. Those two are set after validation.
+    entities = data["player_characters"] + data["monsters"]
+    combat_stats = [(entity.pop("health"), entity.pop("defensive_bonus")) for entity in entities]
+    scenario = Scenario.model_validate(data)
+    for entity, (health, defensive_bonus) in zip(scenario.player_characters + scenario.monsters, combat_stats):
+        entity.health = health
+        entity.defensive_bonus = defensive_bonus
+    scenario.mark_dirty()
+    return scenario
+
+def load_game(path: str | Path, history: HistoryManager | None = None) -> Scenario:
+    # Rebuilds the scenario from the last snapshot (or the initial scenario) and the records after it
+    with _mapped(Path(path)) as data:
+        if data is None:
+            raise ValueError(f"{path} is empty")
+
+        _, end = _last_record(data)
+        snapshot_at = data.rfind(b'\n{"t":"snap"', 0, end) + 1
+        first = next(_records(data, snapshot_at))
+        scenario = _restore_scenario(first["scenario"])
+        scenario.configure_history(history)
+        if history and "history" in first:
+            history.restore(first["history"])
+
+        for record in _records(data, snapshot_at):
+            if record["t"] == "act":
+                scenario.apply_action(Action.model_validate(record["a"]), record["r"])
+            elif record["t"] == "turn":
+                scenario.next_turn()
+    return scenario
+
+def list_games(directory: str | Path) -> List[SavedGame]:
+    # Only the first and the last record of every file are read
+    games = []
+    for path in sorted(Path(directory).glob(f"*{JOURNAL_SUFFIX}")):
+        with _mapped(path) as data:
+            if data is None:
+                continue
+            last, _ = _last_record(data)
+            if last is None:
+                continue
+            init = json.loads(data[:data.find(b"\n")])
+        games.append(SavedGame(
+            path=path,
+            game_id=path.stem,
+            story=init["scenario"]["location_and_story_description"],
+            records=last["n"] + 1,
+            result=last.get("result"),
+            modified=path.stat().st_mtime,
+        ))
+    return games
+
+def find_game(directory: str | Path, game: str) -> Path:
+    # `game` is a path, a game id or the start of one
+    if Path(game).exists():
+        return Path(game)
+    matches = [saved.path for saved in list_games(directory) if saved.game_id.startswith(game)]
+    if len(matches) != 1:
+        raise ValueError(f"{len(matches)} saved games match {game!r}")
+    return matches[0]
+
+if __name__ == "__main__":
+    from src.settings import SAVE_DIRECTORY
+
+    for saved in list_games(sys.argv[1] if len(sys.argv) > 1 else SAVE_DIRECTORY):
+        status = saved.result or "in progress"
+        print(f"{saved.game_id}  {saved.records:5d} records  {status:11}  {saved.story[:60]}")
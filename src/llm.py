@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from pydantic import BaseModel
+
+from src.entities import (
+    Action,
+    ActionPhase,
+    ActionType,
+    GameEntity,
+    MonsterTurns,
+    Narration,
+    ResolvedTurn,
+    Scenario,
+    ScenarioDescription,
+    Trait,
+)
+
+# The game talks to the LLM through a client with instructor's `create` / `create_partial`
+# interface. `make_client` picks the backend from ADVENTURE_LLM_BACKEND:
+#   live   - instructor patched OpenAI client (default)
+#   record - live, and every request/response pair is written to a cassette
+#   replay - answers only from a cassette, no network access
+#   fake   - rule based stand-in that needs neither network nor cassette
+
+BACKEND_ENV = "ADVENTURE_LLM_BACKEND"
+CASSETTE_ENV = "ADVENTURE_CASSETTE"
+FAKE_LATENCY_ENV = "ADVENTURE_FAKE_LATENCY"
+DEFAULT_CASSETTE = "cassettes/game.jsonl"
+
+class CassetteMiss(KeyError):
+    pass
+
+def uses_cassette(backend: str | None = None) -> bool:
+    # Record and replay need every call of a game made by the game itself, in the order it makes them
+    return (backend or os.getenv(BACKEND_ENV, "live")) in ("record", "replay")
+
+def request_key(model: str | None, response_model: Any, messages: List[Dict[str, str]]) -> str:
+    # Whitespace differences in the prompts don't make a different request
+    normalized = {
+        "model": model,
+        "response_model": getattr(response_model, "__name__", str(response_model)),
+        "messages": [
+            {"role": message["role"], "content": " ".join(str(message["content"]).split())}
+            for message in messages
+        ],
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()[:32]
+
+def dump_response(response: Any) -> Any:
+    if isinstance(response, BaseModel):
+        return response.model_dump(mode="json")
+    return response
+
+def load_response(response_model: Any, data: Any) -> Any:
+    if isinstance(response_model, type) and issubclass(response_model, BaseModel):
+        return response_model.model_validate(data)
+    return data
+
+class Cassette:
+    # One JSON object per line: {"key": <request hash>, "response": <response as JSON>}. The same
+    # request can be recorded more than once, e.g. `generate_scenario` until a scenario is balanced;
+    # replay answers its n-th occurrence with the n-th recording and repeats the last one after that.
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.responses: Dict[str, List[Any]] = {}
+        self._served: Dict[str, int] = {}
+        if self.path.exists():
+            with self.path.open() as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.responses.setdefault(entry["key"], []).append(entry["response"])
+
+    def get(self, key: str) -> Any:
+        if key not in self.responses:
+            raise CassetteMiss(f"No recorded response for request {key} in {self.path}")
+        recorded = self.responses[key]
+        served = self._served.get(key, 0)
+        self._served[key] = served + 1
+        return recorded[min(served, len(recorded) - 1)]
+
+    def record(self, key: str, response: Any):
+        data = dump_response(response)
+        self.responses.setdefault(key, []).append(data)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as file:
+            file.write(json.dumps({"key": key, "response": data}, separators=(",", ":")) + "\n")
+
+class RecordingBackend:
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        response = self.inner.create(response_model=response_model, messages=messages, model=model, **kwargs)
+        self.cassette.record(request_key(model, response_model, messages), response)
+        return response
+
+    def create_partial(self, response_model, messages, model=None, **kwargs) -> Iterator:
+        partial = None
+        for partial in self.inner.create_partial(response_model=response_model, messages=messages, model=model, **kwargs):
+            yield partial
+        self.cassette.record(request_key(model, response_model, messages), partial)
+
+class ReplayBackend:
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        return load_response(response_model, self.cassette.get(request_key(model, response_model, messages)))
+
+    def create_partial(self, response_model, messages, model=None, **kwargs) -> Iterator:
+        yield self.create(response_model, messages, model, **kwargs)
+
+class FakeBackend:
+    # Deterministic offline stand-in. It answers from the prompts alone: the acting entity and its
+    # foes are read from the `game_roll` message, everything else is canned text.
+    def __init__(self, seed: int | None = 0):
+        self.rng = random.Random(seed)
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        if response_model is Scenario:
+            return self._scenario()
+        if response_model is ActionPhase:
+            return self._action_phase(messages)
+        if response_model is MonsterTurns:
+            return self._monster_turns(messages)
+        if response_model is ResolvedTurn:
+            return self._resolved_turn(messages)
+        if response_model is ScenarioDescription:
+            return ScenarioDescription(
+                story="The fight goes on. Both sides circle each other, looking for an opening.",
+                possible_actions=["Attack", "Defend"],
+            )
+        if response_model is Narration:
+            return Narration(text="The action lands and the battle shifts.")
+        if response_model is str:
+            return "The action lands and the battle shifts."
+        raise TypeError(f"The fake backend can't produce {getattr(response_model, '__name__', response_model)!r}")
+
+    def create_partial(self, response_model, messages, model=None, **kwargs) -> Iterator:
+        yield self.create(response_model, messages, model, **kwargs)
+
+    def _scenario(self) -> Scenario:
+        return Scenario(
+            location_and_story_description="A damp cave lit by a single torch. Something large breathes in the dark.",
+            player_characters=[
+                GameEntity(
+                    entity_id=1,
+                    name="Aria",
+                    strength=self.rng.randint(8, 14),
+                    dexterity=self.rng.randint(8, 14),
+                    intelligence=self.rng.randint(8, 14),
+                    traits=[Trait.BRAVE, Trait.MAGICAL],
+                )
+            ],
+            monsters=[
+                GameEntity(
+                    entity_id=2,
+                    name="Grimjaw",
+                    strength=self.rng.randint(8, 14),
+                    dexterity=self.rng.randint(6, 12),
+                    intelligence=self.rng.randint(4, 8),
+                    traits=[Trait.AGGRESSIVE],
+                )
+            ],
+        )
+
+    def _monster_turns(self, messages) -> MonsterTurns:
+        request = messages[-1]["content"]
+        phases = []
+        for monster_id, foes in re.findall(r"\(ID (\d+)\) acts\..*Possible foes: .*?\(ID (\d+)\)", request):
+            action = Action(type=ActionType.ATTACK, source_entity_id=int(monster_id), target_entity_id=int(foes))
+            action.description = "Lunged at its foe."
+            phases.append(ActionPhase(actions=[action]))
+        return MonsterTurns(phases=phases, narration="The monsters lunge forward together.")
+
+    def _resolved_turn(self, messages) -> ResolvedTurn:
+        action_phase = self._action_phase(messages)
+        if action_phase.is_question:
+            return ResolvedTurn(action_phase=action_phase)
+        return ResolvedTurn(
+            action_phase=action_phase,
+            narration="The action is under way.",
+            weak="{source} barely manages, {amount} against {target}.",
+            solid="{source} gets {amount} against {target}, who is at {health} health.",
+            strong="{source} gets a full {amount} against {target}, who is at {health} health.",
+            defeated="{target} falls.",
+        )
+
+    def _action_phase(self, messages) -> ActionPhase:
+        request = messages[-1]["content"]
+        source_match = re.search(r"My Entity ID is (\d+)", request)
+        choice_match = re.search(r"I chose to: (.*)", request)
+        source_id = int(source_match.group(1)) if source_match else 0
+        choice = choice_match.group(1).strip() if choice_match else ""
+
+        if choice.endswith("?"):
+            return ActionPhase(is_question=True, question_for_ai=choice)
+
+        foes_match = re.search(r"My Possible foes are: (.*)", request)
+        foes = re.findall(r"(.+?) \(ID (\d+)\)(?:, |$)", foes_match.group(1)) if foes_match else []
+        target_id = next((int(foe_id) for name, foe_id in foes if name.lower() in choice.lower()), None)
+        if target_id is None:
+            target_id = int(foes[0][1]) if foes else source_id
+
+        lowered = choice.lower()
+        if "heal" in lowered:
+            action = Action(type=ActionType.HEAL, source_entity_id=source_id, target_entity_id=source_id)
+        elif "defend" in lowered:
+            action = Action(type=ActionType.DEFEND, source_entity_id=source_id, target_entity_id=target_id)
+        else:
+            action = Action(type=ActionType.ATTACK, source_entity_id=source_id, target_entity_id=target_id)
+        action.description = f"Chose to {choice or 'attack'}."
+        return ActionPhase(actions=[action])
+
+class AsyncRecordingBackend:
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def create(self, response_model, messages, model=None, **kwargs):
+        response = await self.inner.create(response_model=response_model, messages=messages, model=model, **kwargs)
+        self.cassette.record(request_key(model, response_model, messages), response)
+        return response
+
+    async def create_partial(self, response_model, messages, model=None, **kwargs):
+        partial = None
+        async for partial in self.inner.create_partial(response_model=response_model, messages=messages, model=model, **kwargs):
+            yield partial
+        self.cassette.record(request_key(model, response_model, messages), partial)
+
+class AsyncAdapter:
+    # Async interface for the backends that never block (replay and fake). `latency` seconds are
+    # awaited per call to simulate the model, e.g. for load tests.
+    def __init__(self, inner, latency: float = 0.0):
+        self.inner = inner
+        self.latency = latency
+
+    async def create(self, response_model, messages, model=None, **kwargs):
+        if self.latency:
+            await _sleep(self.latency)
+        return self.inner.create(response_model, messages, model, **kwargs)
+
+    async def create_partial(self, response_model, messages, model=None, **kwargs):
+        if self.latency:
+            await _sleep(self.latency)
+        for partial in self.inner.create_partial(response_model, messages, model, **kwargs):
+            yield partial
+
+async def _sleep(seconds: float):
+    # asyncio is only imported by the async game, not by everything that imports this module
+    import asyncio
+
+    await asyncio.sleep(seconds)
+
+def live_client(use_async: bool = False, max_connections: int | None = None):
+    import instructor
+    from openai import AsyncOpenAI, OpenAI
+
+    if not use_async:
+        # Patch the OpenAI client
+        return instructor.from_openai(OpenAI())
+
+    if max_connections is None:
+        return instructor.from_openai(AsyncOpenAI())
+
+    # One connection pool shared by every coroutine using the client
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return instructor.from_openai(AsyncOpenAI(http_client=DefaultAsyncHttpxClient(limits=limits)))
+
+def make_client(
+    backend: str | None = None,
+    cassette_path: str | None = None,
+    use_async: bool = False,
+    seed: int | None = 0,
+    max_connections: int | None = None,
+    fake_latency: float | None = None,
+):
+    backend = backend or os.getenv(BACKEND_ENV, "live")
+    cassette_path = cassette_path or os.getenv(CASSETTE_ENV, DEFAULT_CASSETTE)
+    if fake_latency is None:
+        fake_latency = float(os.getenv(FAKE_LATENCY_ENV, "0"))
+
+    if backend == "live":
+        return live_client(use_async, max_connections)
+    if backend == "record":
+        recording_backend = AsyncRecordingBackend if use_async else RecordingBackend
+        return recording_backend(live_client(use_async, max_connections), Cassette(cassette_path))
+    if backend == "replay":
+        client = ReplayBackend(Cassette(cassette_path))
+    elif backend == "fake":
+        client = FakeBackend(seed)
+    else:
+        raise ValueError(f"Unknown LLM backend {backend!r}, expected live, record, replay or fake")
+    return AsyncAdapter(client, fake_latency) if use_async else client
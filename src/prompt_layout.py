@@ -0,0 +1,53 @@
+from typing import Dict, List
+
+from src.history import BYTES_PER_TOKEN
+
+# Keeps the start of every prompt identical from one call to the next, so the provider's prompt
+# cache can reuse it. A snapshot of the scenario is written out once and after it only the new
+# `action_history` entries are appended, instead of re-sending the whole state every turn. Once the
+# appended entries grow past `rebase_bytes` a fresh snapshot is taken, which costs one cache miss.
+# Prompts only use the layout while the stable start is at least `min_prefix_tokens` long, the
+# smallest prompt the provider caches.
+#
+# There is one snapshot per scenario encoding in use, all taken at the same point of the history.
+# The first call site with another encoding takes all of them again.
+
+class PromptLayout:
+    def __init__(self, rebase_bytes: int = 4000, min_prefix_tokens: int = 0):
+        self.rebase_bytes = rebase_bytes
+        self.min_prefix_bytes = min_prefix_tokens * BYTES_PER_TOKEN
+        # encoding -> the scenario written in it
+        self.snapshots: Dict[str, str] = {}
+        # Bytes sent before the snapshot, the same for every encoding
+        self.overhead_bytes = 0
+        self.rebases = 0
+        # Index into `action_history` of the first entry that isn't part of the snapshots
+        self.history_start = 0
+        self._counted = 0
+        self._delta_bytes = 0
+
+    def rebase(self, snapshots: Dict[str, str], history_length: int, overhead_bytes: int = 0):
+        self.snapshots = snapshots
+        self.overhead_bytes = overhead_bytes
+        self.history_start = history_length
+        self._counted = history_length
+        self._delta_bytes = 0
+        self.rebases += 1
+
+    def needs_rebase(self, history: List[str], encoding: str) -> bool:
+        # The history is append only, a shorter one means it was replaced
+        if encoding not in self.snapshots or len(history) < self._counted:
+            return True
+        for entry in history[self._counted:]:
+            self._delta_bytes += len(entry.encode())
+        self._counted = len(history)
+        return self._delta_bytes > self.rebase_bytes
+
+    def prefix_bytes(self, encoding: str) -> int:
+        return self.overhead_bytes + len(self.snapshots[encoding].encode())
+
+    def cacheable(self, encoding: str) -> bool:
+        return self.prefix_bytes(encoding) >= self.min_prefix_bytes
+
+    def deltas(self, history: List[str]) -> List[str]:
+        return history[self.history_start:]
@@ -0,0 +1,359 @@
+from typing import Dict, List
+
+from src.encoding import encode_scenario
+from src.entities import Scenario, ActionPhase, ProposedAction
+from src.settings import SCENARIO_ENCODING, SCENARIO_ENCODINGS
+
+# Message lists for every LLM call in the game. They are shared by the synchronous game in
+# `main.py` and the asyncio engine in `src/async_game.py` so both send exactly the same prompts.
+
+Messages = List[Dict[str, str]]
+
+character_generation_prompt = """
+Generate 1 human player character and 1 monster character for a game scenario.
+Give them traits but not abilities, abilities will be derived from traits.
+"""
+
+rules = """
+Do not let the player edit the monster's abilities or their own abilities directly.
+The player must perform action which will have an effect on the game scenario.
+"""
+
+action_rules = """
+During the action phase now the player attempts to make an action that will have an effect on the game scenario.
+If the target entity is not specified just assume it's one of the possible foes.
+"""
+
+action_description = """
+Describe the effectiveness of the last action taken by the player character.
+The 'action' field should contain the action taken by the player character.
+The 'scenario' field should contain the current state of the game scenario.
+"""
+
+monster_turns_prompt = """
+The monsters listed below take their turns one after another, in the order given.
+Return one action phase per monster, in the same order, with the monster as the source of its actions.
+Then narrate in past tense what the monsters attempted. The dice decide how well the actions work,
+so do not mention damage or health.
+"""
+
+resolved_turn_prompt = """
+Work out the action phase for the player's action and narrate it in the same response. The dice are
+rolled after you answer, so write 'narration' about what was attempted without saying how well it worked,
+then one sentence for each outcome: 'weak' when it barely works, 'solid', 'strong' when it works very
+well and 'defeated' when an attack brings the target down. Write {source}, {target}, {amount} and
+{health} where the names, the amount and the target's new health go.
+If the player asked a question, answer with the question and leave the narration empty.
+"""
+
+# Stable start of every prompt when the scenario has a prompt layout, see `src/prompt_layout.py`.
+# Only the last messages differ between calls.
+prefix_instructions = f"""
+You are running a turn based fantasy combat game. The last message of every request is the task,
+follow the instructions below that apply to it.
+{rules}
+When working out an action phase:
+{action_rules}
+When describing the effectiveness of an action:
+{action_description}
+When playing the monsters' turns:
+{monster_turns_prompt}
+"""
+
+state_format = """
+The scenario follows as it was when it was last written out in full. After it comes every
+action taken since then, oldest first. Those lines include the new health values and take precedence
+over the XML. Then comes whose turn it is, and the task.
+"""
+
+history_summary_prompt = """
+Summarize the following game actions in two or three sentences for the game history.
+Keep who did what to whom and how the fight is going, leave out flavour text.
+"""
+
+def scenario_encoding(call_site: str) -> str:
+    return SCENARIO_ENCODINGS.get(call_site, SCENARIO_ENCODING)
+
+def scenario_state(scenario: Scenario, call_site: str) -> str:
+    return encode_scenario(scenario, scenario_encoding(call_site))
+
+def uses_prefix_layout(scenario: Scenario, call_site: str) -> bool:
+    # Takes the snapshots when they are due, then checks the stable start is long enough to be cached
+    layout = scenario.prompt_layout
+    if layout is None:
+        return False
+    encoding = scenario_encoding(call_site)
+    if layout.needs_rebase(scenario.action_history, encoding):
+        snapshots = {name: encode_scenario(scenario, name) for name in {*layout.snapshots, encoding}}
+        overhead_bytes = len(prefix_instructions.encode()) + len(state_format.encode())
+        layout.rebase(snapshots, len(scenario.action_history), overhead_bytes)
+    return layout.cacheable(encoding)
+
+def prefix_cached_messages(scenario: Scenario, call_site: str, task: Messages) -> Messages:
+    layout = scenario.prompt_layout
+
+    current_entity_id = scenario.turn_order[scenario.current_turn] if scenario.turn_order else None
+    current_entity = scenario._find_entity_by_id(current_entity_id)
+    current_entity_name = current_entity.name if current_entity else "Unknown Entity"
+
+    return [
+        {
+            "role": "system",
+            "content": prefix_instructions,
+        },
+        {
+            "role": "system",
+            "content": state_format,
+        },
+        {
+            "role": "system",
+            "content": f"The game scenario is:\n{layout.snapshots[scenario_encoding(call_site)]}",
+        },
+        {
+            "role": "system",
+            "content": "Actions since then, oldest first:" + "".join(f"\n{delta}" for delta in layout.deltas(scenario.action_history)),
+        },
+        {
+            "role": "system",
+            "content": f"It is {current_entity_name}'s turn (ID {current_entity_id}).",
+        },
+        *task,
+    ]
+
+def generate_scenario_messages() -> Messages:
+    return [
+        {
+            "role": "system",
+            "content": character_generation_prompt,
+        }
+    ]
+
+def action_explained(scenario: Scenario, player_action: ProposedAction) -> str:
+    action_explained = f"""
+    My Entity ID is {player_action.source_entity_id}
+    I have chosen to: {player_action.player_input}
+    """
+
+    is_player_character = scenario.is_player_character(player_action.source_entity_id)
+    game_entity = scenario._find_entity_by_id(player_action.source_entity_id)
+    possible_foes = scenario.monsters if is_player_character else scenario.player_characters
+    possible_friendlies = [character for character in (scenario.player_characters if is_player_character else scenario.monsters) if character.entity_id != player_action.source_entity_id]
+
+    if is_player_character:
+        action_explained += "I am a player character.\n"
+    else:
+        action_explained += "I am a monster.\n"
+
+    action_explained += f"My Possible foes are: {', '.join(f'{foe.name} (ID {foe.entity_id})' for foe in possible_foes)}\n"
+    action_explained += f"My Possible abilities are: {', '.join(ability.value for ability in game_entity.abilities)}\n"
+    action_explained += f"My Possible friendlies are: {', '.join(f'{friendly.name} (ID {friendly.entity_id})' for friendly in possible_friendlies)}\n"
+    action_explained += f"I chose to: {player_action.player_input}"
+    return action_explained
+
+def game_roll_messages(scenario: Scenario, player_action: ProposedAction) -> Messages:
+    current_state = f"The current state of the game scenario is: {scenario_state(scenario, 'game_roll')}"
+    action = action_explained(scenario, player_action)
+
+    if uses_prefix_layout(scenario, "game_roll"):
+        return prefix_cached_messages(scenario, "game_roll", [{"role": "user", "content": action}])
+
+    return [
+        {
+            "role": "system",
+            "content": rules,
+        },
+        {
+            "role": "system",
+            "content": action_rules,
+        },
+        {
+            "role": "system",
+            "content": current_state,
+        },
+        {
+            "role": "user",
+            "content": action,
+        }
+    ]
+
+def resolved_turn_messages(scenario: Scenario, player_action: ProposedAction) -> Messages:
+    # `game_roll` and the narration in one request, the instructions go before the player's action
+    action = action_explained(scenario, player_action)
+
+    if uses_prefix_layout(scenario, "resolved_turn"):
+        return prefix_cached_messages(scenario, "resolved_turn", [
+            {
+                "role": "system",
+                "content": resolved_turn_prompt,
+            },
+            {
+                "role": "user",
+                "content": action,
+            },
+        ])
+
+    return [
+        {
+            "role": "system",
+            "content": rules,
+        },
+        {
+            "role": "system",
+            "content": action_rules,
+        },
+        {
+            "role": "system",
+            "content": f"The current state of the game scenario is: {scenario_state(scenario, 'resolved_turn')}",
+        },
+        {
+            "role": "system",
+            "content": resolved_turn_prompt,
+        },
+        {
+            "role": "user",
+            "content": action,
+        }
+    ]
+
+def monster_turns_messages(scenario: Scenario, monster_ids: List[int]) -> Messages:
+    monster_turns = ""
+    for monster_id in monster_ids:
+        monster = scenario._find_entity_by_id(monster_id)
+        monster_turns += f"Monster {monster.name} (ID {monster_id}) acts. "
+        monster_turns += f"Abilities: {', '.join(ability.value for ability in monster.abilities)}. "
+        monster_turns += f"Possible foes: {', '.join(f'{foe.name} (ID {foe.entity_id})' for foe in scenario.player_characters)}\n"
+
+    if uses_prefix_layout(scenario, "monster_turns"):
+        return prefix_cached_messages(scenario, "monster_turns", [{"role": "user", "content": f"Play the monsters' turns:\n{monster_turns}"}])
+
+    return [
+        {
+            "role": "system",
+            "content": rules,
+        },
+        {
+            "role": "system",
+            "content": f"The current state of the game scenario is: {scenario_state(scenario, 'monster_turns')}",
+        },
+        {
+            "role": "system",
+            "content": monster_turns_prompt,
+        },
+        {
+            "role": "user",
+            "content": monster_turns,
+        }
+    ]
+
+def effectiveness_messages(scenario: Scenario, action: ActionPhase) -> Messages:
+    if uses_prefix_layout(scenario, "describe_effectiveness_of_action"):
+        return prefix_cached_messages(scenario, "describe_effectiveness_of_action", [
+            {
+                "role": "system",
+                "content": f"Describe the effectiveness of the action taken by the player character: {action.to_xml()}",
+            }
+        ])
+
+    return [
+        {
+            "role": "system",
+            "content": action_description,
+        },
+        {
+            "role": "system",
+            "content": f"The current state of the scenario is:\n{scenario_state(scenario, 'describe_effectiveness_of_action')}",
+        },
+        {
+            "role": "system",
+            "content": f"The action taken by the player character is: {action.to_xml()}",
+        }
+    ]
+
+def describe_scenario_messages(current_entity_id: int, scenario: Scenario, be_brief=True) -> Messages:
+    current_entity = scenario._find_entity_by_id(current_entity_id)
+    current_entity_name = current_entity.name if current_entity else "Unknown Entity"
+
+    is_monster_entity = scenario.is_monster(current_entity_id)
+
+    player_character_description = f"""
+    Describe the current state of the game scenario for {current_entity_name} in a story format.
+    Make sure to include history of the actions taken so far, especially describing the most previous actions.
+    The 'possible_actions' field should contain a list of possible actions that can be taken by
+    the current entity only based on the current entities 'abilities'.
+    Make sure to describe the current foes and friendlies of the entity.
+    """
+
+    monster_description = f"""
+    Describe the current state of the game scenario in past tense explaining what {current_entity_name} just did.
+    Make sure to include history of the actions taken so far, especially describing the most previous actions.
+    Make sure to describe the current foes and friendlies of the entity.
+    """
+
+    messages = [
+        {
+            "role": "system",
+            "content": player_character_description if not is_monster_entity else monster_description,
+        }
+    ]
+    if be_brief or is_monster_entity:
+        messages.append(
+            {
+                "role": "system",
+                "content": "Be as brief as possible. You do not need to describe the entire setting again as it has already been explained previously.",
+            }
+        )
+
+    if is_monster_entity:
+        last_action = scenario.action_history[-1] if scenario.action_history else "No actions taken yet."
+        messages.append(
+            {
+                "role": "system",
+                "content": f"Focus on describing last action taken by the monster and its effects on the game: `{last_action}`.\n",
+            }
+        )
+
+    if uses_prefix_layout(scenario, "describe_scenario"):
+        return prefix_cached_messages(scenario, "describe_scenario", messages)
+    return [
+        {
+            "role": "system",
+            "content": f"The current state of the scenario is:\n{scenario_state(scenario, 'describe_scenario')}",
+        },
+        *messages,
+    ]
+
+def answer_question_messages(scenario: Scenario, question: str) -> Messages:
+    question_prompt = f"""
+    Answer the following question based on the current game scenario:
+    {question}
+    """
+
+    if uses_prefix_layout(scenario, "answer_question"):
+        return prefix_cached_messages(scenario, "answer_question", [{"role": "system", "content": question_prompt}])
+
+    return [
+        {
+            "role": "system",
+            "content": f"The current state of the scenario is:\n{scenario_state(scenario, 'answer_question')}",
+        },
+        {
+            "role": "system",
+            "content": question_prompt,
+        }
+    ]
+
+def summarize_history_messages(previous_summary: str, actions: List[str]) -> Messages:
+    return [
+        {
+            "role": "system",
+            "content": history_summary_prompt,
+        },
+        {
+            "role": "system",
+            "content": f"The summary so far is: {previous_summary or 'Nothing happened yet.'}",
+        },
+        {
+            "role": "user",
+            "content": "\n".join(actions),
+        }
+    ]
@@ -0,0 +1,211 @@
+import contextlib
+import contextvars
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Type
+
+from annotated_types import Ge, Le
+
+if TYPE_CHECKING:
+    from src.entities import Scenario
+
+# Fixes LLM responses locally instead of sending the whole prompt again through an instructor retry.
+# While `repairing()` is active, the before-validators of `GameEntity` and `Action` call
+# `repair_entity` and `repair_action`, which:
+#   - clamp numbers to the field's limits and round fractions, e.g. strength 25 -> 20
+#   - match enum values regardless of case, e.g. "Attack" -> "attack", "brave" -> "Brave"
+#   - drop traits and abilities that don't exist, and abilities the acting entity doesn't have
+#   - snap unknown entity IDs to the nearest fitting entity in `turn_order`
+# Anything else still fails validation and instructor asks the model again. Outside `repairing()`
+# (journals, code building models) nothing is changed.
+
+class RepairStats:
+    def __init__(self):
+        # Kind of repair -> how often it was made
+        self.repairs: Dict[str, int] = {}
+        self.repaired_responses = 0
+        # Responses that would have failed validation without the repairs
+        self.retries_avoided = 0
+
+    def summary(self) -> str:
+        repairs = ", ".join(f"{kind} {count}" for kind, count in sorted(self.repairs.items())) or "none"
+        return f"Repaired {self.repaired_responses} responses ({repairs}), {self.retries_avoided} retries avoided"
+
+repair_stats = RepairStats()
+
+class RepairContext:
+    def __init__(self, scenario: "Scenario | None" = None, source_entity_id: int | None = None):
+        self.scenario = scenario
+        self.source_entity_id = source_entity_id
+        self.repairs: Dict[str, int] = {}
+        # Repairs of values that would have failed validation
+        self.blocking = 0
+        # More than one when a response failed validation despite the repairs and was asked for again
+        self.attempts = 1
+
+    def note(self, kind: str, blocking: bool):
+        self.repairs[kind] = self.repairs.get(kind, 0) + 1
+        self.blocking += blocking
+
+_context: contextvars.ContextVar[RepairContext | None] = contextvars.ContextVar("repair_context", default=None)
+
+def note_retry():
+    # Called from instructor's "parse:error" hook, see `src/instrumentation.py`
+    context = _context.get()
+    if context is not None:
+        context.attempts += 1
+
+@contextlib.contextmanager
+def repairing(scenario: "Scenario | None" = None, source_entity_id: int | None = None) -> Iterator[RepairContext]:
+    # Wrap the LLM call. Counted only if the call succeeds, a failed one was retried anyway.
+    context = RepairContext(scenario, source_entity_id)
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+
+    if context.repairs:
+        repair_stats.repaired_responses += 1
+        # Only when the repaired response was the first one, otherwise the retry happened anyway
+        repair_stats.retries_avoided += context.blocking > 0 and context.attempts == 1
+        for kind, count in context.repairs.items():
+            repair_stats.repairs[kind] = repair_stats.repairs.get(kind, 0) + count
+
+def _bounds(field) -> tuple[int | None, int | None]:
+    low = high = None
+    for constraint in field.metadata:
+        if isinstance(constraint, Ge):
+            low = constraint.ge
+        elif isinstance(constraint, Le):
+            high = constraint.le
+    return low, high
+
+def _clamp(model: Type, data: Dict[str, Any], context: RepairContext):
+    for name, field in model.model_fields.items():
+        value = data.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        low, high = _bounds(field)
+        if low is None and high is None:
+            continue
+
+        repaired = value
+        if isinstance(repaired, float) and not repaired.is_integer():
+            repaired = round(repaired)
+        if low is not None:
+            repaired = max(low, repaired)
+        if high is not None:
+            repaired = min(high, repaired)
+        if repaired != value:
+            data[name] = int(repaired)
+            context.note("clamped", blocking=True)
+
+def _match_enum(enum: Type[Enum], value: Any, context: RepairContext) -> Any:
+    # The enum value if `value` names one in a different case or by its member name, otherwise None
+    if not isinstance(value, str) or value in enum._value2member_map_:
+        return value
+    wanted = value.strip().lower().replace("_", " ")
+    for member in enum:
+        if wanted in (str(member.value).lower(), member.name.lower().replace("_", " ")):
+            context.note("enum_case", blocking=True)
+            return member.value
+    return None
+
+def _match_enums(enum: Type[Enum], values: List[Any], kind: str, context: RepairContext) -> List[Any]:
+    matched = []
+    for value in values:
+        member = _match_enum(enum, value, context)
+        if member is None:
+            context.note(kind, blocking=True)
+        else:
+            matched.append(member)
+    return matched
+
+def repair_entity(model: Type, data: Any) -> Any:
+    context = _context.get()
+    if context is None or not isinstance(data, dict):
+        return data
+    # Imported here, `src.entities` imports this module
+    from src.entities import Ability, Trait
+
+    data = dict(data)
+    _clamp(model, data, context)
+    if isinstance(data.get("traits"), list):
+        data["traits"] = _match_enums(Trait, data["traits"], "unknown_trait", context)
+    if isinstance(data.get("abilities"), list):
+        data["abilities"] = _match_enums(Ability, data["abilities"], "unknown_ability", context)
+    return data
+
+def _entity_id(value: Any) -> Any:
+    # IDs sometimes come back as strings, which pydantic would accept
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+def _nearest(scenario: "Scenario", source_id: int, candidates: List[int]) -> int | None:
+    # The first of `candidates` after the source in turn order, living entities first
+    if not candidates:
+        return None
+    order = scenario.turn_order or candidates
+    start = order.index(source_id) + 1 if source_id in order else 0
+    ordered = [order[(start + offset) % len(order)] for offset in range(len(order))]
+    ordered = [entity_id for entity_id in ordered if entity_id in candidates] + [entity_id for entity_id in candidates if entity_id not in order]
+    living = [entity_id for entity_id in ordered if scenario._find_entity_by_id(entity_id).health > 0]
+    return (living or ordered)[0]
+
+def repair_action(data: Any) -> Any:
+    context = _context.get()
+    if context is None or not isinstance(data, dict):
+        return data
+    # Imported here, `src.entities` imports this module
+    from src.entities import Ability, ActionKind, ActionType
+
+    data = dict(data)
+    if "type" in data:
+        data["type"] = _match_enum(ActionType, data["type"], context) or data["type"]
+    if "action_kind" in data:
+        action_kind = _match_enum(ActionKind, data["action_kind"], context)
+        if action_kind is None:
+            del data["action_kind"]
+            context.note("unknown_action_kind", blocking=True)
+        else:
+            data["action_kind"] = action_kind
+
+    if data.get("ability") is not None:
+        ability = _match_enum(Ability, data["ability"], context)
+        if ability is None:
+            context.note("unknown_ability", blocking=True)
+        data["ability"] = ability
+
+    scenario = context.scenario
+    if scenario is None:
+        return data
+
+    source = scenario._find_entity_by_id(_entity_id(data.get("source_entity_id")))
+    if source is None and context.source_entity_id is not None:
+        source = scenario._find_entity_by_id(context.source_entity_id)
+        context.note("unknown_source", blocking="source_entity_id" not in data)
+        data["source_entity_id"] = context.source_entity_id
+    if source is None:
+        return data
+
+    if data.get("ability") is not None and Ability(data["ability"]) not in source.abilities:
+        data["ability"] = None
+        context.note("ability_not_owned", blocking=False)
+
+    if scenario._find_entity_by_id(_entity_id(data.get("target_entity_id"))) is None:
+        is_player = scenario.is_player_character(source.entity_id)
+        friendlies = scenario.player_characters if is_player else scenario.monsters
+        foes = scenario.monsters if is_player else scenario.player_characters
+        action_type = data.get("type")
+        if action_type in (ActionType.MOVE, ActionType.MOVE.value):
+            candidates = [source.entity_id]
+        elif action_type in (ActionType.HEAL, ActionType.HEAL.value):
+            candidates = [entity.entity_id for entity in friendlies]
+        else:
+            candidates = [entity.entity_id for entity in foes]
+        target_id = _nearest(scenario, source.entity_id, candidates)
+        if target_id is not None:
+            context.note("unknown_target", blocking="target_entity_id" not in data)
+            data["target_entity_id"] = target_id
+    return data
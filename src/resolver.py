@@ -0,0 +1,110 @@
+from typing import Dict, List, Tuple
+
+from src.entities import Ability, Action, ActionKind, ActionPhase, ActionType, GameEntity, ProposedAction, Scenario
+
+# Resolves simple commands ("attack goblin", "defend", "cast spell at the dragon", the monsters'
+# fixed "Attack") straight into an ActionPhase so `game_roll` can skip the model. Anything that
+# isn't clearly one ability plus at most one entity name returns None and goes to the LLM.
+
+ABILITY_ACTIONS: Dict[Ability, Tuple[ActionType, ActionKind]] = {
+    Ability.ATTACK: (ActionType.ATTACK, ActionKind.STRENGTH),
+    Ability.BERSERK: (ActionType.ATTACK, ActionKind.STRENGTH),
+    Ability.BREATH_FIRE: (ActionType.ATTACK, ActionKind.STRENGTH),
+    Ability.SNEAK: (ActionType.ATTACK, ActionKind.DEXTERITY),
+    Ability.CAST_SPELL: (ActionType.ATTACK, ActionKind.INTELLIGENCE),
+    Ability.DEFEND: (ActionType.DEFEND, ActionKind.DEXTERITY),
+    Ability.HEAL: (ActionType.HEAL, ActionKind.INTELLIGENCE),
+    Ability.FLY: (ActionType.MOVE, ActionKind.DEXTERITY),
+}
+
+# Extra words players use for the abilities, on top of the ability names themselves
+ABILITY_ALIASES: Dict[str, Ability] = {
+    "hit": Ability.ATTACK,
+    "strike": Ability.ATTACK,
+    "block": Ability.DEFEND,
+    "guard": Ability.DEFEND,
+    "cast": Ability.CAST_SPELL,
+    "breathe fire": Ability.BREATH_FIRE,
+    "sneak attack": Ability.SNEAK,
+}
+
+FILLER_WORDS = {"at", "on", "the", "a", "an", "to", "against"}
+SELF_WORDS = {"me", "myself", "self"}
+
+class ResolverStats:
+    def __init__(self):
+        self.resolved_locally = 0
+        self.sent_to_llm = 0
+
+    def summary(self) -> str:
+        commands = self.resolved_locally + self.sent_to_llm
+        share = f" ({self.resolved_locally / commands:.0%})" if commands else ""
+        return f"Resolved {self.resolved_locally} of {commands} commands without the model{share}"
+
+resolver_stats = ResolverStats()
+
+def _verbs() -> List[Tuple[str, Ability]]:
+    verbs = [(ability.value.lower(), ability) for ability in Ability] + list(ABILITY_ALIASES.items())
+    # Longest first so "sneak attack" wins over "sneak"
+    return sorted(verbs, key=lambda verb: len(verb[0]), reverse=True)
+
+VERBS = _verbs()
+
+def _match_entity(text: str, candidates: List[GameEntity]) -> GameEntity | None:
+    exact = [entity for entity in candidates if entity.name.lower() == text]
+    if len(exact) == 1:
+        return exact[0]
+
+    # "goblin" for "Goblin King", but only if no other candidate shares the word
+    partial = [entity for entity in candidates if text in entity.name.lower().split() or entity.name.lower().startswith(text)]
+    return partial[0] if len(partial) == 1 else None
+
+def _weakest(entities: List[GameEntity]) -> GameEntity | None:
+    living = [entity for entity in entities if entity.health > 0]
+    return min(living, key=lambda entity: entity.health) if living else None
+
+def resolve_locally(scenario: Scenario, player_action: ProposedAction) -> ActionPhase | None:
+    text = " ".join(player_action.player_input.lower().strip(" .!").split())
+    source = scenario._find_entity_by_id(player_action.source_entity_id)
+    if not text or "?" in text or source is None:
+        resolver_stats.sent_to_llm += 1
+        return None
+
+    ability = None
+    for verb, candidate in VERBS:
+        if text == verb or text.startswith(verb + " "):
+            ability, text = candidate, text[len(verb):].strip()
+            break
+
+    words = [word for word in text.split() if word not in FILLER_WORDS]
+    if ability is None or ability not in source.abilities:
+        resolver_stats.sent_to_llm += 1
+        return None
+
+    action_type, action_kind = ABILITY_ACTIONS[ability]
+    is_player_character = scenario.is_player_character(source.entity_id)
+    foes = scenario.monsters if is_player_character else scenario.player_characters
+    friendlies = scenario.player_characters if is_player_character else scenario.monsters
+    target_text = " ".join(words)
+
+    if action_type == ActionType.HEAL:
+        target = source if not words or target_text in SELF_WORDS else _match_entity(target_text, friendlies)
+    elif action_type == ActionType.MOVE:
+        target = source if not words else None
+    else:
+        target = _weakest(foes) if not words else _match_entity(target_text, foes)
+
+    if target is None:
+        resolver_stats.sent_to_llm += 1
+        return None
+
+    resolver_stats.resolved_locally += 1
+    action = Action(
+        type=action_type,
+        ability=ability,
+        source_entity_id=source.entity_id,
+        target_entity_id=target.entity_id,
+        action_kind=action_kind,
+        description=f"{source.name} used {ability.value} on {target.name}.",
+    )
+    return ActionPhase(actions=[action])
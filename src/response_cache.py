@@ -0,0 +1,128 @@
+import hashlib
+import json
+import re
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from src.entities import Scenario
+from src.llm import dump_response, load_response
+
+# LRU cache for calls whose answer only depends on the scenario state and the request, such as
+# `answer_question` and `describe_scenario`. Keys combine the call site, `Scenario.state_hash()`
+# and the normalized request, so any state change makes old entries unreachable; `attach` also
+# evicts them as soon as the scenario applies an action.
+
+MISS = object()
+
+CONTRACTIONS = {
+    "what's": "what is",
+    "who's": "who is",
+    "where's": "where is",
+    "how's": "how is",
+    "i'm": "i am",
+    "it's": "it is",
+    "whats": "what is",
+}
+
+def normalize(text: str) -> str:
+    words = re.sub(r"[^\w\s']", " ", text.lower()).split()
+    return " ".join(CONTRACTIONS.get(word, word) for word in words)
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl: float | None = None, path: str | Path | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+        # key -> (state hash, time stored, response as JSON)
+        self._entries: OrderedDict[str, Tuple[str, float, Any]] = OrderedDict()
+        # id(scenario) -> state hash of its last lookup, the state `on_action` has to evict. Only
+        # attached scenarios are tracked and their entry goes away with them, see `attach`.
+        self._looked_up: Dict[int, str | None] = {}
+        self.open(path)
+
+    def open(self, path: str | Path | None):
+        # Persist to `path` from now on, loading what it already holds
+        self.path = Path(path) if path else None
+        if self.path and self.path.exists():
+            self.load()
+
+    def key(self, call_site: str, scenario: Scenario, *request) -> str:
+        state = scenario.state_hash()
+        if id(scenario) in self._looked_up:
+            self._looked_up[id(scenario)] = state
+        normalized = "\x1f".join(normalize(str(part)) for part in request)
+        return f"{call_site}:{state}:{hashlib.sha256(normalized.encode()).hexdigest()[:32]}"
+
+    def _expired(self, entry: Tuple[str, float, Any]) -> bool:
+        return self.ttl is not None and time.time() - entry[1] > self.ttl
+
+    def get(self, key: str, response_model: Any = str) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return MISS
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return load_response(response_model, entry[2])
+
+    def put(self, key: str, response: Any):
+        state = key.split(":", 2)[1]
+        self._entries[key] = (state, time.time(), dump_response(response))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def attach(self, scenario: Scenario):
+        # Tracks the state per scenario, so one cache can serve many games at once. A closure rather
+        # than a bound method so copies of the scenario don't deep copy the cache.
+        previous_state = scenario.state_hash()
+        self._looked_up[id(scenario)] = None
+        # Dropped as soon as the scenario is collected, before its id can be handed to another object
+        weakref.finalize(scenario, self._looked_up.pop, id(scenario), None)
+
+        def on_action(action, roll):
+            nonlocal previous_state
+            # The state after the previous action, and the one entries were looked up under since,
+            # which differs once `next_turn` has run
+            self.evict_state(previous_state)
+            self.evict_state(self._looked_up[id(scenario)])
+            self._looked_up[id(scenario)] = None
+            previous_state = scenario.state_hash()
+
+        scenario.add_action_listener(on_action)
+
+    def evict_state(self, state: str | None):
+        for key in [key for key, entry in self._entries.items() if entry[0] == state]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def load(self):
+        with self.path.open() as file:
+            entries = json.load(file)
+        for key, (state, stored, response) in entries.items():
+            if not self._expired((state, stored, response)):
+                self._entries[key] = (state, stored, response)
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w") as file:
+            json.dump({key: entry for key, entry in self._entries.items() if not self._expired(entry)}, file, separators=(",", ":"))
@@ -0,0 +1,87 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Tuple
+
+from src.instrumentation import CallRecord, Tracer, tracer
+from src.llm import uses_cassette
+from src.settings import DEFAULT_MODEL_TIER, MODEL_ROUTES, MODEL_TIERS
+
+# Picks the model for every LLM call by its call site, instead of one model for everything. A call site
+# prefers the tier of its route and moves on to the next faster tier while the p95 latency of its last
+# `window` calls on the preferred model is over the route's budget. The tracer reports every call as it
+# finishes, so only traced calls count. Every `probe_every` calls the samples of the preferred
+# model are dropped and it is measured again, so the route recovers once the model is fast again.
+# Under the record and replay backends every call site keeps its tier, the model is part of the
+# cassette key and has to be the same when the game is replayed.
+
+class Route(NamedTuple):
+    tier: str
+    latency_budget: float | None = None
+
+class Router:
+    def __init__(
+        self,
+        tiers: Dict[str, str],
+        routes: Dict[str, Tuple[str, float | None]],
+        default_tier: str,
+        tracer: Tracer = tracer,
+        window: int = 20,
+        min_samples: int = 5,
+        probe_every: int = 10,
+    ):
+        self.tiers: List[Tuple[str, str]] = list(tiers.items())
+        self.routes = {call_site: Route(*route) for call_site, route in routes.items()}
+        self.default = Route(default_tier)
+        for route in [self.default, *self.routes.values()]:
+            if route.tier not in tiers:
+                raise ValueError(f"Unknown model tier: {route.tier}")
+        self.tracer = tracer
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        # (call site, model) -> how often it was picked
+        self.picks: Dict[Tuple[str, str], int] = {}
+        self._latency: Dict[Tuple[str, str], Deque[float]] = {}
+        self._calls: Dict[str, int] = {}
+        # The scenario pool routes from its own threads
+        self._lock = threading.Lock()
+        tracer.add_listener(self._observe)
+
+    def _observe(self, record: CallRecord):
+        if record.model and record.error is None:
+            with self._lock:
+                self._latency.setdefault((record.call_site, record.model), deque(maxlen=self.window)).append(record.latency)
+
+    def p95(self, call_site: str, model: str) -> float | None:
+        samples = self._latency.get((call_site, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def model(self, call_site: str) -> str:
+        with self._lock:
+            route = self.routes.get(call_site, self.default)
+            start = next(index for index, (tier, _) in enumerate(self.tiers) if tier == route.tier)
+            calls = self._calls[call_site] = self._calls.get(call_site, 0) + 1
+
+            model = self.tiers[start][1]
+            if route.latency_budget is not None and not uses_cassette():
+                if not calls % self.probe_every:
+                    self._latency.pop((call_site, model), None)
+                for _, candidate in self.tiers[start:]:
+                    model = candidate
+                    p95 = self.p95(call_site, candidate)
+                    if p95 is None or p95 <= route.latency_budget:
+                        break
+            self.picks[(call_site, model)] = self.picks.get((call_site, model), 0) + 1
+            return model
+
+    def summary(self) -> str:
+        picks = ", ".join(f"{call_site} {model} {count}" for (call_site, model), count in sorted(self.picks.items()))
+        return f"Models: {picks or 'none'}"
+
+router = Router(MODEL_TIERS, MODEL_ROUTES, DEFAULT_MODEL_TIER)
+
+def route(call_site: str) -> str:
+    return router.model(call_site)
@@ -0,0 +1,161 @@
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List
+
+from pydantic import ValidationError
+
+from src.entities import Scenario
+
+# Generating the scenario is the slowest call of a game and the player waits for it before anything
+# happens. The pool generates scenarios ahead of time in background threads:
+#   - at most `size` scenarios are ready, stored or being generated, workers wait while it is full
+#   - at most `workers` generations run at the same time, a failed one is retried with a back-off
+#   - scenarios that aren't playable are thrown away
+#   - `close` writes the unused scenarios to `path`, one compact JSON document per line, and the
+#     next pool opened on it hands those out first
+# `take` returns a ready scenario right away when there is one.
+
+MAX_BACKOFF = 60.0
+
+def is_playable(scenario: Scenario) -> bool:
+    entities = scenario.player_characters + scenario.monsters
+    entity_ids = {entity.entity_id for entity in entities}
+    return (
+        bool(scenario.player_characters)
+        and bool(scenario.monsters)
+        and len(entity_ids) == len(entities)
+        and all(entity.health > 0 for entity in entities)
+    )
+
+class ScenarioPool:
+    def __init__(self, generate: Callable[[], Scenario], size: int = 2, workers: int = 1, path: str | Path | None = None):
+        self.generate = generate
+        self.size = size
+        self.workers = workers
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failed = 0
+        self._ready: Deque[Scenario] = deque()
+        # Scenarios from `path` as JSON, only validated when they are taken
+        self._stored: Deque[str] = deque()
+        self._in_flight = 0
+        self._backoff = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        if self.path and self.path.exists():
+            self._stored.extend(line for line in self.path.read_text().splitlines() if line)
+
+    def start(self) -> "ScenarioPool":
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"scenario-pool-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _full(self) -> bool:
+        return len(self._ready) + len(self._stored) + self._in_flight >= self.size
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._closed and self._full():
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._in_flight += 1
+
+            try:
+                scenario = self.generate()
+            except Exception:
+                scenario = None
+
+            with self._condition:
+                self._in_flight -= 1
+                if scenario is not None and is_playable(scenario):
+                    self.generated += 1
+                    self._backoff = 0.0
+                    if not self._closed:
+                        self._ready.append(scenario)
+                else:
+                    self.failed += 1
+                    self._backoff = min(MAX_BACKOFF, self._backoff * 2 or 1.0)
+                self._condition.notify_all()
+                if self._backoff:
+                    self._condition.wait_for(lambda: self._closed, self._backoff)
+
+    def take(self) -> Scenario:
+        # A ready scenario, then a stored one, then the one being generated, and otherwise a new one
+        # generated in the calling thread. Taking one lets the workers generate a replacement.
+        with self._condition:
+            while True:
+                if self._ready:
+                    self.hits += 1
+                    scenario = self._ready.popleft()
+                    self._condition.notify_all()
+                    return scenario
+
+                if self._stored:
+                    try:
+                        scenario = Scenario.model_validate_json(self._stored.popleft())
+                    except ValidationError:
+                        self.failed += 1
+                        continue
+                    self.disk_hits += 1
+                    self._save()
+                    self._condition.notify_all()
+                    return scenario
+
+                if not self._in_flight:
+                    self.misses += 1
+                    break
+                # The player waits either way, but for less than a new generation would take
+                self._condition.wait_for(lambda: self._ready or not self._in_flight)
+                if self._ready:
+                    self.misses += 1
+                    scenario = self._ready.popleft()
+                    self._condition.notify_all()
+                    return scenario
+
+        return self.generate()
+
+    def close(self):
+        # Workers stop, a generation that is still running is dropped
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._stored.extend(scenario.model_dump_json(exclude_defaults=True) for scenario in self._ready)
+            self._ready.clear()
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        if not self._stored:
+            self.path.unlink(missing_ok=True)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f"{self.path.name}.tmp")
+        temporary.write_text("".join(f"{line}\n" for line in self._stored))
+        os.replace(temporary, self.path)
+
+    @property
+    def hit_rate(self) -> float:
+        takes = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / takes if takes else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "failed": self.failed,
+            "ready": len(self._ready) + len(self._stored),
+            "hit_rate": self.hit_rate,
+        }
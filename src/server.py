@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Callable, Dict
+
+import src.async_game as async_game
+from src.async_game import game_calls, generate_balanced_scenario
+from src.entities import Scenario
+from src.instrumentation import tracer
+from src.settings import (
+    RESPONSE_CACHE_ENV,
+    SAVE_DIRECTORY,
+    SAVE_GAMES,
+    SERVER_COMMAND_BURST,
+    SERVER_COMMANDS_PER_SECOND,
+    SERVER_HOST,
+    SERVER_IDLE_TIMEOUT,
+    SERVER_MAX_CONCURRENT_TURNS,
+    SERVER_MAX_SESSIONS,
+    SERVER_PORT,
+)
+from src.turns import TurnEngine, make_history, new_game, prepare_game
+
+# Hosts many games in one process. Every connection is its own session with its own Scenario; the
+# LLM calls go through the shared client in `src.async_game`. Run it with `python -m src.server`.
+#
+# The protocol is line based. The client sends what the player types, one command per line, and
+# `quit` to leave. The server answers with tagged lines:
+#   say <text>    narration, one line of text
+#   ask           the server waits for the player's next command
+#   err <text>    the command was not processed, e.g. rate limited
+#   bye <reason>  the session is over (win, loss, quit, idle, full, error) and the connection closes
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[str], None]
+
+class TokenBucket:
+    # Allows `burst` commands at once, refilled at `rate` commands per second
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class GameSession:
+    # One game, driven by commands instead of a loop reading stdin. After `start` and every
+    # `handle` the game either waits for a player (`ask`) or is finished (`bye`).
+    def __init__(self, session_id: int, send: Send, turn_slots: asyncio.Semaphore):
+        self.session_id = session_id
+        self.send = send
+        self.turn_slots = turn_slots
+        self.engine: TurnEngine | None = None
+
+    @property
+    def scenario(self) -> Scenario | None:
+        return self.engine.scenario if self.engine else None
+
+    @property
+    def finished(self) -> bool:
+        return self.engine is not None and self.engine.finished
+
+    @property
+    def turns_played(self) -> int:
+        return self.engine.turns_played if self.engine else 0
+
+    def say(self, text: str, style: str | None = None):
+        for line in text.splitlines() or [""]:
+            self.send(f"say {line}")
+
+    async def start(self):
+        async with self.turn_slots:
+            scenario = await generate_balanced_scenario()
+            journal = new_game(scenario, make_history(), SAVE_DIRECTORY, SAVE_GAMES)
+            prepare_game(scenario, async_game.response_cache, journal, seed_offset=self.session_id)
+            # No console to stream to, and a speculative call would run outside the turn slots
+            calls = game_calls()._replace(stream_narration=False, speculate=None)
+            self.engine = TurnEngine(scenario, calls, self.say, journal)
+            await self._advance()
+
+    async def handle(self, player_input: str):
+        async with self.turn_slots:
+            if await self.engine.handle(player_input):
+                await self._advance()
+            else:
+                self.send("ask")
+
+    async def _advance(self):
+        if await self.engine.advance() is not None:
+            self.send("ask")
+        else:
+            self.send(f"bye {self.engine.result}")
+
+    def close(self):
+        # Saves what was played so far, a game left before it was over can be resumed with `main.py`
+        if self.engine:
+            self.engine.close()
+
+class SessionManager:
+    def __init__(
+        self,
+        max_sessions: int = SERVER_MAX_SESSIONS,
+        max_concurrent_turns: int = SERVER_MAX_CONCURRENT_TURNS,
+        idle_timeout: float | None = SERVER_IDLE_TIMEOUT,
+        commands_per_second: float | None = SERVER_COMMANDS_PER_SECOND,
+        command_burst: int = SERVER_COMMAND_BURST,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.commands_per_second = commands_per_second
+        self.command_burst = command_burst
+        # Waiters are woken in arrival order, so no session can starve the others of LLM calls
+        self.turn_slots = asyncio.Semaphore(max_concurrent_turns)
+        self.sessions: Dict[int, GameSession] = {}
+        self._session_ids = itertools.count(1)
+        self.sessions_started = 0
+        self.sessions_finished = 0
+        self.turns_played = 0
+
+    async def serve(self, host: str = SERVER_HOST, port: int = SERVER_PORT, unix_path: str | None = None) -> asyncio.Server:
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def send(line: str):
+            writer.write(line.encode() + b"\n")
+
+        if len(self.sessions) >= self.max_sessions:
+            send("bye full")
+            await self._close(writer)
+            return
+
+        session = GameSession(next(self._session_ids), send, self.turn_slots)
+        self.sessions[session.session_id] = session
+        self.sessions_started += 1
+        try:
+            await self._run(session, reader, writer, send)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Session %s failed", session.session_id)
+            send("bye error")
+        finally:
+            session.close()
+            del self.sessions[session.session_id]
+            self.sessions_finished += 1
+            self.turns_played += session.turns_played
+            await self._close(writer)
+
+    async def _run(self, session: GameSession, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, send: Send):
+        bucket = TokenBucket(self.commands_per_second, self.command_burst) if self.commands_per_second else None
+
+        await session.start()
+        await writer.drain()
+        while not session.finished:
+            try:
+                line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                send("bye idle")
+                return
+            if not line:
+                return
+
+            command = line.decode(errors="replace").strip()
+            if command == "quit":
+                send("bye quit")
+                return
+            if not command:
+                send("ask")
+            elif bucket and not bucket.take():
+                send("err rate limited, wait before sending another command")
+                send("ask")
+            else:
+                await session.handle(command)
+            await writer.drain()
+
+    async def _close(self, writer: asyncio.StreamWriter):
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def run_server(manager: SessionManager, host: str, port: int, unix_path: str | None = None):
+    server = await manager.serve(host, port, unix_path)
+    for socket in server.sockets:
+        print(f"Serving adventure games on {socket.getsockname()}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many adventure games over a line based socket protocol")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--unix", help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--max-sessions", type=int, default=SERVER_MAX_SESSIONS)
+    parser.add_argument("--max-concurrent-turns", type=int, default=SERVER_MAX_CONCURRENT_TURNS)
+    parser.add_argument("--idle-timeout", type=float, default=SERVER_IDLE_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    async_game.response_cache.open(os.getenv(RESPONSE_CACHE_ENV))
+    # Per call records would grow with every session, the histograms and the router's windows are enough
+    tracer.retain(0)
+    logging.basicConfig(level=logging.INFO)
+    manager = SessionManager(args.max_sessions, args.max_concurrent_turns, args.idle_timeout)
+    try:
+        asyncio.run(run_server(manager, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Models from the most capable to the fastest. Every call site uses the tier given in MODEL_ROUTES, or
+# DEFAULT_MODEL_TIER, together with a latency budget in seconds. While the p95 latency of its recent
+# calls is over the budget it moves on to the next faster tier, see `src/routing.py`. A budget of None
+# keeps the tier.
+MODEL_TIERS = {"large": "gpt-4o", "small": "gpt-4o-mini"}
+DEFAULT_MODEL_TIER = "large"
+MODEL_ROUTES = {
+    "generate_scenario": ("large", None),
+    "game_roll": ("large", 4.0),
+    "resolved_turn": ("large", 6.0),
+    "monster_turns": ("large", 6.0),
+    "describe_effectiveness_of_action": ("large", 4.0),
+    "describe_scenario": ("large", 8.0),
+    "answer_question": ("small", 4.0),
+    "summarize_history": ("small", None),
+}
+
+# Work out a player's free-form action and write its narration with one LLM call instead of two. The
+# narration has a line per outcome and the one matching the dice is printed, see `ResolvedTurn`.
+SINGLE_CALL_TURNS = True
+
+# Only the most recent actions are sent verbatim, older ones are folded into a summary
+HISTORY_KEEP_LAST = 8
+HISTORY_BUDGET_TOKENS = 1000
+SUMMARIZE_HISTORY_WITH_LLM = False
+
+# Print narration as it is generated instead of waiting for the whole completion
+STREAM_NARRATION = True
+
+# Set to an integer to make the dice rolls reproducible, e.g. when replaying a recorded game
+DICE_SEED_ENV = "ADVENTURE_SEED"
+
+# Every LLM call is traced, see `src/instrumentation.py`. Set ADVENTURE_TRACE to a path to also
+# write the calls as JSONL, and PRINT_CALL_REPORT to print a breakdown when the game ends.
+TRACE_ENV = "ADVENTURE_TRACE"
+PRINT_CALL_REPORT = False
+# The report keeps the last TRACE_MAX_RECORDS calls, the latency histograms cover all of them. The
+# server keeps none, see `src/server.py`.
+TRACE_MAX_RECORDS = 10_000
+
+# Resolve plain commands ("attack goblin", "defend") and monster turns without calling the model
+LOCAL_RESOLVER = True
+
+# How the scenario is written into prompts: "xml", "compact_xml", "json" or "table", see `src/encoding.py`.
+# SCENARIO_ENCODINGS overrides it per call site, e.g. {"answer_question": "table"}.
+SCENARIO_ENCODING = "compact_xml"
+SCENARIO_ENCODINGS = {}
+
+# Put the rules and a snapshot of the scenario first in every prompt and only append the actions taken
+# since, so provider side prompt caching can reuse the start. A new snapshot is taken once the appended
+# actions grow past PROMPT_REBASE_BYTES. Providers only cache prompts of PROMPT_CACHE_MIN_TOKENS and
+# more (1024 for OpenAI), below that the layout only makes prompts longer, so it stays unused until the
+# stable start is that long. Off by default, small scenarios never get there.
+PREFIX_CACHED_PROMPTS = False
+PROMPT_REBASE_BYTES = 4000
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Every game is saved as it is played, see `src/journal.py`. List the saved games with
+# `python -m src.journal`.
+SAVE_GAMES = True
+SAVE_DIRECTORY = "saves"
+JOURNAL_FLUSH_EVERY = 32
+JOURNAL_SNAPSHOT_EVERY = 50
+
+# Resolve and narrate all monsters between two player turns with one LLM call instead of two per monster
+BATCH_MONSTER_TURNS = True
+
+# `answer_question` and `describe_scenario` responses are reused while the scenario state is unchanged.
+# Set ADVENTURE_RESPONSE_CACHE to a path to keep them between games.
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = None
+RESPONSE_CACHE_ENV = "ADVENTURE_RESPONSE_CACHE"
+
+# Game server, see `src/server.py`. Every session shares one client and its connection pool,
+# turns wait for a free slot once SERVER_MAX_CONCURRENT_TURNS are running.
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_SESSIONS = 5000
+SERVER_MAX_CONCURRENT_TURNS = 256
+SERVER_IDLE_TIMEOUT = 300
+SERVER_COMMANDS_PER_SECOND = 1.0
+SERVER_COMMAND_BURST = 5
+HTTP_MAX_CONNECTIONS = 100
+
+# Scenarios are generated ahead of time by background workers, see `src/scenario_pool.py`. Up to
+# SCENARIO_POOL_SIZE are kept ready and whatever is unused when the game exits is stored in
+# SCENARIO_POOL_PATH for the next start.
+SCENARIO_POOL = True
+SCENARIO_POOL_SIZE = 2
+SCENARIO_POOL_WORKERS = 1
+SCENARIO_POOL_PATH = "cache/scenario_pool.jsonl"
+
+# New scenarios are played out BALANCE_ENCOUNTERS times by `src/simulator.py` before the game starts.
+# Up to BALANCE_ATTEMPTS scenarios are generated until the players win a share of the encounters
+# inside BALANCE_WIN_RATE, otherwise the closest one is played. 1 turns the check off.
+BALANCE_ATTEMPTS = 3
+BALANCE_ENCOUNTERS = 2000
+BALANCE_WIN_RATE = (0.3, 0.9)
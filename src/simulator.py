@@ -0,0 +1,264 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from src.entities import Ability, ActionKind, ActionType, GameEntity, Scenario
+from src.resolver import ABILITY_ACTIONS
+
+# Plays a scenario out many times at once to estimate who wins and how long it takes. The state is
+# one row per encounter and one column per entity, and the dice for all rows are drawn in one go.
+# The rules are those of `Scenario.apply_action`:
+#   amount = round(modifier / 10 * roll), clamped to 0..20
+#   attack - the target's defensive bonus absorbs damage and is used up, health can go below 0
+#   heal   - up to 100 health
+#   defend - adds to the acting entity's defensive bonus, up to 20
+# Entities act in `turn_order` from the current turn on, defeated ones are skipped. Tactics stand in
+# for the players and the LLM: attack the weakest living foe with the attack ability whose stat is
+# highest, defend with `defend_chance` and, if the entity can heal, heal itself below `heal_below`.
+
+ATTACK, DEFEND, HEAL = 0, 1, 2
+
+# Turns after which an encounter counts as unfinished
+MAX_TURNS = 2000
+# Encounters per process pool task. Fixed, so a seed gives the same results for any number of workers.
+CHUNK = 10_000
+
+PLAYERS_WIN, MONSTERS_WIN = 1, 2
+
+class Tactics(NamedTuple):
+    defend_chance: float = 0.0
+    heal_below: int = 0
+
+class Encounter(NamedTuple):
+    # Plain arrays, so it can be sent to worker processes
+    health: np.ndarray
+    defensive_bonus: np.ndarray
+    is_player: np.ndarray
+    can_heal: np.ndarray
+    # Amount for every entity, action (ATTACK, DEFEND, HEAL) and roll 0..20
+    amounts: np.ndarray
+    # Columns in the order they act, starting with the current turn
+    turn_order: np.ndarray
+
+class SimulationResult(NamedTuple):
+    encounters: int
+    player_wins: int
+    monster_wins: int
+    # Turns taken by every finished encounter
+    turns: np.ndarray
+
+    @property
+    def win_rate(self) -> float:
+        return self.player_wins / self.encounters if self.encounters else 0.0
+
+    @property
+    def unfinished(self) -> int:
+        return self.encounters - self.player_wins - self.monster_wins
+
+    def summary(self) -> Dict[str, float]:
+        p5, p50, p95 = np.percentile(self.turns, (5, 50, 95)) if self.turns.size else (0.0, 0.0, 0.0)
+        return {
+            "encounters": self.encounters,
+            "win_rate": self.win_rate,
+            "loss_rate": self.monster_wins / self.encounters if self.encounters else 0.0,
+            "unfinished": self.unfinished,
+            "turns_mean": float(self.turns.mean()) if self.turns.size else 0.0,
+            "turns_p5": float(p5),
+            "turns_p50": float(p50),
+            "turns_p95": float(p95),
+        }
+
+def _stat(entity: GameEntity, action_kind: ActionKind) -> int:
+    if action_kind == ActionKind.STRENGTH:
+        return entity.strength
+    if action_kind == ActionKind.DEXTERITY:
+        return entity.dexterity
+    return entity.intelligence
+
+def _amounts(modifier: int) -> List[int]:
+    # The same expression as `Scenario.apply_action`, so rounding (half to even) matches exactly
+    return [max(0, min(round((modifier / 10) * roll), 20)) for roll in range(21)]
+
+def _attack_kind(entity: GameEntity) -> ActionKind:
+    kinds = [ABILITY_ACTIONS[ability][1] for ability in entity.abilities if ABILITY_ACTIONS[ability][0] == ActionType.ATTACK]
+    return max(kinds or [ActionKind.STRENGTH], key=lambda action_kind: _stat(entity, action_kind))
+
+def encounter_from_scenario(scenario: Scenario) -> Encounter:
+    if not scenario.turn_order:
+        # A scenario straight from `generate_scenario`, without abilities and turn order yet
+        scenario = scenario.model_copy(deep=True)
+        scenario.initialize()
+
+    entities = [scenario._find_entity_by_id(entity.entity_id) for entity in scenario.player_characters + scenario.monsters]
+    columns = {entity.entity_id: column for column, entity in enumerate(entities)}
+    turn_order = [columns[entity_id] for entity_id in scenario.turn_order if entity_id in columns]
+    start = scenario.current_turn % len(turn_order)
+    return Encounter(
+        health=np.array([entity.health for entity in entities], dtype=np.int64),
+        defensive_bonus=np.array([entity.defensive_bonus for entity in entities], dtype=np.int64),
+        is_player=np.array([scenario.is_player_character(entity.entity_id) for entity in entities]),
+        can_heal=np.array([Ability.HEAL in entity.abilities for entity in entities]),
+        amounts=np.array([
+            [
+                _amounts(_stat(entity, _attack_kind(entity))),
+                _amounts(_stat(entity, ABILITY_ACTIONS[Ability.DEFEND][1])),
+                _amounts(_stat(entity, ABILITY_ACTIONS[Ability.HEAL][1])),
+            ]
+            for entity in entities
+        ], dtype=np.int64),
+        turn_order=np.array(turn_order[start:] + turn_order[:start], dtype=np.int64),
+    )
+
+def _side_alive(health: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    return (health[:, columns] > 0).any(axis=1)
+
+def simulate_encounters(
+    encounter: Encounter,
+    encounters: int,
+    player_tactics: Tactics,
+    monster_tactics: Tactics,
+    seed: np.random.SeedSequence | int | None = None,
+    max_turns: int = MAX_TURNS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (winner, turns) per encounter, the winner is PLAYERS_WIN, MONSTERS_WIN or 0 if unfinished
+    rng = np.random.default_rng(seed)
+    health = np.tile(encounter.health, (encounters, 1))
+    defensive_bonus = np.tile(encounter.defensive_bonus, (encounters, 1))
+    player_columns = np.flatnonzero(encounter.is_player)
+    monster_columns = np.flatnonzero(~encounter.is_player)
+    no_target = np.iinfo(health.dtype).max
+
+    winner = np.zeros(encounters, dtype=np.int8)
+    winner[~_side_alive(health, monster_columns)] = PLAYERS_WIN
+    winner[~_side_alive(health, player_columns)] = MONSTERS_WIN
+    turns = np.zeros(encounters, dtype=np.int64)
+
+    for step in range(max_turns):
+        column = encounter.turn_order[step % len(encounter.turn_order)]
+        rows = np.flatnonzero((winner == 0) & (health[:, column] > 0))
+        if not rows.size:
+            if not (winner == 0).any():
+                break
+            continue
+
+        is_player = encounter.is_player[column]
+        tactics = player_tactics if is_player else monster_tactics
+        turns[rows] += 1
+        rolls = rng.integers(1, 21, size=rows.size)
+        actions = np.full(rows.size, ATTACK)
+        if tactics.defend_chance:
+            actions[rng.random(rows.size) < tactics.defend_chance] = DEFEND
+        if tactics.heal_below and encounter.can_heal[column]:
+            actions[health[rows, column] < tactics.heal_below] = HEAL
+        amounts = encounter.amounts[column, actions, rolls]
+
+        healing = actions == HEAL
+        if healing.any():
+            healed = rows[healing]
+            health[healed, column] = np.minimum(100, health[healed, column] + amounts[healing])
+
+        defending = actions == DEFEND
+        if defending.any():
+            defended = rows[defending]
+            defensive_bonus[defended, column] = np.minimum(20, defensive_bonus[defended, column] + amounts[defending])
+
+        attacking = actions == ATTACK
+        if attacking.any():
+            attackers = rows[attacking]
+            foe_columns = monster_columns if is_player else player_columns
+            foe_health = health[attackers][:, foe_columns]
+            targets = foe_columns[np.where(foe_health > 0, foe_health, no_target).argmin(axis=1)]
+
+            bonus = defensive_bonus[attackers, targets]
+            damage = np.where(bonus > 0, np.maximum(0, amounts[attacking] - bonus), amounts[attacking])
+            defensive_bonus[attackers, targets] = 0
+            health[attackers, targets] -= damage
+
+            defeated = attackers[~_side_alive(health[attackers], foe_columns)]
+            winner[defeated] = PLAYERS_WIN if is_player else MONSTERS_WIN
+
+    return winner, turns
+
+def _simulate_chunk(args) -> Tuple[np.ndarray, np.ndarray]:
+    return simulate_encounters(*args)
+
+def simulate(
+    scenario: Scenario,
+    encounters: int = 10_000,
+    player_tactics: Tactics = Tactics(),
+    monster_tactics: Tactics = Tactics(),
+    workers: int = 1,
+    seed: int | None = None,
+    max_turns: int = MAX_TURNS,
+) -> SimulationResult:
+    encounter = encounter_from_scenario(scenario)
+    sizes = [CHUNK] * (encounters // CHUNK) + ([encounters % CHUNK] if encounters % CHUNK else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(encounter, size, player_tactics, monster_tactics, chunk_seed, max_turns) for size, chunk_seed in zip(sizes, seeds)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+            chunks = list(executor.map(_simulate_chunk, tasks))
+    else:
+        chunks = [_simulate_chunk(task) for task in tasks]
+
+    winner = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.zeros(0, dtype=np.int8)
+    turns = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+    return SimulationResult(
+        encounters=encounters,
+        player_wins=int((winner == PLAYERS_WIN).sum()),
+        monster_wins=int((winner == MONSTERS_WIN).sum()),
+        turns=turns[winner != 0],
+    )
+
+def imbalance(scenario: Scenario, win_rate_range: Tuple[float, float], encounters: int = 2000, seed: int | None = 0) -> float:
+    # How far the players' win rate is outside `win_rate_range`, 0 for a balanced scenario
+    low, high = win_rate_range
+    win_rate = simulate(scenario, encounters, seed=seed).win_rate
+    return max(low - win_rate, win_rate - high, 0.0)
+
+def turn_histogram(turns: np.ndarray, buckets: int = 10, width: int = 40) -> List[str]:
+    if not turns.size:
+        return []
+    counts, edges = np.histogram(turns, bins=min(buckets, int(turns.max() - turns.min()) + 1))
+    return [
+        f"{edges[index]:6.0f}-{edges[index + 1]:<6.0f} {'#' * round(width * count / counts.max()):{width}} {count}"
+        for index, count in enumerate(counts)
+    ]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Estimate win rates by playing a scenario out many times")
+    parser.add_argument("game", nargs="?", help="A saved game, from its current turn. A new scenario is generated without it.")
+    parser.add_argument("--encounters", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--defend-chance", type=float, default=0.0, help="Chance that an entity defends instead of attacking")
+    parser.add_argument("--heal-below", type=int, default=0, help="Entities that can heal do so below this health")
+    args = parser.parse_args(argv)
+
+    if args.game:
+        from src.journal import find_game, load_game
+        from src.settings import SAVE_DIRECTORY
+
+        scenario = load_game(find_game(SAVE_DIRECTORY, args.game))
+    else:
+        from src.llm import make_client
+        from src.prompts import generate_scenario_messages
+        from src.routing import route
+
+        scenario = make_client().create(model=route("generate_scenario"), response_model=Scenario, messages=generate_scenario_messages())
+
+    tactics = Tactics(args.defend_chance, args.heal_below)
+    result = simulate(scenario, args.encounters, tactics, tactics, args.workers, args.seed)
+    for name, value in result.summary().items():
+        print(f"{name:12} {value:.4g}")
+    for line in turn_histogram(result.turns):
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
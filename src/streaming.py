@@ -0,0 +1,65 @@
+from typing import AsyncIterable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+class _LazyConsole:
+    # The rich console, imported and created on first use so importing the game stays fast
+    def __init__(self):
+        self._console = None
+
+    def __getattr__(self, name):
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console()
+        return getattr(self._console, name)
+
+console = _LazyConsole()
+
+def print(*objects, **kwargs):
+    # `rich.print`, markup and all
+    console.print(*objects, **kwargs)
+
+class EmptyStream(Exception):
+    # The stream ended before a single partial response arrived
+    pass
+
+class _TextRenderer:
+    # Prints the part of `field` that wasn't printed yet each time a new partial response arrives.
+    # Time to first token is recorded by the tracer, see `src/instrumentation.py`.
+    def __init__(self, field: str, style: str | None):
+        self.field = field
+        self.style = style
+        self.printed = ""
+
+    def update(self, partial):
+        text = getattr(partial, self.field, None) or ""
+        if len(text) <= len(self.printed):
+            return
+
+        console.print(text[len(self.printed):], end="", style=self.style, markup=False, highlight=False)
+        self.printed = text
+
+    def finish(self, label: str, final):
+        if final is None:
+            raise EmptyStream(f"The {label} stream ended without a response")
+        console.print("\n")
+
+def render_stream(label: str, partials: Iterable[T], field: str, style: str | None = None) -> T:
+    # Consume a `create_partial` stream, rendering `field` as it grows, and return the final object
+    renderer = _TextRenderer(field, style)
+    final = None
+    for partial in partials:
+        renderer.update(partial)
+        final = partial
+    renderer.finish(label, final)
+    return final
+
+async def render_stream_async(label: str, partials: AsyncIterable[T], field: str, style: str | None = None) -> T:
+    renderer = _TextRenderer(field, style)
+    final = None
+    async for partial in partials:
+        renderer.update(partial)
+        final = partial
+    renderer.finish(label, final)
+    return final
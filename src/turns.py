@@ -0,0 +1,235 @@
+import inspect
+import os
+from typing import Any, Callable, NamedTuple, Tuple
+
+from src.entities import ProposedAction, Scenario
+from src.history import HistoryManager
+from src.instrumentation import tracer
+from src.journal import Journal, find_game, load_game
+from src.prompt_layout import PromptLayout
+from src.response_cache import ResponseCache
+from src.settings import (
+    DICE_SEED_ENV,
+    HISTORY_BUDGET_TOKENS,
+    HISTORY_KEEP_LAST,
+    JOURNAL_FLUSH_EVERY,
+    JOURNAL_SNAPSHOT_EVERY,
+    PREFIX_CACHED_PROMPTS,
+    PROMPT_CACHE_MIN_TOKENS,
+    PROMPT_REBASE_BYTES,
+)
+from src.streaming import console
+
+# The rules of a game turn, shared by the console game in `main.py`, the async one in
+# `src/async_game.py` and the sessions of `src/server.py`. Each passes its own LLM calls as
+# `GameCalls`, plain functions or coroutine functions. With plain functions nothing is ever awaited
+# for real, so `run_sync` drives the engine without an event loop.
+
+# Prints or sends one piece of narration, with a rich style name or None
+Say = Callable[[str, str | None], None]
+
+class GameCalls(NamedTuple):
+    play_action: Callable
+    answer_question: Callable
+    describe_scenario: Callable
+    describe_effectiveness_of_action: Callable
+    game_roll: Callable
+    resolve_monster_turns: Callable
+    # Print while the text is generated, only used with `stream_narration`
+    stream_scenario: Callable | None = None
+    stream_effectiveness_of_action: Callable | None = None
+    # Starts the next entity's description early, see `SpeculativeDescription` in `src/async_game.py`
+    speculate: Callable | None = None
+    stream_narration: bool = False
+    batch_monster_turns: bool = False
+
+def run_sync(coroutine) -> Any:
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("A blocking game awaited something, its calls must be plain functions")
+
+async def _call(function: Callable, *args, **kwargs) -> Any:
+    result = function(*args, **kwargs)
+    return await result if inspect.isawaitable(result) else result
+
+def console_say(text: str, style: str | None = None):
+    console.print(f"{text}\n", style=style, markup=False)
+
+def make_history(summarizer: Callable[[str, list], str] | None = None) -> HistoryManager:
+    return HistoryManager(keep_last=HISTORY_KEEP_LAST, budget_tokens=HISTORY_BUDGET_TOKENS, summarizer=summarizer)
+
+def is_over(scenario: Scenario) -> bool:
+    return scenario.all_monsters_defeated() or scenario.all_player_characters_defeated()
+
+def resume_game(resume: str, history: HistoryManager, save_directory: str, save_games: bool) -> Tuple[Scenario, Journal | None]:
+    # Rebuilt from the saved game, no LLM calls needed. A finished game isn't written to again.
+    save_path = find_game(save_directory, resume)
+    scenario = load_game(save_path, history)
+    if not save_games or is_over(scenario):
+        return scenario, None
+    return scenario, Journal(save_path, JOURNAL_FLUSH_EVERY, JOURNAL_SNAPSHOT_EVERY)
+
+def new_game(scenario: Scenario, history: HistoryManager, save_directory: str, save_games: bool) -> Journal | None:
+    scenario.initialize()
+    scenario.configure_history(history)
+    if not save_games:
+        return None
+    return Journal.create(save_directory, scenario, flush_every=JOURNAL_FLUSH_EVERY, snapshot_every=JOURNAL_SNAPSHOT_EVERY)
+
+def prepare_game(scenario: Scenario, response_cache: ResponseCache, journal: Journal | None = None, seed_offset: int = 0):
+    # Everything a new or resumed game needs before its first turn
+    if journal:
+        journal.attach(scenario)
+    if PREFIX_CACHED_PROMPTS:
+        scenario.configure_prompt_layout(PromptLayout(PROMPT_REBASE_BYTES, PROMPT_CACHE_MIN_TOKENS))
+    if seed := os.getenv(DICE_SEED_ENV):
+        scenario.seed_dice(int(seed) + seed_offset)
+    response_cache.attach(scenario)
+
+class TurnEngine:
+    # One game. `advance` plays until a player has to act, `handle` plays that player's command and
+    # `play` is the whole game for a console. `result` is "win", "loss" or "quit" once it is over.
+    def __init__(self, scenario: Scenario, calls: GameCalls, say: Say = console_say, journal: Journal | None = None):
+        self.scenario = scenario
+        self.calls = calls
+        self.say = say
+        self.journal = journal
+        self.turn_number = 0
+        self.turns_played = 0
+        self.result: str | None = None
+        self._speculation = None
+
+    @property
+    def finished(self) -> bool:
+        return self.result is not None
+
+    async def play(self, read_input: Callable[[str], Any]) -> str:
+        while await self.advance() is not None:
+            command = await _call(read_input, "What would you like to do? ")
+            if command == "quit":
+                self.say("Game over!", "bold red")
+                self.finish("quit")
+                break
+            await self.handle(command)
+        return self.result
+
+    async def advance(self) -> int | None:
+        # The ID of the player who has to act, or None once the game is over. Monsters act in between.
+        scenario = self.scenario
+        while not self.finished:
+            tracer.start_turn(self.turn_number)
+            current_entity_id = scenario.turn_order[scenario.current_turn]
+            current_entity = scenario._find_entity_by_id(current_entity_id)
+            self.say(f"🎲 It's {current_entity.name}'s turn!", None)
+
+            if scenario.is_player_character(current_entity_id):
+                await self._describe_scenario(current_entity_id)
+                return current_entity_id
+
+            if self.calls.batch_monster_turns:
+                await self._play_monster_turns()
+            else:
+                await self._play_monster_turn(current_entity_id)
+            self._end_turn()
+        return None
+
+    async def handle(self, player_input: str) -> bool:
+        # False when the player asked a question and still has to act
+        scenario = self.scenario
+        calls = self.calls
+        current_entity_id = scenario.turn_order[scenario.current_turn]
+        player_action = ProposedAction(player_input=player_input, source_entity_id=current_entity_id)
+        resolved_turn = await _call(calls.play_action, scenario, player_action)
+        player_action_phase = resolved_turn.action_phase
+
+        if player_action_phase.is_question and player_action_phase.question_for_ai:
+            self.say(await _call(calls.answer_question, scenario, player_action_phase.question_for_ai), "green")
+            return False
+
+        outcomes = [scenario.apply_action(action) for action in player_action_phase.actions]
+
+        # The next entity's description doesn't depend on the narration, start it now
+        self._speculate()
+        if resolved_turn.has_narration:
+            self.say(resolved_turn.narrate(outcomes), "green")
+        elif calls.stream_narration and calls.stream_effectiveness_of_action:
+            await _call(calls.stream_effectiveness_of_action, scenario, player_action_phase)
+        else:
+            self.say(await _call(calls.describe_effectiveness_of_action, scenario, player_action_phase), "green")
+        self._end_turn()
+        return True
+
+    def finish(self, result: str):
+        self.result = result
+        if self.journal and result in ("win", "loss"):
+            self.journal.end(result)
+        self.close()
+
+    def close(self):
+        if self._speculation:
+            self._speculation.discard()
+            self._speculation = None
+        if self.journal:
+            self.journal.close()
+
+    async def _describe_scenario(self, entity_id: int):
+        scenario = self.scenario
+        calls = self.calls
+        be_brief = self.turn_number == 0
+        speculation, self._speculation = self._speculation, None
+        scenario_description = await speculation.take(entity_id, scenario) if speculation else None
+        if scenario_description:
+            self.say(scenario_description.story, None)
+        elif calls.stream_narration and calls.stream_scenario:
+            await _call(calls.stream_scenario, entity_id, scenario, be_brief=be_brief)
+        else:
+            scenario_description = await _call(calls.describe_scenario, entity_id, scenario, be_brief=be_brief)
+            self.say(scenario_description.story, None)
+
+    async def _play_monster_turns(self):
+        scenario = self.scenario
+        monster_ids = scenario.upcoming_monster_ids()
+        monster_turns = await _call(self.calls.resolve_monster_turns, scenario, monster_ids)
+        results = scenario.apply_monster_turns(monster_ids, monster_turns)
+        self.say("\n".join([monster_turns.narration, *results]), "red")
+        self.turn_number += len(monster_ids) - 1
+
+    async def _play_monster_turn(self, monster_id: int):
+        # Simple AI or automated actions for monsters
+        # TODO: Implement a more sophisticated AI for monsters
+        scenario = self.scenario
+        calls = self.calls
+        monster_action = ProposedAction(player_input="Attack", source_entity_id=monster_id)
+        monster_action_phase = await _call(calls.game_roll, scenario, monster_action)
+        for action in monster_action_phase.actions:
+            scenario.apply_action(action)
+
+        self._speculate()
+        if calls.stream_narration and calls.stream_scenario:
+            await _call(calls.stream_scenario, monster_id, scenario, style="red")
+        else:
+            self.say((await _call(calls.describe_scenario, monster_id, scenario)).story, "red")
+
+    def _speculate(self):
+        if not self.calls.speculate:
+            return
+        if self._speculation:
+            self._speculation.discard()
+        self._speculation = self.calls.speculate(self.scenario)
+
+    def _end_turn(self):
+        # Check for win/loss conditions
+        scenario = self.scenario
+        self.turns_played += 1
+        if scenario.all_monsters_defeated():
+            self.say("All monsters defeated! You win!", None)
+            self.finish("win")
+        elif scenario.all_player_characters_defeated():
+            self.say("All player characters defeated! Game over!", None)
+            self.finish("loss")
+        else:
+            self.turn_number += 1
+            scenario.next_turn()
@@ -1,8 +1,28 @@
 from pydantic import BaseModel
-import xmltodict
+
+# xmltodict pulls in xml.sax and urllib, so it is imported on first use to keep startup fast
+
+def xml_fragment(key: str, value, depth: int = 0) -> str:
+    # Render `{key: value}` exactly as it would appear nested `depth` levels deep in a pretty
+    # printed document. Wrapping in placeholder parents (instead of re-indenting the output)
+    # keeps multi-line text content untouched.
+    import xmltodict
+
+    wrapped = {key: value}
+    for level in range(depth):
+        wrapped = {f"_{level}": wrapped}
+
+    xml_str = xmltodict.unparse(wrapped, full_document=False, pretty=True)
+    if not depth:
+        return xml_str
+
+    lines = xml_str.split("\n")
+    return "\n".join(lines[depth:-depth])
 
 class BaseModelWithXML(BaseModel):
     def to_xml(self) -> str:
+        import xmltodict
+
         def convert_list_to_dict(d):
             for key, value in d.items():
                 if isinstance(value, list):
@@ -11,7 +31,7 @@ class BaseModelWithXML(BaseModel):
                     convert_list_to_dict(value)
 
         # Convert the model to a dictionary
-        model_dict = {self.__class__.__name__: self.dict()}
+        model_dict = {self.__class__.__name__: self.model_dump()}
         
         # Convert lists in the dictionary to a format that xmltodict can handle as single tags
         convert_list_to_dict(model_dict[self.__class__.__name__])
@@ -0,0 +1,9 @@
+import pytest
+
+from src.entities import Scenario
+
+from tests.helpers import build_scenario
+
+@pytest.fixture
+def scenario() -> Scenario:
+    return build_scenario()
@@ -0,0 +1,17 @@
+from src.entities import GameEntity, Scenario, Trait
+
+def build_scenario(players: int = 1, monsters: int = 1, seed: int | None = 0) -> Scenario:
+    scenario = Scenario(
+        location_and_story_description="A damp cave lit by a single torch.",
+        player_characters=[
+            GameEntity(entity_id=index + 1, name=f"Hero {index}", strength=12, traits=[Trait.MAGICAL])
+            for index in range(players)
+        ],
+        monsters=[
+            GameEntity(entity_id=1000 + index, name=f"Orc {index}", strength=10, traits=[Trait.AGGRESSIVE])
+            for index in range(monsters)
+        ],
+    )
+    scenario.initialize()
+    scenario.seed_dice(seed)
+    return scenario
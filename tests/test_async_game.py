@@ -0,0 +1,92 @@
+import asyncio
+import builtins
+
+import pytest
+
+import src.async_game as async_game
+from src.instrumentation import InstrumentedClient
+from src.llm import AsyncAdapter, FakeBackend
+from src.response_cache import ResponseCache
+
+from tests.helpers import build_scenario
+
+@pytest.fixture
+def fake_client(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ADVENTURE_SEED", "0")
+    monkeypatch.setattr(async_game, "client", InstrumentedClient(AsyncAdapter(FakeBackend())))
+    monkeypatch.setattr(async_game, "response_cache", ResponseCache())
+    return async_game.client
+
+def test_game_plays_to_the_end(fake_client, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(builtins, "input", lambda prompt="": "attack")
+    asyncio.run(async_game.async_game_loop())
+
+    output = capsys.readouterr().out
+    assert "You win!" in output or "Game over!" in output
+    assert list((tmp_path / "saves").iterdir())
+
+def test_batched_monster_turns_describe_the_next_turn_directly(fake_client, monkeypatch):
+    # Nothing runs between the batched monster turns and the next description, so nothing to overlap
+    monster_started = []
+    monkeypatch.setattr(async_game, "BATCH_MONSTER_TURNS", True)
+    monkeypatch.setattr(
+        async_game.SpeculativeDescription,
+        "start",
+        classmethod(lambda cls, scenario: monster_started.append(scenario.is_monster(scenario.turn_order[scenario.current_turn]))),
+    )
+    monkeypatch.setattr(builtins, "input", lambda prompt="": "attack")
+    asyncio.run(async_game.async_game_loop())
+
+    assert monster_started and not any(monster_started)
+
+def test_speculative_description_is_used_when_the_state_matches(fake_client):
+    scenario = build_scenario(players=2, monsters=1)
+
+    async def play():
+        speculation = async_game.SpeculativeDescription.start(scenario)
+        assert speculation is not None
+        scenario.next_turn()
+        return await speculation.take(scenario.turn_order[scenario.current_turn], scenario)
+
+    assert asyncio.run(play()).story
+
+def test_speculative_description_is_discarded_when_the_state_changed(fake_client):
+    scenario = build_scenario(players=2, monsters=1)
+
+    async def play():
+        speculation = async_game.SpeculativeDescription.start(scenario)
+        scenario.player_characters[1].health -= 10
+        scenario.mark_dirty(scenario.player_characters[1])
+        scenario.next_turn()
+        description = await speculation.take(scenario.turn_order[scenario.current_turn], scenario)
+        await asyncio.sleep(0)
+        return description, speculation.task
+
+    description, task = asyncio.run(play())
+    assert description is None
+    assert task.cancelled() or task.done()
+
+def test_no_speculation_when_a_monster_is_next():
+    scenario = build_scenario(players=1, monsters=1)
+    assert async_game.SpeculativeDescription.start(scenario) is None
+
+def test_the_async_game_reads_input_through_the_given_function(fake_client):
+    commands = []
+
+    async def read_input(prompt):
+        commands.append(prompt)
+        return "attack"
+
+    scenario = asyncio.run(async_game.async_game_loop(read_input=read_input))
+    assert commands and (scenario.all_monsters_defeated() or scenario.all_player_characters_defeated())
+
+def test_the_async_game_takes_its_scenario_from_the_pool(fake_client):
+    async def play():
+        pool = async_game.scenario_pool(asyncio.get_running_loop())
+        scenario = await async_game.async_game_loop(read_input=lambda prompt: "quit", pool=pool)
+        pool.close()
+        return scenario, pool
+
+    scenario, pool = asyncio.run(play())
+    assert pool.misses == 1 and scenario.turn_order
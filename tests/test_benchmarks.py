@@ -0,0 +1,28 @@
+import os
+
+from benchmarks.run import compare, environment
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = {"game_loop": {"turns_per_sec": 100.0, "prompt_bytes_per_turn": 1000.0}}
+    assert compare({"game_loop": {"turns_per_sec": 90.0, "prompt_bytes_per_turn": 1100.0}}, baseline, 0.2) == []
+    regressions = compare({"game_loop": {"turns_per_sec": 70.0, "prompt_bytes_per_turn": 1300.0}}, baseline, 0.2)
+    assert regressions == [
+        "game_loop turns_per_sec: 100 -> 70 (+30% worse)",
+        "game_loop prompt_bytes_per_turn: 1000 -> 1300 (+30% worse)",
+    ]
+
+def test_compare_skips_new_metrics_and_flags_counts_leaving_zero():
+    baseline = {"startup": {"deferred_modules_imported": 0}}
+    results = {"startup": {"deferred_modules_imported": 1, "import_main_seconds": 0.1}, "new": {"seconds": 1.0}}
+    assert compare(results, baseline, 0.2) == ["startup deferred_modules_imported: 0 -> 1"]
+
+def test_environment_restores_the_previous_value(monkeypatch):
+    monkeypatch.delenv("ADVENTURE_SEED", raising=False)
+    with environment("ADVENTURE_SEED", "3"):
+        assert os.environ["ADVENTURE_SEED"] == "3"
+    assert "ADVENTURE_SEED" not in os.environ
+
+    monkeypatch.setenv("ADVENTURE_SEED", "7")
+    with environment("ADVENTURE_SEED", "3"):
+        pass
+    assert os.environ["ADVENTURE_SEED"] == "7"
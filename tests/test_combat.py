@@ -0,0 +1,72 @@
+from src.entities import Action, ActionType, GameEntity, Scenario
+
+from tests.helpers import build_scenario
+
+def linear_find(scenario: Scenario, entity_id: int) -> GameEntity | None:
+    return next((entity for entity in scenario.player_characters + scenario.monsters if entity.entity_id == entity_id), None)
+
+def test_find_matches_linear_search():
+    scenario = build_scenario(players=3, monsters=5)
+    for entity_id in [1, 2, 3, 1000, 1004, 999, None]:
+        assert scenario._find_entity_by_id(entity_id) is linear_find(scenario, entity_id)
+
+def test_duplicate_ids_find_the_first_entity():
+    scenario = Scenario(
+        location_and_story_description="A cave.",
+        player_characters=[GameEntity(entity_id=1, name="Hero")],
+        monsters=[GameEntity(entity_id=1, name="Orc")],
+    )
+    assert scenario._find_entity_by_id(1).name == "Hero"
+
+def test_defeat_is_tracked_without_rescanning():
+    scenario = build_scenario(players=1, monsters=2)
+    for monster in scenario.monsters:
+        monster.health = 1
+    scenario.mark_dirty()
+    assert not scenario.all_monsters_defeated()
+
+    for monster in scenario.monsters:
+        scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=monster.entity_id), roll=20)
+    assert scenario.all_monsters_defeated()
+    assert not scenario.all_player_characters_defeated()
+
+def test_heal_brings_a_defeated_entity_back():
+    scenario = build_scenario()
+    scenario.player_characters[0].health = 1
+    scenario.mark_dirty()
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1000, target_entity_id=1), roll=20)
+    assert scenario.all_player_characters_defeated()
+
+    scenario.apply_action(Action(type=ActionType.HEAL, source_entity_id=1000, target_entity_id=1), roll=20)
+    assert not scenario.all_player_characters_defeated()
+
+def test_replacing_entity_lists_rebuilds_the_index():
+    scenario = build_scenario()
+    scenario.monsters = [GameEntity(entity_id=2000, name="Troll")]
+    assert scenario._find_entity_by_id(1000) is None
+    assert scenario._find_entity_by_id(2000).name == "Troll"
+    assert scenario.is_monster(2000)
+
+def test_mark_dirty_counts_entities_changed_outside_apply_action():
+    scenario = build_scenario(players=1, monsters=1)
+    assert not scenario.all_monsters_defeated()
+    monster = scenario.monsters[0]
+    monster.health = 0
+    scenario.mark_dirty(monster)
+    assert scenario.all_monsters_defeated()
+    assert "<health>0</health>" in scenario.to_xml()
+
+    monster.health = 5
+    scenario.mark_dirty(monster)
+    scenario.mark_dirty(monster)
+    assert not scenario.all_monsters_defeated()
+
+def test_sides_are_counted_by_entity_not_by_id():
+    scenario = Scenario(
+        location_and_story_description="A cave.",
+        player_characters=[GameEntity(entity_id=1, name="Hero")],
+        monsters=[GameEntity(entity_id=1, name="Orc")],
+    )
+    scenario.monsters[0].health = 0
+    scenario.mark_dirty(scenario.monsters[0])
+    assert scenario.all_monsters_defeated() and not scenario.all_player_characters_defeated()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from src.encoding import ENCODINGS, encode_scenario
+from src.entities import Action, ActionType
+from src.history import HistoryManager
+
+from tests.helpers import build_scenario
+
+def test_compact_encodings_carry_the_same_facts_in_fewer_bytes():
+    scenario = build_scenario(players=2, monsters=2)
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=10)
+    xml = encode_scenario(scenario, "xml")
+    for name in ("compact_xml", "json", "table"):
+        encoded = encode_scenario(scenario, name)
+        assert len(encoded.encode()) < len(xml.encode())
+        for fact in ("Hero 1", "Orc 1", "88", "Cast Spell", scenario.action_history[-1]):
+            assert fact in encoded, (name, fact)
+
+def test_stats_at_their_default_are_left_out():
+    document = json.loads(encode_scenario(build_scenario(), "json"))
+    hero, orc = document["player_characters"][0], document["monsters"][0]
+    assert hero == {"id": 1, "name": "Hero 0", "str": 12, "traits": ["Magical"], "abilities": ["Attack", "Defend", "Cast Spell"]}
+    assert "str" not in orc and "hp" not in orc
+
+def test_encodings_follow_the_history_window():
+    scenario = build_scenario()
+    scenario.configure_history(HistoryManager(keep_last=2))
+    for _ in range(5):
+        scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=1)
+    for name in ENCODINGS:
+        encoded = encode_scenario(scenario, name)
+        assert encoded.count("attacks Orc 0") == 2, name
+
+def test_encodings_are_rebuilt_after_a_change():
+    scenario = build_scenario()
+    before = encode_scenario(scenario, "table")
+    assert encode_scenario(scenario, "table") is before
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=10)
+    assert encode_scenario(scenario, "table") != before
+
+def test_unknown_encodings_are_rejected():
+    with pytest.raises(ValueError):
+        encode_scenario(build_scenario(), "yaml")
+
+def test_encodings_do_not_render_the_xml_document():
+    scenario = build_scenario()
+    encode_scenario(scenario, "compact_xml")
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=10)
+    assert "attacks Orc 0" in encode_scenario(scenario, "compact_xml")
+    assert scenario._xml is None
+
+def test_encodings_notice_every_kind_of_change():
+    scenario = build_scenario()
+    before = encode_scenario(scenario, "json")
+    scenario.next_turn()
+    after_turn = encode_scenario(scenario, "json")
+    assert after_turn != before
+    scenario.action_history.append("Orc 0 roars.")
+    after_append = encode_scenario(scenario, "json")
+    assert "Orc 0 roars." in after_append
+    scenario.monsters[0].health = 0
+    scenario.mark_dirty(scenario.monsters[0])
+    assert encode_scenario(scenario, "json") != after_append
@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from src.entities import Action, ActionKind, ActionOutcome, ActionPhase, ActionType, GameEntity, MonsterTurns, ResolvedTurn, Scenario
+from src.utils import BaseModelWithXML
+
+from tests.helpers import build_scenario
+
+def uncached_xml(scenario: Scenario) -> str:
+    return BaseModelWithXML.to_xml(scenario)
+
+def test_to_xml_matches_the_uncached_rendering(scenario):
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+def test_to_xml_stays_identical_through_a_game():
+    scenario = build_scenario(players=2, monsters=3)
+    rng = random.Random(1)
+    entity_ids = scenario.turn_order
+    for _ in range(60):
+        action = Action(
+            type=rng.choice(list(ActionType)),
+            action_kind=rng.choice(list(ActionKind)),
+            source_entity_id=rng.choice(entity_ids),
+            target_entity_id=rng.choice(entity_ids),
+            description="A <wild> swing & a miss.",
+        )
+        scenario.apply_action(action)
+        scenario.next_turn()
+        assert scenario.to_xml() == uncached_xml(scenario)
+
+def test_to_xml_after_direct_mutations(scenario):
+    scenario.to_xml()
+
+    hero = scenario.player_characters[0]
+    hero.name = "Aria"
+    scenario.mark_dirty(hero)
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+    scenario.monsters.append(GameEntity(entity_id=2000, name="Troll"))
+    scenario.mark_dirty()
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+    scenario.action_history = ["Something happened."]
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+    scenario.monsters = []
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+@pytest.mark.parametrize("shared_id", [1, 7])
+def test_to_xml_with_duplicate_ids(shared_id):
+    scenario = Scenario(
+        location_and_story_description="A cave.",
+        player_characters=[GameEntity(entity_id=shared_id, name="Hero")],
+        monsters=[GameEntity(entity_id=shared_id, name="Orc", strength=15)],
+    )
+    scenario.initialize()
+    scenario.seed_dice(0)
+    assert scenario.to_xml() == uncached_xml(scenario)
+    assert "<name>Orc</name>" in scenario.to_xml()
+
+    scenario.apply_action(Action(type=ActionType.DEFEND, source_entity_id=shared_id, target_entity_id=shared_id))
+    assert scenario.to_xml() == uncached_xml(scenario)
+
+def test_copies_render_their_own_state(scenario):
+    scenario.to_xml()
+    copy = scenario.model_copy(deep=True)
+    copy.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=10)
+    assert copy.to_xml() == uncached_xml(copy)
+    assert scenario.to_xml() == uncached_xml(scenario)
+    assert scenario.to_xml() != copy.to_xml()
+
+def monster_turns(scenario: Scenario) -> MonsterTurns:
+    scenario.turn_order = [1, 1000, 1001]
+    scenario.current_turn = 1
+
+    def attack(source: int) -> Action:
+        return Action(type=ActionType.ATTACK, source_entity_id=source, target_entity_id=1)
+
+    return MonsterTurns(
+        phases=[ActionPhase(actions=[attack(1000), attack(1001)]), ActionPhase(actions=[attack(1001)])],
+        narration="The orcs charge.",
+    )
+
+def test_monster_turns_apply_in_order_and_ignore_other_sources():
+    scenario = build_scenario(players=1, monsters=2)
+    turns = monster_turns(scenario)
+    assert scenario.upcoming_monster_ids() == [1000, 1001]
+
+    results = scenario.apply_monster_turns([1000, 1001], turns)
+    assert [entry.split(" attacks")[0] for entry in results] == ["Orc 0", "Orc 1"]
+    assert scenario.current_turn == 2
+
+def test_monster_turns_stop_once_the_players_are_defeated():
+    scenario = build_scenario(players=1, monsters=2)
+    turns = monster_turns(scenario)
+    scenario.player_characters[0].health = 0
+    scenario.mark_dirty(scenario.player_characters[0])
+    assert len(scenario.apply_monster_turns([1000, 1001], turns)) == 1
+    assert scenario.current_turn == 1
+
+def test_apply_action_reports_its_outcome():
+    scenario = build_scenario()
+    outcome = scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=10)
+    assert outcome == ActionOutcome(ActionType.ATTACK, "Hero 0", "Orc 0", 10, 12, 88, False)
+
+def test_narration_picks_the_line_for_each_outcome():
+    turn = ResolvedTurn(
+        action_phase=ActionPhase(actions=[]),
+        narration="Hero 0 swung.",
+        weak="{target} barely felt it.",
+        solid="{source} hit {target} for {amount}.",
+        strong="{target} reeled, {health} health left {like this}.",
+        defeated="{target} fell.",
+    )
+    outcome = ActionOutcome(ActionType.ATTACK, "Hero 0", "Orc 0", 10, 12, 88, False)
+    assert turn.narrate([outcome._replace(effect=3), None]) == "Hero 0 swung. Orc 0 barely felt it."
+    assert turn.narrate([outcome]) == "Hero 0 swung. Hero 0 hit Orc 0 for 12."
+    assert turn.narrate([outcome._replace(effect=20)]) == "Hero 0 swung. Orc 0 reeled, 88 health left {like this}."
+    assert turn.narrate([outcome._replace(defeated=True)]) == "Hero 0 swung. Orc 0 fell."
+    # Missing tiers fall back to the solid line
+    assert ResolvedTurn(action_phase=ActionPhase(actions=[]), solid="{amount}!").narrate([outcome._replace(effect=1)]) == "1!"
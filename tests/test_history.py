@@ -0,0 +1,95 @@
+from src.entities import Action, ActionType
+from src.history import HistoryEvent, HistoryManager
+
+
+def play(history: HistoryManager, entries: int) -> list[str]:
+    actions = []
+    for index in range(entries):
+        actions.append(f"Hero attacks Orc for {index} damage.")
+        history.record(actions, HistoryEvent("Hero", "Orc", "attack", index))
+    return actions
+
+def test_keeps_the_last_entries_verbatim():
+    history = HistoryManager(keep_last=3, budget_bytes=None)
+    actions = play(history, 10)
+    assert history.window_start(actions) == 7
+    assert history.summary() == "7 earlier actions. Hero dealt 21 damage. Orc took 21 damage."
+
+def test_byte_budget_shrinks_the_window_but_keeps_the_last_entry():
+    history = HistoryManager(keep_last=8, budget_bytes=1)
+    actions = play(history, 5)
+    assert history.window_start(actions) == 4
+
+def test_nothing_is_folded_below_keep_last():
+    history = HistoryManager(keep_last=8)
+    actions = play(history, 5)
+    assert history.window_start(actions) == 0
+    assert history.summary() == ""
+
+def test_summarizer_runs_every_few_folded_entries():
+    calls = []
+
+    def summarizer(previous: str, actions: list[str]) -> str:
+        calls.append(len(actions))
+        return f"summary {len(calls)}"
+
+    history = HistoryManager(keep_last=2, budget_bytes=None, summarizer=summarizer, summarize_every=4)
+    actions = play(history, 11)
+    history.window_start(actions)
+    assert calls == []
+    history.record_turn(actions)
+    assert calls == [9]
+    assert history.summary().endswith("summary 1")
+
+def test_state_round_trip():
+    history = HistoryManager(keep_last=2, budget_bytes=None)
+    actions = play(history, 6)
+    history.window_start(actions)
+
+    restored = HistoryManager(keep_last=2, budget_bytes=None)
+    restored.restore(history.state())
+    assert restored.summary() == history.summary()
+    actions = actions + ["Orc defends."]
+    for manager in (history, restored):
+        manager.record(actions, HistoryEvent("Orc", "Hero", "defend", 3))
+    assert restored.window_start(actions) == history.window_start(actions)
+    assert restored.summary() == history.summary()
+
+def test_replaced_history_starts_over():
+    history = HistoryManager(keep_last=1, budget_bytes=None)
+    history.window_start(play(history, 5))
+    assert history.window_start([]) == 0
+    history.fold([])
+    assert history.summary() == ""
+
+def test_scenario_prompts_carry_the_window_and_summary(scenario):
+    scenario.configure_history(HistoryManager(keep_last=2, budget_bytes=None))
+    for _ in range(5):
+        scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=1)
+
+    summary, window = scenario.prompt_history()
+    assert window == scenario.action_history[-2:]
+    assert summary.startswith("3 earlier actions.")
+    xml = scenario.to_xml()
+    assert scenario.action_history[0] not in xml
+    assert all(entry in xml for entry in window)
+    assert "<action_history_summary>3 earlier actions." in xml
+
+def test_building_prompts_never_calls_the_summarizer(scenario):
+    calls = []
+
+    def summarizer(previous: str, actions: list[str]) -> str:
+        calls.append(actions)
+        return "Blows were traded."
+
+    scenario.configure_history(HistoryManager(keep_last=1, budget_bytes=None, summarizer=summarizer, summarize_every=2))
+    for _ in range(3):
+        scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000), roll=1)
+    scenario.mark_dirty()
+    xml = scenario.to_xml()
+    scenario.prompt_history()
+    assert calls == [] and "<action_history_summary>2 earlier actions." in xml
+
+    scenario.next_turn()
+    assert len(calls) == 1
+    assert "Blows were traded." in scenario.to_xml()
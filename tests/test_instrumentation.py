@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from src.entities import Narration, ScenarioDescription
+from src.instrumentation import Histogram, InstrumentedClient, Tracer, common_prefix_bytes, traced
+from src.llm import FakeBackend
+
+def test_histogram_percentiles_are_bucket_upper_bounds():
+    histogram = Histogram()
+    assert histogram.percentile(0.5) == 0.0
+    for value in (0.02, 0.02, 0.3, 3.0):
+        histogram.add(value)
+    assert histogram.percentile(0.5) == 0.025
+    assert histogram.percentile(0.75) == 0.5
+    assert histogram.percentile(1.0) == 5
+    assert histogram.mean == pytest.approx(0.835)
+
+    histogram.add(1000)
+    assert histogram.percentile(1.0) == float("inf")
+
+def test_common_prefix_bytes_stops_at_the_first_difference():
+    previous = [{"role": "system", "content": "Rules"}, {"role": "user", "content": "héllo world"}]
+    assert common_prefix_bytes(None, previous) == 0
+    assert common_prefix_bytes(previous, previous) == len("Rules") + len("héllo world".encode())
+    changed = [{"role": "system", "content": "Rules"}, {"role": "user", "content": "héllo there"}]
+    assert common_prefix_bytes(previous, changed) == len("Rules") + len("héllo ".encode())
+    assert common_prefix_bytes(previous, [{"role": "user", "content": "Rules"}]) == 0
+
+def test_calls_are_recorded_with_their_call_site_and_turn(tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    tracer = Tracer(str(trace_path))
+    client = InstrumentedClient(FakeBackend(), tracer=tracer)
+    messages = [{"role": "system", "content": "Roll the dice"}]
+
+    @traced("narrate")
+    def roll():
+        return client.create(Narration, messages, model="gpt-4o")
+
+    tracer.start_turn(1)
+    roll()
+    roll()
+    list(client.create_partial(ScenarioDescription, messages))
+    tracer.finish()
+
+    first, second, streamed = tracer.records
+    assert (first.call_site, first.turn, first.model, first.response_model) == ("narrate", 1, "gpt-4o", "Narration")
+    assert first.prompt_bytes == len("Roll the dice") and first.prefix_bytes == 0
+    # The second call repeats the first prompt, the streamed one comes from another call site
+    assert second.prefix_bytes == second.prompt_bytes
+    assert streamed.call_site == "unknown" and streamed.streamed and streamed.time_to_first_token is not None
+    assert tracer.latency["narrate"].count == 2
+    assert [json.loads(line)["call_site"] for line in trace_path.read_text().splitlines()] == ["narrate", "narrate", "unknown"]
+
+def test_failed_calls_are_recorded_with_the_error():
+    class Failing:
+        def create(self, **kwargs):
+            raise RuntimeError("rate limited")
+
+    tracer = Tracer()
+    client = InstrumentedClient(Failing(), tracer=tracer)
+    with pytest.raises(RuntimeError):
+        client.create(Narration, [{"role": "user", "content": "roll"}])
+    assert tracer.records[0].error == "RuntimeError('rate limited')"
+
+def test_the_factory_runs_on_the_first_call():
+    built = []
+    client = InstrumentedClient(factory=lambda: built.append(1) or FakeBackend(), tracer=Tracer())
+    assert built == []
+    client.create(Narration, [{"role": "user", "content": "roll"}])
+    client.create(Narration, [{"role": "user", "content": "roll"}])
+    assert built == [1]
+
+def test_records_are_bounded_and_listeners_see_every_call():
+    tracer = Tracer(max_records=2)
+    seen = []
+    tracer.add_listener(seen.append)
+    client = InstrumentedClient(FakeBackend(), tracer=tracer)
+    for index in range(3):
+        client.create(Narration, [{"role": "user", "content": f"call {index}"}])
+    assert [record.prompt_bytes for record in tracer.records] == [len("call 1"), len("call 2")]
+    assert len(seen) == 3
+
+    tracer.retain(0)
+    client.create(Narration, [{"role": "user", "content": "call 3"}])
+    assert len(tracer.records) == 0
+    assert len(seen) == 4 and tracer.latency["unknown"].count == 4
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from src.entities import Action, ActionType, Scenario
+from src.history import HistoryManager
+from src.journal import Journal, find_game, list_games, load_game
+
+from tests.helpers import build_scenario
+
+def play(scenario: Scenario, turns: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(turns):
+        source, target = rng.sample(scenario.turn_order, 2)
+        scenario.apply_action(Action(type=rng.choice([ActionType.ATTACK, ActionType.HEAL]), source_entity_id=source, target_entity_id=target))
+        scenario.next_turn()
+
+def test_a_saved_game_replays_to_the_same_state(tmp_path):
+    scenario = build_scenario(players=2, monsters=2)
+    journal = Journal.create(tmp_path, scenario, snapshot_every=10**9)
+    journal.attach(scenario)
+    play(scenario, 20)
+    journal.close()
+
+    loaded = load_game(journal.path)
+    assert loaded.to_xml() == scenario.to_xml()
+    assert loaded.current_turn == scenario.current_turn
+
+def test_resuming_continues_the_same_journal(tmp_path):
+    scenario = build_scenario(players=2, monsters=2)
+    journal = Journal.create(tmp_path, scenario)
+    journal.attach(scenario)
+    play(scenario, 5)
+    journal.close()
+
+    # The same game played on without a journal
+    expected = load_game(journal.path)
+    expected.seed_dice(1)
+    play(expected, 5, seed=1)
+
+    resumed = load_game(journal.path)
+    resumed.seed_dice(1)
+    journal = Journal(journal.path)
+    assert journal.records == 1 + 5 * 2
+    journal.attach(resumed)
+    play(resumed, 5, seed=1)
+    journal.end("win")
+
+    assert load_game(journal.path).to_xml() == expected.to_xml()
+    [saved] = list_games(tmp_path)
+    assert (saved.records, saved.result) == (1 + 10 * 2 + 1, "win")
+
+def test_snapshots_restore_the_history_window(tmp_path):
+    scenario = build_scenario(players=2, monsters=2)
+    scenario.configure_history(HistoryManager(keep_last=3))
+    journal = Journal.create(tmp_path, scenario, snapshot_every=4)
+    journal.attach(scenario)
+    play(scenario, 10)
+    journal.close()
+
+    assert b'{"t":"snap"' in journal.path.read_bytes()
+    loaded = load_game(journal.path, HistoryManager(keep_last=3))
+    assert loaded.to_xml() == scenario.to_xml()
+
+def test_a_torn_last_record_is_dropped(tmp_path):
+    scenario = build_scenario()
+    journal = Journal.create(tmp_path, scenario)
+    journal.attach(scenario)
+    play(scenario, 3)
+    journal.close()
+    complete = journal.path.read_bytes()
+    with journal.path.open("ab") as file:
+        file.write(b'{"t":"act","n":7,"a":{"ty')
+
+    assert load_game(journal.path).to_xml() == scenario.to_xml()
+    reopened = Journal(journal.path)
+    assert reopened.records == 7
+    assert journal.path.read_bytes() == complete
+
+def test_games_are_found_by_the_start_of_their_id(tmp_path):
+    first = Journal.create(tmp_path, build_scenario())
+    Journal.create(tmp_path, build_scenario())
+    assert find_game(tmp_path, first.path.stem) == first.path
+    assert find_game(tmp_path, str(first.path)) == first.path
+    with pytest.raises(ValueError):
+        find_game(tmp_path, "no-such-game")
@@ -0,0 +1,88 @@
+import pytest
+
+from src.entities import ActionPhase, ProposedAction, Scenario, ScenarioDescription
+from src.llm import (
+    Cassette,
+    CassetteMiss,
+    FakeBackend,
+    RecordingBackend,
+    ReplayBackend,
+    make_client,
+    request_key,
+    uses_cassette,
+)
+from src.prompts import game_roll_messages, generate_scenario_messages
+
+from tests.helpers import build_scenario
+
+def test_request_key_ignores_whitespace_but_not_content():
+    messages = [{"role": "system", "content": "Roll  the\n dice"}]
+    same = [{"role": "system", "content": "Roll the dice"}]
+    other = [{"role": "system", "content": "Roll the die"}]
+    assert request_key("gpt-4o", str, messages) == request_key("gpt-4o", str, same)
+    assert request_key("gpt-4o", str, messages) != request_key("gpt-4o", str, other)
+    assert request_key("gpt-4o", str, messages) != request_key("gpt-4o-mini", str, messages)
+    assert request_key("gpt-4o", str, messages) != request_key("gpt-4o", ScenarioDescription, messages)
+
+def test_recorded_responses_replay_from_disk(tmp_path):
+    path = tmp_path / "game.jsonl"
+    scenario = build_scenario()
+    messages = game_roll_messages(scenario, ProposedAction(player_input="hit Orc 0", source_entity_id=1))
+
+    recorder = RecordingBackend(FakeBackend(), Cassette(path))
+    recorded = recorder.create(ActionPhase, messages, "gpt-4o")
+    recorded_text = list(recorder.create_partial(str, [{"role": "user", "content": "hi"}], "gpt-4o"))[-1]
+
+    replay = ReplayBackend(Cassette(path))
+    assert replay.create(ActionPhase, messages, "gpt-4o") == recorded
+    assert list(replay.create_partial(str, [{"role": "user", "content": "hi"}], "gpt-4o")) == [recorded_text]
+    with pytest.raises(CassetteMiss):
+        replay.create(ActionPhase, messages, "gpt-4o-mini")
+
+def test_repeated_requests_replay_in_the_order_they_were_recorded(tmp_path):
+    path = tmp_path / "game.jsonl"
+    recorder = RecordingBackend(FakeBackend(), Cassette(path))
+    recorded = [recorder.create(Scenario, generate_scenario_messages(), "gpt-4o") for _ in range(2)]
+    assert recorded[0] != recorded[1]
+
+    replay = ReplayBackend(Cassette(path))
+    replayed = [replay.create(Scenario, generate_scenario_messages(), "gpt-4o") for _ in range(3)]
+    assert replayed == [recorded[0], recorded[1], recorded[1]]
+
+def test_only_record_and_replay_use_a_cassette(monkeypatch):
+    monkeypatch.setenv("ADVENTURE_LLM_BACKEND", "replay")
+    assert uses_cassette()
+    assert uses_cassette("record")
+    assert not uses_cassette("fake")
+    monkeypatch.delenv("ADVENTURE_LLM_BACKEND")
+    assert not uses_cassette()
+
+def test_fake_backend_is_deterministic_per_seed():
+    first = FakeBackend(3).create(Scenario, generate_scenario_messages())
+    again = FakeBackend(3).create(Scenario, generate_scenario_messages())
+    assert first == again
+
+def test_fake_backend_reads_the_action_from_the_prompt():
+    scenario = build_scenario(monsters=2)
+    messages = game_roll_messages(scenario, ProposedAction(player_input="smash Orc 1", source_entity_id=1))
+    action_phase = FakeBackend().create(ActionPhase, messages)
+    assert [(action.source_entity_id, action.target_entity_id) for action in action_phase.actions] == [(1, 1001)]
+
+    question = game_roll_messages(scenario, ProposedAction(player_input="Where am I?", source_entity_id=1))
+    assert FakeBackend().create(ActionPhase, question).is_question
+
+def test_fake_backend_names_the_response_model_it_cannot_produce():
+    with pytest.raises(TypeError, match="'ProposedAction'"):
+        FakeBackend().create(ProposedAction, generate_scenario_messages())
+    with pytest.raises(TypeError, match="'ProposedAction'"):
+        next(FakeBackend().create_partial(ProposedAction, generate_scenario_messages()))
+
+def test_make_client_rejects_unknown_backends():
+    with pytest.raises(ValueError):
+        make_client("carrier-pigeon")
+
+def test_seeded_dice_repeat(scenario):
+    scenario.seed_dice(5)
+    first = [scenario.roll_die() for _ in range(20)]
+    scenario.seed_dice(5)
+    assert [scenario.roll_die() for _ in range(20)] == first
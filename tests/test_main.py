@@ -0,0 +1,71 @@
+import pytest
+
+import main
+from src.instrumentation import InstrumentedClient, Tracer
+from src.llm import Cassette, FakeBackend, RecordingBackend, ReplayBackend
+from src.response_cache import ResponseCache
+
+@pytest.fixture
+def game(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ADVENTURE_SEED", "0")
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    monkeypatch.setattr(main, "PRINT_CALL_REPORT", False)
+
+@pytest.mark.parametrize("backend, pooled", [("fake", True), ("record", False), ("replay", False)])
+def test_the_scenario_pool_is_off_with_a_cassette(game, monkeypatch, backend, pooled):
+    started = []
+
+    class Pool:
+        def __init__(self, *args):
+            pass
+
+        def start(self):
+            started.append(self)
+            return self
+
+        def close(self):
+            pass
+
+    monkeypatch.setenv("ADVENTURE_LLM_BACKEND", "fake")
+    monkeypatch.setattr(main, "ScenarioPool", Pool)
+    monkeypatch.setattr(main, "game_loop", lambda resume=None, pool=None: None)
+    assert main.run(["--backend", backend]) == 0
+    assert bool(started) == pooled
+
+def test_a_recorded_game_replays_without_the_model(game, monkeypatch, tmp_path):
+    path = tmp_path / "cassettes" / "game.jsonl"
+    monkeypatch.setattr(main, "client", InstrumentedClient(RecordingBackend(FakeBackend(), Cassette(path))))
+    recorded = main.game_loop(read_input=lambda prompt: "attack")
+
+    monkeypatch.setattr(main, "client", InstrumentedClient(ReplayBackend(Cassette(path))))
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    replayed = main.game_loop(read_input=lambda prompt: "attack")
+    assert replayed.action_history == recorded.action_history
+
+def test_balancing_attempts_replay_the_same_scenario(game, monkeypatch, tmp_path):
+    # No scenario is balanced, so every attempt is made with the same request
+    monkeypatch.setattr(main, "BALANCE_ATTEMPTS", 3)
+    monkeypatch.setattr(main, "BALANCE_WIN_RATE", (-1.0, -0.5))
+    monkeypatch.setattr(main, "BALANCE_ENCOUNTERS", 200)
+    path = tmp_path / "cassettes" / "game.jsonl"
+    monkeypatch.setattr(main, "client", InstrumentedClient(RecordingBackend(FakeBackend(), Cassette(path))))
+    recorded = main.generate_balanced_scenario()
+    assert len(Cassette(path).responses) == 1
+
+    monkeypatch.setattr(main, "client", InstrumentedClient(ReplayBackend(Cassette(path))))
+    assert main.generate_balanced_scenario() == recorded
+
+@pytest.mark.parametrize("single_call", [True, False])
+def test_free_form_turns_take_one_call_with_single_call_turns(game, monkeypatch, single_call):
+    tracer = Tracer()
+    monkeypatch.setattr(main, "SINGLE_CALL_TURNS", single_call)
+    monkeypatch.setattr(main, "STREAM_NARRATION", False)
+    monkeypatch.setattr(main, "client", InstrumentedClient(FakeBackend(), tracer=tracer))
+    main.game_loop(read_input=lambda prompt: "swing wildly")
+
+    call_sites = {record.call_site for record in tracer.records}
+    if single_call:
+        assert "resolved_turn" in call_sites and "describe_effectiveness_of_action" not in call_sites
+    else:
+        assert {"game_roll", "describe_effectiveness_of_action"} <= call_sites and "resolved_turn" not in call_sites
@@ -0,0 +1,63 @@
+from benchmarks.run import PromptMeter
+from src.encoding import encode_scenario
+from src.entities import Action, ActionType, ProposedAction
+from src.history import BYTES_PER_TOKEN
+from src.llm import FakeBackend
+from src.prompt_layout import PromptLayout
+from src.prompts import answer_question_messages, game_roll_messages, uses_prefix_layout
+
+from tests.helpers import build_scenario
+
+def attack(scenario):
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000))
+
+def test_short_prefixes_keep_the_plain_prompts():
+    scenario = build_scenario()
+    plain = answer_question_messages(scenario, "Who is winning?")
+    scenario.configure_prompt_layout(PromptLayout(min_prefix_tokens=1024))
+    assert not uses_prefix_layout(scenario, "answer_question")
+    assert answer_question_messages(scenario, "Who is winning?") == plain
+
+def test_long_prefixes_use_the_layout():
+    scenario = build_scenario(players=20, monsters=20)
+    scenario.configure_prompt_layout(PromptLayout(min_prefix_tokens=1024))
+    assert uses_prefix_layout(scenario, "answer_question")
+    assert scenario.prompt_layout.prefix_bytes("compact_xml") >= 1024 * BYTES_PER_TOKEN
+
+def test_the_start_of_the_prompt_stays_the_same_between_turns():
+    scenario = build_scenario()
+    scenario.configure_prompt_layout(PromptLayout(min_prefix_tokens=0))
+    action = ProposedAction(player_input="hit Orc 0", source_entity_id=1)
+    before = game_roll_messages(scenario, action)
+    attack(scenario)
+    after = game_roll_messages(scenario, action)
+
+    assert before[:3] == after[:3]
+    assert after[3]["content"].endswith(scenario.action_history[-1])
+    assert scenario.prompt_layout.rebases == 1
+
+def test_the_benchmark_only_counts_prefixes_a_provider_caches():
+    meter = PromptMeter(FakeBackend())
+    short = [{"role": "system", "content": "x" * 100}]
+    long = [{"role": "system", "content": "x" * 1024 * BYTES_PER_TOKEN}]
+    for messages in (short, short, long, long):
+        meter.create(str, messages)
+    assert meter.prefix_bytes == 1024 * BYTES_PER_TOKEN
+
+def test_each_call_site_gets_the_snapshot_in_its_own_encoding(monkeypatch):
+    monkeypatch.setattr("src.prompts.SCENARIO_ENCODINGS", {"answer_question": "table"})
+    scenario = build_scenario()
+    scenario.configure_prompt_layout(PromptLayout(min_prefix_tokens=0))
+    roll = game_roll_messages(scenario, ProposedAction(player_input="hit Orc 0", source_entity_id=1))
+    answer = answer_question_messages(scenario, "Who is winning?")
+
+    layout = scenario.prompt_layout
+    assert set(layout.snapshots) == {"compact_xml", "table"}
+    assert roll[2]["content"].endswith(encode_scenario(scenario, "compact_xml"))
+    assert answer[2]["content"].endswith(encode_scenario(scenario, "table"))
+
+    # Both snapshots are taken again together, at the same point of the history
+    attack(scenario)
+    answer_question_messages(scenario, "Who is winning?")
+    game_roll_messages(scenario, ProposedAction(player_input="hit Orc 0", source_entity_id=1))
+    assert layout.rebases == 2 and layout.history_start == 0
@@ -0,0 +1,87 @@
+import pytest
+from pydantic import ValidationError
+
+from src.entities import Ability, Action, ActionType, GameEntity, Scenario, Trait
+from src.instrumentation import InstrumentedClient, Tracer
+from src.repair import RepairStats, repairing
+
+from tests.helpers import build_scenario
+
+MALFORMED_ENTITY = {
+    "entity_id": 7,
+    "name": "Grimjaw",
+    "health": 120.5,
+    "strength": 25,
+    "traits": ["brave", "Strong", "fire breathing", "Flying"],
+    "abilities": ["attack", "BREATH_FIRE", "dance"],
+}
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = RepairStats()
+    monkeypatch.setattr("src.repair.repair_stats", stats)
+    return stats
+
+def test_entities_from_the_model_are_repaired(stats):
+    with repairing():
+        entity = GameEntity.model_validate(MALFORMED_ENTITY)
+    assert (entity.health, entity.strength) == (100, 20)
+    assert entity.traits == [Trait.BRAVE, Trait.FIRE_BREATHING, Trait.FLYING]
+    assert entity.abilities == [Ability.ATTACK, Ability.BREATH_FIRE]
+    assert stats.repairs == {"clamped": 2, "enum_case": 4, "unknown_trait": 1, "unknown_ability": 1}
+    assert (stats.repaired_responses, stats.retries_avoided) == (1, 1)
+
+def test_a_generated_scenario_with_malformed_entities_validates(stats):
+    payload = {
+        "location_and_story_description": "A ruined keep.",
+        "player_characters": [{"entity_id": 1, "name": "Aria", "traits": ["MAGICAL", "heroic"]}],
+        "monsters": [MALFORMED_ENTITY],
+    }
+    with repairing():
+        scenario = Scenario.model_validate(payload)
+    assert scenario.player_characters[0].traits == [Trait.MAGICAL]
+    assert scenario.monsters[0].traits == [Trait.BRAVE, Trait.FIRE_BREATHING, Trait.FLYING]
+
+class RetryingClient:
+    # Reports each attempt through hooks the way instructor does, asking again after a validation error
+    def __init__(self, *responses):
+        self.responses = responses
+        self.hooks = {}
+
+    def on(self, event, handler):
+        self.hooks[event] = handler
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        for response in self.responses:
+            self.hooks["completion:response"](response)
+            try:
+                return response_model.model_validate(response)
+            except ValidationError as error:
+                self.hooks["parse:error"](error)
+                last_error = error
+        raise last_error
+
+@pytest.mark.parametrize("responses, retries_avoided", [
+    ([MALFORMED_ENTITY], 1),
+    ([{**MALFORMED_ENTITY, "name": None}, MALFORMED_ENTITY], 0),
+])
+def test_retries_are_only_avoided_when_the_first_response_was_repaired(stats, responses, retries_avoided):
+    client = InstrumentedClient(RetryingClient(*responses), tracer=Tracer())
+    with repairing():
+        client.create(response_model=GameEntity, messages=[{"role": "user", "content": "Make a monster."}])
+    assert (stats.repaired_responses, stats.retries_avoided) == (1, retries_avoided)
+
+def test_nothing_is_repaired_outside_repairing(stats):
+    with pytest.raises(ValidationError):
+        GameEntity.model_validate(MALFORMED_ENTITY)
+    assert stats.repaired_responses == 0
+
+def test_actions_are_repaired_against_the_scenario(stats):
+    scenario = build_scenario(players=1, monsters=2)
+    with repairing(scenario, source_entity_id=1):
+        action = Action.model_validate({"type": "Attack", "source_entity_id": "1", "target_entity_id": 42, "ability": "breath fire"})
+    assert action.type == ActionType.ATTACK
+    assert action.target_entity_id == 1000
+    # A real ability, but the hero doesn't have it
+    assert action.ability is None
+    assert stats.repairs == {"enum_case": 2, "unknown_target": 1, "ability_not_owned": 1}
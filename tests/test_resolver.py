@@ -0,0 +1,39 @@
+import pytest
+
+from src.entities import Ability, ActionType, ProposedAction
+from src.resolver import ResolverStats, resolve_locally, resolver_stats
+
+from tests.helpers import build_scenario
+
+def resolve(scenario, text, source_entity_id=1):
+    return resolve_locally(scenario, ProposedAction(player_input=text, source_entity_id=source_entity_id))
+
+def test_plain_commands_resolve_without_the_model():
+    scenario = build_scenario(players=1, monsters=2)
+    scenario.monsters[1].name = "Goblin King"
+    phase = resolve(scenario, "Cast spell at the goblin!")
+    action = phase.actions[0]
+    assert (action.type, action.ability, action.source_entity_id, action.target_entity_id) == (
+        ActionType.ATTACK, Ability.CAST_SPELL, 1, 1001,
+    )
+
+def test_attacks_without_a_target_go_for_the_weakest_foe():
+    scenario = build_scenario(players=1, monsters=2)
+    scenario.monsters[1].health = 5
+    assert resolve(scenario, "cast").actions[0].target_entity_id == 1001
+
+@pytest.mark.parametrize("text", ["", "what can I do?", "dance wildly", "cast spell at the dragon", "fly"])
+def test_anything_unclear_goes_to_the_model(text):
+    scenario = build_scenario()
+    assert resolve(scenario, text) is None
+
+def test_stats_count_both_outcomes(monkeypatch):
+    stats = ResolverStats()
+    monkeypatch.setattr("src.resolver.resolver_stats", stats)
+    scenario = build_scenario()
+    resolve(scenario, "cast spell")
+    resolve(scenario, "dance")
+    assert (stats.resolved_locally, stats.sent_to_llm) == (1, 1)
+    assert stats.summary() == "Resolved 1 of 2 commands without the model (50%)"
+    assert ResolverStats().summary() == "Resolved 0 of 0 commands without the model"
+    assert resolver_stats is not stats
@@ -0,0 +1,70 @@
+import gc
+import json
+
+from src.entities import Action, ActionType
+from src.response_cache import MISS, ResponseCache, normalize
+
+from tests.helpers import build_scenario
+
+def attack(scenario):
+    scenario.apply_action(Action(type=ActionType.ATTACK, source_entity_id=1, target_entity_id=1000))
+
+def test_questions_are_normalized():
+    assert normalize("What's my health?") == normalize("what is my  health")
+
+def test_entries_cached_after_next_turn_are_evicted_by_the_next_action():
+    scenario = build_scenario()
+    cache = ResponseCache()
+    cache.attach(scenario)
+    attack(scenario)
+    scenario.next_turn()
+
+    # Cached at the start of the turn, a state no action has produced
+    key = cache.key("answer_question", scenario, "What's my health?")
+    cache.put(key, "Full health.")
+    assert cache.get(key) == "Full health."
+
+    attack(scenario)
+    assert len(cache._entries) == 0
+    assert cache.get(key) is MISS
+
+def test_each_attached_scenario_only_evicts_its_own_entries():
+    first, second = build_scenario(seed=1), build_scenario(seed=2)
+    second.location_and_story_description = "A windswept ridge."
+    cache = ResponseCache()
+    cache.attach(first)
+    cache.attach(second)
+    cache.put(cache.key("answer_question", first, "where am I"), "A cave.")
+    second_key = cache.key("answer_question", second, "where am I")
+    cache.put(second_key, "A ridge.")
+
+    attack(first)
+    assert list(cache._entries) == [second_key]
+
+def test_expired_entries_are_not_persisted(tmp_path, monkeypatch):
+    path = tmp_path / "cache.json"
+    scenario = build_scenario()
+    cache = ResponseCache(ttl=60, path=path)
+    old_key = cache.key("answer_question", scenario, "old question")
+    monkeypatch.setattr("src.response_cache.time.time", lambda: 1_000.0)
+    cache.put(old_key, "Old answer.")
+    monkeypatch.setattr("src.response_cache.time.time", lambda: 1_100.0)
+    new_key = cache.key("answer_question", scenario, "new question")
+    cache.put(new_key, "New answer.")
+    cache.save()
+
+    assert list(json.loads(path.read_text())) == [new_key]
+    assert ResponseCache(ttl=60, path=path).get(new_key) == "New answer."
+
+def test_lookups_are_only_tracked_for_attached_scenarios_while_they_live():
+    cache = ResponseCache()
+    scenario = build_scenario()
+    cache.attach(scenario)
+    copy = scenario.model_copy(deep=True)
+    cache.key("answer_question", copy, "where am I")
+    cache.key("answer_question", scenario, "where am I")
+    assert list(cache._looked_up) == [id(scenario)]
+
+    del scenario, copy
+    gc.collect()
+    assert cache._looked_up == {}
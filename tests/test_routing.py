@@ -0,0 +1,55 @@
+import pytest
+
+from src.instrumentation import CallRecord, Tracer
+from src.routing import Router
+
+@pytest.fixture(autouse=True)
+def live_backend(monkeypatch):
+    monkeypatch.delenv("ADVENTURE_LLM_BACKEND", raising=False)
+
+def make_router(tracer: Tracer, probe_every: int = 100) -> Router:
+    return Router(
+        {"large": "big-model", "small": "fast-model"},
+        {"narrate": ("large", 1.0), "generate_scenario": ("large", None)},
+        "large",
+        tracer=tracer,
+        min_samples=2,
+        probe_every=probe_every,
+    )
+
+def finish(tracer: Tracer, model: str, latency: float, call_site: str = "narrate"):
+    tracer.record(CallRecord(call_site=call_site, turn=None, model=model, response_model="Narration", streamed=False, started=0.0, latency=latency))
+
+def test_unknown_tiers_are_rejected():
+    with pytest.raises(ValueError):
+        Router({"large": "big-model"}, {"narrate": ("huge", None)}, "large", tracer=Tracer())
+
+def test_slow_calls_move_the_route_to_the_faster_tier_without_retained_records():
+    tracer = Tracer()
+    tracer.retain(0)
+    router = make_router(tracer)
+    assert router.model("narrate") == "big-model"
+    finish(tracer, "big-model", 3.0)
+    finish(tracer, "big-model", 3.0)
+    assert router.model("narrate") == "fast-model"
+    # No budget, no demotion
+    finish(tracer, "big-model", 3.0, "generate_scenario")
+    finish(tracer, "big-model", 3.0, "generate_scenario")
+    assert router.model("generate_scenario") == "big-model"
+
+def test_probing_returns_to_the_preferred_model():
+    tracer = Tracer()
+    router = make_router(tracer, probe_every=3)
+    finish(tracer, "big-model", 3.0)
+    finish(tracer, "big-model", 3.0)
+    assert [router.model("narrate") for _ in range(3)] == ["fast-model", "fast-model", "big-model"]
+    assert router.summary() == "Models: narrate big-model 1, narrate fast-model 2"
+
+@pytest.mark.parametrize("backend", ["record", "replay"])
+def test_tiers_are_pinned_with_a_cassette(monkeypatch, backend):
+    monkeypatch.setenv("ADVENTURE_LLM_BACKEND", backend)
+    tracer = Tracer()
+    router = make_router(tracer)
+    finish(tracer, "big-model", 3.0)
+    finish(tracer, "big-model", 3.0)
+    assert router.model("narrate") == "big-model"
@@ -0,0 +1,50 @@
+import threading
+
+from src.entities import GameEntity, Scenario
+from src.llm import FakeBackend
+from src.prompts import generate_scenario_messages
+from src.scenario_pool import ScenarioPool, is_playable
+
+def generator():
+    backend = FakeBackend()
+    lock = threading.Lock()
+
+    def generate() -> Scenario:
+        with lock:
+            return backend.create(Scenario, generate_scenario_messages())
+    return generate
+
+def test_scenarios_without_both_sides_or_with_shared_ids_are_unplayable():
+    hero = GameEntity(entity_id=1, name="Aria")
+    assert is_playable(Scenario(location_and_story_description="", player_characters=[hero], monsters=[GameEntity(entity_id=2, name="Orc")]))
+    assert not is_playable(Scenario(location_and_story_description="", player_characters=[hero], monsters=[]))
+    assert not is_playable(Scenario(location_and_story_description="", player_characters=[hero], monsters=[GameEntity(entity_id=1, name="Orc")]))
+
+def test_taken_scenarios_come_from_the_workers():
+    pool = ScenarioPool(generator(), size=2).start()
+    first, second = pool.take(), pool.take()
+    pool.close()
+    assert first != second
+    assert pool.generated >= 2 and pool.hits + pool.misses == 2
+
+def test_unused_scenarios_are_stored_for_the_next_pool(tmp_path):
+    path = tmp_path / "cache" / "scenario_pool.jsonl"
+    pool = ScenarioPool(generator(), size=2, path=path).start()
+    with pool._condition:
+        pool._condition.wait_for(lambda: len(pool._ready) == 2)
+    ready = list(pool._ready)
+    pool.close()
+    assert len(path.read_text().splitlines()) == 2
+
+    # Not started, so only the stored scenarios can be handed out
+    stored = ScenarioPool(generator(), size=2, path=path)
+    assert [stored.take(), stored.take()] == ready
+    assert stored.disk_hits == 2 and not path.exists()
+
+def test_stored_scenarios_that_no_longer_validate_are_skipped(tmp_path):
+    path = tmp_path / "scenario_pool.jsonl"
+    scenario = generator()()
+    path.write_text('{"location_and_story_description": 1}\n' + scenario.model_dump_json() + "\n")
+    pool = ScenarioPool(generator(), size=2, path=path)
+    assert pool.take() == scenario
+    assert (pool.failed, pool.disk_hits) == (1, 1)
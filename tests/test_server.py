@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import src.async_game as async_game
+from src.instrumentation import InstrumentedClient
+from src.journal import list_games, load_game
+from src.llm import AsyncAdapter, FakeBackend
+from src.response_cache import ResponseCache
+from src.server import SessionManager, TokenBucket
+
+@pytest.fixture
+def fake_client(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ADVENTURE_SEED", "0")
+    monkeypatch.setattr(async_game, "client", InstrumentedClient(AsyncAdapter(FakeBackend())))
+    monkeypatch.setattr(async_game, "response_cache", ResponseCache())
+
+async def play(manager: SessionManager, commands: list[str]) -> list[str]:
+    # Connects one player and answers every `ask` with the next command, the last one repeated
+    server = await manager.serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    received = []
+    while line := (await reader.readline()).decode().rstrip("\n"):
+        received.append(line)
+        if line == "ask":
+            writer.write((commands.pop(0) if len(commands) > 1 else commands[0]).encode() + b"\n")
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    return received
+
+def test_the_bucket_allows_a_burst_then_refills(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("src.server.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+    now[0] = 1.0
+    assert bucket.take() and not bucket.take()
+
+def test_a_game_is_played_over_a_connection(fake_client):
+    manager = SessionManager(commands_per_second=None)
+    received = asyncio.run(play(manager, ["attack"]))
+    assert received[-1] in ("bye win", "bye loss")
+    assert any(line.startswith("say ") for line in received)
+    assert (manager.sessions_started, manager.sessions_finished, manager.sessions) == (1, 1, {})
+    assert manager.turns_played > 0
+
+def test_games_played_on_the_server_are_saved(fake_client, tmp_path):
+    received = asyncio.run(play(SessionManager(commands_per_second=None), ["attack"]))
+    (saved,) = list_games(tmp_path / "saves")
+    assert saved.result == received[-1].removeprefix("bye ")
+
+def test_a_game_left_early_can_be_resumed(fake_client, tmp_path):
+    asyncio.run(play(SessionManager(commands_per_second=None), ["quit"]))
+    (saved,) = list_games(tmp_path / "saves")
+    assert saved.result is None
+    assert load_game(saved.path).turn_order
+
+def test_quit_ends_the_session(fake_client):
+    assert asyncio.run(play(SessionManager(commands_per_second=None), ["quit"]))[-1] == "bye quit"
+
+def test_sessions_over_the_limit_are_turned_away(fake_client):
+    assert asyncio.run(play(SessionManager(max_sessions=0), ["attack"])) == ["bye full"]
+
+def test_commands_over_the_rate_are_refused(fake_client):
+    received = asyncio.run(play(SessionManager(commands_per_second=0.001, command_burst=1), ["", "attack", "attack", "quit"]))
+    assert "err rate limited, wait before sending another command" in received
+    assert received[-1] == "bye quit"
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from src.entities import Action, ActionType, Scenario
+from src.simulator import MAX_TURNS, MONSTERS_WIN, PLAYERS_WIN, _attack_kind, simulate
+
+from tests.helpers import build_scenario
+
+def playout(scenario: Scenario, seed: int) -> int:
+    # One encounter through `Scenario.apply_action`, with the simulator's default tactics
+    game = scenario.model_copy(deep=True)
+    game.seed_dice(seed)
+    order = game.turn_order[game.current_turn:] + game.turn_order[:game.current_turn]
+    for step in range(MAX_TURNS):
+        entity = game._find_entity_by_id(order[step % len(order)])
+        if entity.health <= 0:
+            continue
+        foes = game.monsters if game.is_player_character(entity.entity_id) else game.player_characters
+        target = min((foe for foe in foes if foe.health > 0), key=lambda foe: foe.health)
+        game.apply_action(Action(
+            type=ActionType.ATTACK,
+            source_entity_id=entity.entity_id,
+            target_entity_id=target.entity_id,
+            action_kind=_attack_kind(entity),
+        ))
+        if game.all_monsters_defeated():
+            return PLAYERS_WIN
+        if game.all_player_characters_defeated():
+            return MONSTERS_WIN
+    return 0
+
+@pytest.mark.parametrize("players, monsters, monster_strength", [(1, 1, 14), (2, 2, 13)])
+def test_simulated_win_rate_matches_playouts(players, monsters, monster_strength):
+    scenario = build_scenario(players, monsters)
+    for monster in scenario.monsters:
+        monster.strength = monster_strength
+    scenario.mark_dirty()
+
+    playouts = 400
+    rng = random.Random(0)
+    wins = sum(playout(scenario, rng.randrange(2**32)) == PLAYERS_WIN for _ in range(playouts))
+    simulated = simulate(scenario, 20_000, seed=0).win_rate
+
+    # Four standard errors of the playouts' estimate
+    assert 0.05 < simulated < 0.95
+    assert abs(wins / playouts - simulated) < 4 * (simulated * (1 - simulated) / playouts) ** 0.5
+
+def test_a_seed_repeats_the_simulation():
+    scenario = build_scenario(2, 2)
+    first, again = simulate(scenario, 5_000, seed=3), simulate(scenario, 5_000, seed=3)
+    assert (first.player_wins, first.monster_wins) == (again.player_wins, again.monster_wins)
+    assert (first.turns == again.turns).all()
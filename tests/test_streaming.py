@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import main
+import src.async_game as async_game
+from src.entities import ActionPhase, Narration, ScenarioDescription
+from src.instrumentation import InstrumentedClient, Tracer
+from src.llm import AsyncAdapter
+from src.response_cache import ResponseCache
+from src.streaming import EmptyStream, render_stream, render_stream_async
+
+from tests.helpers import build_scenario
+
+class SilentStream:
+    # Streams nothing, answers normally without streaming
+    def __init__(self):
+        self.created = []
+
+    def create(self, response_model, messages, model=None, **kwargs):
+        self.created.append(response_model)
+        if response_model is ScenarioDescription:
+            return ScenarioDescription(story="A quiet cave.", possible_actions=["Attack"])
+        return "It worked."
+
+    def create_partial(self, response_model, messages, model=None, **kwargs):
+        return iter(())
+
+def test_render_stream_prints_the_growing_field(capsys):
+    partials = [Narration(text="The"), Narration(text="The orc"), Narration(text="The orc falls.")]
+    final = render_stream("test", partials, "text")
+    assert final.text == "The orc falls."
+    assert capsys.readouterr().out.startswith("The orc falls.")
+
+def test_empty_stream_raises():
+    with pytest.raises(EmptyStream):
+        render_stream("test", [], "text")
+
+    async def nothing():
+        return
+        yield
+
+    with pytest.raises(EmptyStream):
+        asyncio.run(render_stream_async("test", nothing(), "text"))
+
+def test_narration_falls_back_to_a_plain_call(monkeypatch, capsys):
+    backend = SilentStream()
+    monkeypatch.setattr(main, "client", InstrumentedClient(backend, tracer=Tracer()))
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    scenario = build_scenario()
+
+    assert main.stream_effectiveness_of_action(scenario, ActionPhase()) == "It worked."
+    assert main.stream_scenario(1, scenario).story == "A quiet cave."
+    assert backend.created == [str, ScenarioDescription]
+    output = capsys.readouterr().out
+    assert "It worked." in output and "A quiet cave." in output
+
+def test_async_narration_falls_back_to_a_plain_call(monkeypatch):
+    backend = SilentStream()
+    monkeypatch.setattr(async_game, "client", InstrumentedClient(AsyncAdapter(backend), tracer=Tracer()))
+    monkeypatch.setattr(async_game, "response_cache", ResponseCache())
+    scenario = build_scenario()
+
+    assert asyncio.run(async_game.stream_effectiveness_of_action(scenario, ActionPhase())) == "It worked."
+    assert asyncio.run(async_game.stream_scenario(1, scenario)).story == "A quiet cave."
+
+def test_streamed_calls_record_time_to_first_token():
+    tracer = Tracer()
+
+    class Streaming(SilentStream):
+        def create_partial(self, response_model, messages, model=None, **kwargs):
+            yield Narration(text="Hi")
+
+    client = InstrumentedClient(Streaming(), tracer=tracer)
+    list(client.create_partial(Narration, [{"role": "user", "content": "x"}]))
+    assert tracer.records[0].streamed
+    assert tracer.records[0].time_to_first_token is not None
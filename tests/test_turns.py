@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+import main
+from src.instrumentation import InstrumentedClient, Tracer
+from src.llm import FakeBackend
+from src.response_cache import ResponseCache
+from src.turns import TurnEngine, run_sync
+
+from tests.helpers import build_scenario
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(main, "client", InstrumentedClient(FakeBackend(), tracer=Tracer()))
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    monkeypatch.setattr(main, "STREAM_NARRATION", False)
+    return main.game_calls()
+
+def test_questions_leave_the_turn_with_the_player(calls):
+    scenario = build_scenario()
+    said = []
+    engine = TurnEngine(scenario, calls, lambda text, style: said.append(text))
+    assert run_sync(engine.advance()) == 1
+
+    assert not run_sync(engine.handle("Where is the orc?"))
+    assert scenario.action_history == [] and scenario.current_turn == 0
+
+    assert run_sync(engine.handle("attack Orc 0"))
+    assert scenario.action_history[0].startswith("Hero 0 attacks Orc 0")
+    assert scenario.current_turn == 1
+    run_sync(engine.advance())
+    assert any("Orc 0's turn" in text for text in said)
+
+def test_a_console_game_is_played_to_the_end(calls):
+    scenario = build_scenario(monsters=2)
+    engine = TurnEngine(scenario, calls, lambda text, style: None)
+    assert run_sync(engine.play(lambda prompt: "attack")) in ("win", "loss")
+    assert engine.turns_played > 0 and scenario.action_history
+
+def test_quitting_ends_the_game(calls):
+    engine = TurnEngine(build_scenario(), calls, lambda text, style: None)
+    assert run_sync(engine.play(lambda prompt: "quit")) == "quit"
+    assert engine.finished and engine.turns_played == 0
+
+def test_run_sync_refuses_calls_that_suspend():
+    with pytest.raises(RuntimeError):
+        run_sync(asyncio.sleep(0.01))